@@ -7,6 +7,8 @@ export interface CompressedPLYData {
   vertexCount: number
 }
 
+// Loads gzipped ASCII PLY files only. Binary outputs of tools/shrink_engine.py,
+// including quantized and byte-filtered ones, are loaded by gzipPLYLoader.ts
 export const loadCompressedPLY = async (url: string): Promise<CompressedPLYData> => {
   const response = await fetch(url)
   const compressedData = await response.arrayBuffer()
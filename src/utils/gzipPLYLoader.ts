@@ -1,6 +1,8 @@
 import pako from 'pako'
 import { PLYLoader } from 'three-stdlib'
 import * as THREE from 'three'
+import { dequantizeArrays, parseQuantization, readPLYHeaderText } from './plyQuantization'
+import { parseByteFilter, unfilterPLY } from './plyFilter'
 
 export class GzipPLYLoader extends THREE.Loader {
   private plyLoader: PLYLoader
@@ -68,7 +70,31 @@ export class GzipPLYLoader extends THREE.Loader {
       plyData = data
     }
 
+    // Byte-filtered outputs store each block of vertices as byte planes; restore the records
+    const headerText = readPLYHeaderText(new Uint8Array(plyData))
+    const byteFilter = parseByteFilter(headerText)
+    if (byteFilter) {
+      plyData = unfilterPLY(new Uint8Array(plyData), headerText, byteFilter).buffer as ArrayBuffer
+    }
+
     // Parse the PLY data using the standard PLY loader
-    return this.plyLoader.parse(plyData)
+    const geometry = this.plyLoader.parse(plyData)
+
+    // Quantized outputs store integer positions; map them back into the bounding box
+    const quantization = parseQuantization(headerText)
+    if (quantization) {
+      const normalAttribute = geometry.attributes.normal
+      dequantizeArrays(
+        quantization,
+        geometry.attributes.position.array as Float32Array,
+        normalAttribute ? (normalAttribute.array as Float32Array) : null
+      )
+      geometry.attributes.position.needsUpdate = true
+      if (normalAttribute) normalAttribute.needsUpdate = true
+      geometry.computeBoundingBox()
+      geometry.computeBoundingSphere()
+    }
+
+    return geometry
   }
 }
\ No newline at end of file
@@ -0,0 +1,110 @@
+// Undoes the byte shuffle filter of PLY outputs written by tools/shrink_engine.py
+// with --filter. The vertex block is stored as byte planes of fixed-size blocks
+// of records, optionally with delta-encoded positions, described by a header
+// comment:
+//   comment filter shuffle <block rows> [delta <field> ...]
+
+export interface PLYByteFilter {
+  blockRows: number
+  deltaFields: string[]
+}
+
+interface VertexLayout {
+  recordSize: number
+  littleEndian: boolean
+  fields: Map<string, { offset: number; size: number }>
+}
+
+const PLY_TYPE_SIZES: Record<string, number> = {
+  char: 1, int8: 1, uchar: 1, uint8: 1,
+  short: 2, int16: 2, ushort: 2, uint16: 2,
+  int: 4, int32: 4, uint: 4, uint32: 4, float: 4, float32: 4,
+  double: 8, float64: 8
+}
+
+export const parseByteFilter = (headerText: string): PLYByteFilter | null => {
+  for (const rawLine of headerText.split('\n')) {
+    const parts = rawLine.trim().split(/\s+/)
+    if (parts[0] === 'comment' && parts[1] === 'filter' && parts[2] === 'shuffle') {
+      return {
+        blockRows: parseInt(parts[3]),
+        deltaFields: parts[4] === 'delta' ? parts.slice(5) : []
+      }
+    }
+  }
+  return null
+}
+
+const parseVertexLayout = (headerText: string): VertexLayout => {
+  const layout: VertexLayout = { recordSize: 0, littleEndian: true, fields: new Map() }
+  let inVertex = false
+
+  for (const rawLine of headerText.split('\n')) {
+    const parts = rawLine.trim().split(/\s+/)
+    if (parts[0] === 'format') {
+      layout.littleEndian = parts[1] !== 'binary_big_endian'
+    } else if (parts[0] === 'element') {
+      inVertex = parts[1] === 'vertex'
+    } else if (parts[0] === 'property' && inVertex) {
+      const size = PLY_TYPE_SIZES[parts[1]]
+      if (!size) throw new Error(`Unsupported filtered PLY property: ${rawLine.trim()}`)
+      layout.fields.set(parts[2], { offset: layout.recordSize, size })
+      layout.recordSize += size
+    }
+  }
+
+  return layout
+}
+
+// Return a copy of a PLY buffer with its vertex records restored, transposing
+// each block back and summing the deltas in a single pass per block
+export const unfilterPLY = (data: Uint8Array, headerText: string, filter: PLYByteFilter): Uint8Array => {
+  const headerEnd = new TextDecoder().decode(data.subarray(0, Math.min(data.length, 64 * 1024)))
+    .indexOf('end_header\n') + 'end_header\n'.length
+  const layout = parseVertexLayout(headerText)
+  const recordSize = layout.recordSize
+  const output = new Uint8Array(data.length)
+  output.set(data.subarray(0, headerEnd))
+
+  const view = new DataView(output.buffer, output.byteOffset, output.byteLength)
+  const deltaFields = filter.deltaFields
+    .map((name) => layout.fields.get(name))
+    .filter((field): field is { offset: number; size: number } => field !== undefined)
+  const vertexBytes = Math.floor((data.length - headerEnd) / recordSize) * recordSize
+  const blockBytes = filter.blockRows * recordSize
+
+  for (let blockStart = 0; blockStart < vertexBytes; blockStart += blockBytes) {
+    const rows = Math.min(filter.blockRows, (vertexBytes - blockStart) / recordSize)
+    const source = headerEnd + blockStart
+    for (let row = 0; row < rows; row++) {
+      const target = headerEnd + blockStart + row * recordSize
+      for (let b = 0; b < recordSize; b++) {
+        output[target + b] = data[source + b * rows + row]
+      }
+      if (row === 0) continue
+
+      // Positions were stored as wrapping differences from the previous vertex
+      const previous = target - recordSize
+      for (const field of deltaFields) {
+        const at = target + field.offset
+        const from = previous + field.offset
+        if (field.size === 4) {
+          view.setUint32(at, view.getUint32(at, layout.littleEndian) + view.getUint32(from, layout.littleEndian),
+            layout.littleEndian)
+        } else if (field.size === 2) {
+          view.setUint16(at, view.getUint16(at, layout.littleEndian) + view.getUint16(from, layout.littleEndian),
+            layout.littleEndian)
+        } else if (field.size === 1) {
+          output[at] = output[at] + output[from]
+        } else {
+          view.setBigUint64(at, view.getBigUint64(at, layout.littleEndian) +
+            view.getBigUint64(from, layout.littleEndian), layout.littleEndian)
+        }
+      }
+    }
+  }
+
+  // Trailing bytes of a truncated record are copied as they are
+  output.set(data.subarray(headerEnd + vertexBytes), headerEnd + vertexBytes)
+  return output
+}
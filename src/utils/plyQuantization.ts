@@ -0,0 +1,63 @@
+// Dequantization of compact PLY outputs written by tools/shrink_engine.py with
+// quantized positions. The parameters are stored as header comments:
+//   comment quantized position <bits> <offset x y z> <scale x y z>
+//   comment quantized normal snorm8
+
+export interface PLYQuantization {
+  positionOffset: [number, number, number] | null
+  positionScale: [number, number, number] | null
+  normalScale: number | null
+}
+
+const NORMAL_SNORM8_SCALE = 1 / 127
+
+// Read the header text of a binary PLY buffer (everything up to end_header)
+export const readPLYHeaderText = (data: Uint8Array): string => {
+  const limit = Math.min(data.length, 64 * 1024)
+  const text = new TextDecoder().decode(data.subarray(0, limit))
+  const end = text.indexOf('end_header')
+  return end >= 0 ? text.slice(0, end) : ''
+}
+
+export const parseQuantization = (headerText: string): PLYQuantization | null => {
+  const quantization: PLYQuantization = { positionOffset: null, positionScale: null, normalScale: null }
+
+  for (const rawLine of headerText.split('\n')) {
+    const parts = rawLine.trim().split(/\s+/)
+    if (parts[0] !== 'comment' || parts[1] !== 'quantized') continue
+
+    if (parts[2] === 'position' && parts.length >= 10) {
+      const values = parts.slice(4, 10).map(Number)
+      quantization.positionOffset = [values[0], values[1], values[2]]
+      quantization.positionScale = [values[3], values[4], values[5]]
+    } else if (parts[2] === 'normal' && parts[3] === 'snorm8') {
+      quantization.normalScale = NORMAL_SNORM8_SCALE
+    }
+  }
+
+  return quantization.positionScale || quantization.normalScale ? quantization : null
+}
+
+// Rebuild float positions and normals in place, in a single pass per array
+export const dequantizeArrays = (
+  quantization: PLYQuantization,
+  positions: Float32Array,
+  normals: Float32Array | null
+) => {
+  const offset = quantization.positionOffset
+  const scale = quantization.positionScale
+  if (offset && scale) {
+    for (let i = 0; i < positions.length; i += 3) {
+      positions[i] = positions[i] * scale[0] + offset[0]
+      positions[i + 1] = positions[i + 1] * scale[1] + offset[1]
+      positions[i + 2] = positions[i + 2] * scale[2] + offset[2]
+    }
+  }
+
+  const normalScale = quantization.normalScale
+  if (normals && normalScale) {
+    for (let i = 0; i < normals.length; i++) {
+      normals[i] *= normalScale
+    }
+  }
+}
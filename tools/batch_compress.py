@@ -7,124 +7,594 @@ at different quality levels (ultra_low, low, medium, high) with gzip compression
 
 import os
 import sys
-import gzip
+import hashlib
 import shutil
+import argparse
+import contextlib
+import csv
+import json
+import time
+import cProfile
+import tempfile
+import tracemalloc
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 # Add the current directory to Python path to import plyshrinker
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import the PLYShrinker class (we'll extract the core functionality)
-import struct
+# Import the shared shrink engine used by the PLYShrinker GUI
+from shrink_engine import (shrink_ply_file_multi, write_progressive_ply, SAMPLING_MODES, SHARED_STAGES,
+                           ENGINE_VERSION)
+from parallel_gzip import ParallelGzipWriter
+from build_cache import BuildManifest, MANIFEST_NAME
+from instrument import StageTimer, reset_peak_rss, peak_rss_mb
+from size_estimate import fit_resolution
+from plyio import read_ply_header
+from draco_encode import draco_available, parse_draco_levels, encode_point_cloud, PointCloudCollector
+from byte_filter import FILTER_MODES
+from cleaning import (outlier_removal_available, format_removed, DEFAULT_OUTLIER_NEIGHBORS,
+                      DEFAULT_OUTLIER_STD_RATIO)
+from path_sampling import path_sampling_available, DEFAULT_PATH_FALLOFF
+from scene_config import load_model_transforms, load_path_points, DEFAULT_MODELS_CONFIG, DEFAULT_PATH_CONFIG
 
-def shrink_ply_file(input_path, output_path, resolution):
+# Project root, against which the default viewer configs are resolved
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Shrink options that affect only how an output is built, not its content
+RUNTIME_OPTIONS = ('chunk_size',)
+
+# Shrink options that apply to the Draco outputs; Draco quantizes, orders
+# and selects the attributes of the points itself
+DRACO_OPTIONS = ('chunk_size', 'sampling', 'voxel_centroid', 'remove_duplicates', 'remove_outliers',
+                 'outlier_neighbors', 'path_points', 'path_transform', 'path_falloff')
+
+# Quality levels and their resolutions
+QUALITY_LEVELS = {
+    'ultra_low': 0.1,   # 10% of points
+    'low': 0.25,        # 25% of points
+    'medium': 0.5,      # 50% of points
+    'high': 1.0         # 100% of points (original)
+}
+
+def compress_with_gzip(input_path, output_path, threads=None):
     """
-    Shrink a PLY file based on the resolution factor.
-    This is extracted from the PLYShrinker class.
+    Compress a file with gzip, using a thread pool for the deflate blocks.
     """
-    with open(input_path, 'rb') as input_f:
-        # Read and parse header
-        header_lines = []
-        
-        line = input_f.readline().decode('ascii').strip()
-        header_lines.append(line)
-        
-        if line != 'ply':
-            raise ValueError(f"Not a valid PLY file: {input_path}")
-        
-        vertex_count = 0
-        properties = []
-        is_binary = False
-        
-        while True:
-            line = input_f.readline().decode('ascii').strip()
-            header_lines.append(line)
-            
-            if line.startswith('format'):
-                if 'binary' in line:
-                    is_binary = True
-            elif line.startswith('element vertex'):
-                vertex_count = int(line.split()[-1])
-                # Calculate new vertex count based on resolution
-                sample_step = max(1, int(1 / resolution))
-                new_vertex_count = vertex_count // sample_step
-                # Update the header line with new count
-                header_lines[-1] = f"element vertex {new_vertex_count}"
-            elif line.startswith('property'):
-                properties.append(line)
-            elif line == 'end_header':
-                break
-        
-        if not is_binary:
-            raise ValueError(f"Only binary PLY files are supported: {input_path}")
-        
-        # Calculate bytes per vertex based on properties
-        bytes_per_vertex = 0
-        for prop in properties:
-            parts = prop.split()
-            if parts[1] == 'float':
-                bytes_per_vertex += 4
-            elif parts[1] == 'uchar':
-                bytes_per_vertex += 1
-            elif parts[1] == 'int':
-                bytes_per_vertex += 4
-            elif parts[1] == 'uint':
-                bytes_per_vertex += 4
-        
-        # Calculate sample step and new vertex count
-        sample_step = max(1, int(1 / resolution))
-        sampled_count = vertex_count // sample_step
+    with open(input_path, 'rb') as f_in:
+        with ParallelGzipWriter(output_path, threads=threads) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+
+def get_file_size_mb(file_path):
+    """
+    Get file size in MB.
+    """
+    return os.path.getsize(file_path) / (1024 * 1024)
+
+def get_output_params(resolution, shrink_options):
+    """
+    Parameters that determine the content of an output, as recorded in the build manifest.
+    """
+    params = {'resolution': resolution}
+    params.update((name, value) for name, value in recorded_options(shrink_options).items()
+                  if name not in RUNTIME_OPTIONS)
+    return params
+
+def recorded_options(shrink_options):
+    """
+    Shrink options as recorded in the build manifest and the report, with the
+    path points, which can run to thousands of numbers, replaced by a digest.
+    """
+    if shrink_options.get('path_points') is None:
+        return shrink_options
+    digest = hashlib.sha1(json.dumps(shrink_options['path_points']).encode('ascii')).hexdigest()
+    return {**shrink_options, 'path_points': f"sha1:{digest}"}
+
+def file_shrink_options(shrink_options, ply_file, transforms):
+    """
+    Shrink options for one source file: with path sampling, the placement of
+    the model in the path's world space, looked up by file stem in the
+    transforms of the model config. Sources missing from the config are
+    sampled as if placed at the identity transform, like a merged scan.
+    """
+    if shrink_options.get('sampling') != 'path':
+        return shrink_options
+    matrix = transforms.get(Path(ply_file).stem)
+    if matrix is None:
+        print(f"Warning: {Path(ply_file).name} is not in the model config; sampling along the path "
+              f"without a placement transform")
+    return {**shrink_options, 'path_transform': None if matrix is None else matrix.tolist()}
+
+def parse_budgets(text):
+    """
+    Parse a budget list such as "ultra_low=2,low=5" (sizes in MB) into a
+    dict of output names and their budgets in bytes.
+    """
+    budgets = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition('=')
+        try:
+            size_mb = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid budget: {item}")
+        if not name.strip() or size_mb <= 0:
+            raise argparse.ArgumentTypeError(f"invalid budget: {item}")
+        budgets[name.strip()] = int(size_mb * 1024 * 1024)
+    if not budgets:
+        raise argparse.ArgumentTypeError("no budgets given")
+    return budgets
+
+def fit_budgets(ply_file, budgets, shrink_options=None, compress=True):
+    """
+    Find the resolution that fits each output budget, searching on quick
+    size estimates rather than full builds. Returns (resolution, estimate)
+    per output name.
+    """
+    return {quality: fit_resolution(str(ply_file), budget, compress, **(shrink_options or {}))
+            for quality, budget in budgets.items()}
+
+def print_budget_fits(budgets, fits, compress=True):
+    """
+    Print the resolution and estimated size fitted to each budget.
+    """
+    size_key = 'gzip_bytes' if compress else 'raw_bytes'
+    for quality, (resolution, estimate) in fits.items():
+        print(f"  {quality}: {budgets[quality] / (1024 * 1024):.1f} MB budget → {resolution * 100:.2f}% of points "
+              f"(~{estimate[size_key] / (1024 * 1024):.2f} MB)")
+
+def process_quality_levels(ply_file, levels, compressed_dir, shrink_options=None, gzip_threads=None,
+                           up_to_date=(), compress=True):
+    """
+    Create compressed quality levels of a PLY file.
+    levels maps quality names to resolutions; all levels that still need to be
+    built are sampled from a single read of the source and streamed straight
+    into their gzip writers, without intermediate uncompressed files. With
+    compress=False the levels are written as plain .ply files instead.
+    shrink_options are passed through to shrink_ply_file_multi. Levels named in
+    up_to_date are skipped if their output exists.
+    Returns a (status, message) pair per level where status is 'processed',
+    'skipped' or 'error', and a dict of metrics: wall and CPU time, peak memory
+    and the stages shared by all levels, plus per-level stages and byte counts.
+    """
+    base_name = ply_file.stem  # filename without extension
+    extension = '.ply.gz' if compress else '.ply'
+    original_size = get_file_size_mb(ply_file)
+    results = {}
+    
+    reset_peak_rss()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    shared_stages = {}
+    level_metrics = {}
+    
+    # Partial outputs of the levels that still need to be built; each one is
+    # moved into place once its gzip stream is complete
+    partial_files = {}
+    for quality, resolution in levels.items():
+        # Check if compressed file is already up to date
+        final_compressed = compressed_dir / f"{base_name}_{quality}{extension}"
         
-        # Write output file
-        with open(output_path, 'wb') as output_f:
-            # Write header
-            for line in header_lines:
-                output_f.write((line + '\n').encode('ascii'))
-            
-            # Read all vertex data into memory
-            vertex_data = input_f.read()
+        if quality in up_to_date and final_compressed.exists():
+            compressed_size = get_file_size_mb(final_compressed)
+            results[quality] = ('skipped', f"  {quality} quality ({int(resolution*100)}%) is up to date ({compressed_size:.1f} MB) - SKIPPED")
+        else:
+            partial_files[quality] = compressed_dir / f"{base_name}_{quality}{extension}.part"
+    
+    if partial_files:
+        try:
+            with contextlib.ExitStack() as stack:
+                writers = {quality: stack.enter_context(ParallelGzipWriter(partial, threads=gzip_threads)
+                                                        if compress else open(partial, 'wb'))
+                           for quality, partial in partial_files.items()}
+                
+                # Shrink the PLY file into every pending compressor at once
+                stats = shrink_ply_file_multi(str(ply_file),
+                                              {writers[q]: levels[q] for q in partial_files},
+                                              **(shrink_options or {}))
+                
+                # Finish each gzip stream, timing the blocks still being compressed
+                close_seconds = {}
+                for quality, writer in writers.items():
+                    close_start = time.perf_counter()
+                    writer.close()
+                    close_seconds[quality] = time.perf_counter() - close_start
             
-            # Process vertex data with same logic as JavaScript
-            for i in range(sampled_count):
-                source_index = i * sample_step
-                start_pos = source_index * bytes_per_vertex
-                end_pos = start_pos + bytes_per_vertex
+            for quality, partial in partial_files.items():
+                final_compressed = partial.with_suffix('')
+                writer = writers[quality]
+                engine_stages = stats[writer]['stages']
+                shared_stages = {name: engine_stages[name] for name in SHARED_STAGES if name in engine_stages}
                 
-                if start_pos < len(vertex_data) and end_pos <= len(vertex_data):
-                    # Write the sampled vertex data
-                    output_f.write(vertex_data[start_pos:end_pos])
+                # Time spent blocked on the compression threads counts as compress, not write
+                timer = StageTimer()
+                for name, stage in engine_stages.items():
+                    if name not in SHARED_STAGES:
+                        timer.add(name, **stage)
+                if compress:
+                    timer.add('write', close_seconds[quality] - writer.wait_seconds)
+                    timer.add('compress', writer.wait_seconds, writer.compress_seconds, writer.bytes_in, writer.bytes_out)
+                else:
+                    timer.add('write', close_seconds[quality])
+                with timer.stage('cleanup'):
+                    partial.replace(final_compressed)
+                bytes_out = writer.bytes_out if compress else stats[writer]['bytes_written']
+                level_metrics[quality] = {'bytes_in': stats[writer]['bytes_read'], 'bytes_out': bytes_out,
+                                          'stages': timer.stages, 'removed': stats[writer]['removed']}
+                
+                # Get shrunk and final compressed sizes
+                shrunk_size = stats[writers[quality]]['bytes_written'] / (1024 * 1024)
+                compressed_size = get_file_size_mb(final_compressed)
+                
+                # Calculate compression ratio
+                compression_ratio = (1 - compressed_size / original_size) * 100
+                
+                mb_per_s = stats[writers[quality]]['mb_per_s']
+                removed = format_removed(stats[writer]['removed'])
+                results[quality] = ('processed', f"  Creating {quality} quality ({int(levels[quality]*100)}%)... "
+                                                 f"{shrunk_size:.1f} MB → {compressed_size:.1f} MB "
+                                                 f"({compression_ratio:.1f}% reduction, {mb_per_s:.1f} MB/s"
+                                                 f"{', ' + removed if removed else ''})")
+            
+        except Exception as e:
+            for quality, partial in partial_files.items():
+                # Clean up partial output if it exists
+                if partial.exists():
+                    partial.unlink()
+                results[quality] = ('error', f"  Creating {quality} quality ({int(levels[quality]*100)}%)... ERROR: {str(e)}")
+    
+    metrics = {
+        'seconds': time.perf_counter() - wall_start,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': shared_stages,
+        'levels': level_metrics,
+    }
+    return [results[quality] for quality in levels], metrics
 
-def compress_with_gzip(input_path, output_path):
+def get_draco_params(resolution, settings, shrink_options):
     """
-    Compress a file with gzip.
+    Parameters that determine the content of a Draco output, as recorded in the build manifest.
     """
-    with open(input_path, 'rb') as f_in:
-        with gzip.open(output_path, 'wb') as f_out:
-            shutil.copyfileobj(f_in, f_out)
+    params = {'resolution': resolution, 'quantization_bits': settings[0], 'compression_level': settings[1]}
+    params.update((name, value) for name, value in recorded_options(shrink_options).items()
+                  if name in DRACO_OPTIONS and name not in RUNTIME_OPTIONS)
+    return params
 
-def get_file_size_mb(file_path):
+def process_draco(ply_file, levels, draco_dir, shrink_options=None, up_to_date=(), gzip_threads=None):
     """
-    Get file size in MB.
+    Encode Draco copies of quality levels of a PLY file for the viewer's
+    ProgressiveDracoLoader. levels maps quality names to (resolution,
+    quantization_bits, compression_level). The levels are sampled like the
+    .ply.gz outputs, from a single read of the source, straight into arrays
+    of the attributes Draco encodes. For comparison, every sampled level is
+    also streamed through the parallel gzip writer into a sink that only
+    counts the compressed bytes. Levels named in up_to_date are skipped if
+    their output exists.
+    Returns a (status, message) pair per level and a dict of metrics per
+    level that was encoded.
     """
-    return os.path.getsize(file_path) / (1024 * 1024)
+    results = {}
+    metrics = {}
+    collectors = {}
+    for quality, (resolution, bits, level) in levels.items():
+        output_path = draco_dir / f"{ply_file.stem}_{quality}.drc"
+        if quality in up_to_date and output_path.exists():
+            results[quality] = ('skipped', f"  {output_path.name} is up to date "
+                                           f"({get_file_size_mb(output_path):.1f} MB) - SKIPPED")
+    
+    pending = [quality for quality in levels if quality not in results]
+    if pending:
+        try:
+            dtype = read_ply_header(str(ply_file)).vertex_dtype()
+            with contextlib.ExitStack() as stack:
+                for quality in pending:
+                    gzip_f = stack.enter_context(ParallelGzipWriter(os.devnull, threads=gzip_threads))
+                    collectors[quality] = PointCloudCollector(dtype, tee=gzip_f)
+                options = {name: value for name, value in (shrink_options or {}).items() if name in DRACO_OPTIONS}
+                shrink_ply_file_multi(str(ply_file), {collectors[q]: levels[q][0] for q in pending}, **options)
+        except Exception as e:
+            for quality in pending:
+                results[quality] = ('error', f"  Creating {ply_file.stem}_{quality}.drc... ERROR: {str(e)}")
+            collectors = {}
+    
+    for quality, collector in collectors.items():
+        resolution, bits, level = levels[quality]
+        output_path = draco_dir / f"{ply_file.stem}_{quality}.drc"
+        partial = output_path.with_name(output_path.name + '.part')
+        try:
+            vertices = collector.vertices()
+            draco_bytes, draco_seconds = encode_point_cloud(vertices, bits, level)
+            with open(partial, 'wb') as f:
+                f.write(draco_bytes)
+            partial.replace(output_path)
+        except Exception as e:
+            if partial.exists():
+                partial.unlink()
+            results[quality] = ('error', f"  Creating {output_path.name}... ERROR: {str(e)}")
+            continue
+        
+        # The same sampled PLY through the gzip writer, for comparison
+        gzip_size = collector.tee.bytes_out
+        gzip_seconds = collector.tee.compress_seconds
+        metrics[quality] = {'points': len(vertices), 'ply_bytes': collector.bytes_in, 'quantization_bits': bits,
+                            'compression_level': level, 'draco_bytes': len(draco_bytes),
+                            'draco_cpu_seconds': draco_seconds, 'gzip_bytes': gzip_size,
+                            'gzip_cpu_seconds': gzip_seconds}
+        results[quality] = ('processed', f"  Creating {output_path.name} ({int(resolution*100)}%, {bits}-bit, "
+                                         f"level {level})... {len(draco_bytes) / (1024 * 1024):.2f} MB in "
+                                         f"{draco_seconds:.2f} s vs gzip {gzip_size / (1024 * 1024):.2f} MB in "
+                                         f"{gzip_seconds:.2f} s ({len(draco_bytes) / gzip_size * 100:.0f}% of gzip)")
+    
+    return [results[quality] for quality in levels], metrics
 
-def main():
+def process_progressive(ply_file, levels, compressed_dir, up_to_date=False):
+    """
+    Write the progressive (prefix-ordered) copy of a PLY file and its LOD index.
+    The copy is stored uncompressed so clients can fetch any level's prefix
+    with a single HTTP range request. Returns a (status, message) pair.
+    """
+    output_path = compressed_dir / f"{ply_file.stem}_progressive.ply"
+    index_path = compressed_dir / f"{ply_file.stem}_progressive.lod.json"
+    
+    if up_to_date and output_path.exists() and index_path.exists():
+        return ('skipped', f"  {output_path.name} is up to date ({get_file_size_mb(output_path):.1f} MB) - SKIPPED")
+    
+    partial_output = output_path.with_name(output_path.name + '.part')
+    partial_index = index_path.with_name(index_path.name + '.part')
+    try:
+        index = write_progressive_ply(str(ply_file), str(partial_output), levels, str(partial_index))
+        partial_output.replace(output_path)
+        partial_index.replace(index_path)
+    except Exception as e:
+        for partial in (partial_output, partial_index):
+            if partial.exists():
+                partial.unlink()
+        return ('error', f"  Creating {output_path.name}... ERROR: {str(e)}")
+    
+    offsets = ', '.join(f"{quality} {level['byte_offset'] / (1024 * 1024):.1f} MB"
+                        for quality, level in index['levels'].items())
+    return ('processed', f"  Creating {output_path.name}... {get_file_size_mb(output_path):.1f} MB "
+                         f"(prefixes: {offsets})")
+
+def add_task_metrics(file_report, levels, results, metrics):
+    """
+    Fold the metrics of one process_quality_levels task into a file's report entry.
+    """
+    file_report['seconds'] += metrics['seconds']
+    file_report['cpu_seconds'] += metrics['cpu_seconds']
+    file_report['peak_rss_mb'] = max(file_report['peak_rss_mb'], metrics['peak_rss_mb'])
+    for name, stage in metrics['stages'].items():
+        file_report['stages'].add(name, **stage)
+    
+    for (quality, resolution), (status, _) in zip(levels.items(), results):
+        level = metrics['levels'].get(quality, {'bytes_in': 0, 'bytes_out': 0, 'stages': {}})
+        for name, stage in level['stages'].items():
+            file_report['stages'].add(name, **stage)
+        # Levels built in the same task share its peak memory
+        file_report['levels'][quality] = {'status': status, 'resolution': resolution,
+                                          'peak_rss_mb': metrics['peak_rss_mb'], **level}
+
+def write_report(report_path, report):
+    """
+    Write the run report as JSON, or as one CSV row per (file, level, stage)
+    if report_path ends in .csv. File-level rows leave the level empty.
+    """
+    if Path(report_path).suffix.lower() != '.csv':
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        return
+    
+    columns = ['file', 'quality', 'stage', 'seconds', 'cpu_seconds', 'bytes_in', 'bytes_out', 'peak_rss_mb']
+    with open(report_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for name, stage in report['stages'].items():
+            writer.writerow(['', '', name, stage['seconds'], stage['cpu_seconds'], stage['bytes_in'], stage['bytes_out'], ''])
+        for file_report in report['files']:
+            writer.writerow([file_report['file'], '', 'total', file_report['seconds'], file_report['cpu_seconds'],
+                             file_report['bytes'], '', file_report['peak_rss_mb']])
+            for name, stage in file_report['stages'].items():
+                writer.writerow([file_report['file'], '', name, stage['seconds'], stage['cpu_seconds'],
+                                 stage['bytes_in'], stage['bytes_out'], ''])
+            for quality, level in file_report['levels'].items():
+                for name, stage in level['stages'].items():
+                    writer.writerow([file_report['file'], quality, name, stage['seconds'], stage['cpu_seconds'],
+                                     stage['bytes_in'], stage['bytes_out'], level['peak_rss_mb']])
+
+def profile_file(ply_file, levels, shrink_options, gzip_threads, output_dir):
+    """
+    Rebuild every level of one file in this process under cProfile and
+    tracemalloc, into a scratch directory. Writes <stem>.prof and
+    <stem>.tracemalloc to output_dir and returns their paths and the peak
+    traced memory in bytes. cProfile only sees the main thread, so gzip
+    compression shows up as time spent waiting on its threads.
+    """
+    profiler = cProfile.Profile()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tracemalloc.start()
+        profiler.enable()
+        try:
+            process_quality_levels(ply_file, levels, Path(temp_dir), shrink_options, gzip_threads)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            peak_traced = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    
+    profile_path = Path(output_dir) / f"{ply_file.stem}.prof"
+    snapshot_path = Path(output_dir) / f"{ply_file.stem}.tracemalloc"
+    profiler.dump_stats(str(profile_path))
+    snapshot.dump(str(snapshot_path))
+    return profile_path, snapshot_path, peak_traced
+
+def run_in_order(func, tasks, jobs=1):
+    """
+    Run func(*task) for every task and yield the results in task order.
+    With jobs other than 1 the tasks run on a process pool (0 = one worker per core),
+    scheduled largest input file first so big scans don't end up as stragglers.
+    """
+    if jobs == 1:
+        for task in tasks:
+            yield func(*task)
+        return
+    
+    with ProcessPoolExecutor(max_workers=jobs or None) as executor:
+        order = sorted(range(len(tasks)), key=lambda i: tasks[i][0].stat().st_size, reverse=True)
+        futures = {i: executor.submit(func, *tasks[i]) for i in order}
+        for i in range(len(tasks)):
+            yield futures[i].result()
+
+def add_shrink_arguments(parser):
+    """
+    Add the options that control how each output is shrunk to an argument parser.
+    """
+    parser.add_argument('--chunk-size', type=int, default=0, metavar='MB',
+                        help="stream the vertex data in chunks of this many MB to bound memory use "
+                             "(default: map the whole vertex block)")
+    parser.add_argument('--sampling', choices=SAMPLING_MODES, default='stride',
+                        help="'stride' keeps every k-th vertex; 'voxel' keeps one vertex per occupied "
+                             "voxel, sized to hit each level's point count; 'path' keeps each level's point "
+                             "count, favouring points near the visitor walking path (default: stride)")
+    parser.add_argument('--voxel-centroid', action='store_true',
+                        help="with --sampling voxel, write each cell's centroid and average colour")
+    parser.add_argument('--morton-order', action='store_true',
+                        help="write the kept vertices sorted along a Z-order curve; spatial "
+                             "neighbours end up adjacent, which makes the .ply.gz outputs smaller")
+    parser.add_argument('--quantize', type=int, default=0, metavar='BITS',
+                        help="store positions as BITS-bit integers inside the model's bounding box and "
+                             "unit normals as bytes; the loaders dequantize them (e.g. 16; default: off)")
+    parser.add_argument('--keep', metavar='FIELDS',
+                        help="comma-separated vertex properties to write, e.g. x,y,z,red,green,blue "
+                             "(default: all)")
+    parser.add_argument('--filter', choices=FILTER_MODES, dest='byte_filter',
+                        help="store the vertex data as byte planes ('shuffle') or also delta-encode the "
+                             "positions ('delta') so it compresses better; the loaders undo it "
+                             "(default: off)")
+    parser.add_argument('--remove-duplicates', type=float, nargs='?', const=0.0, metavar='SIZE',
+                        help="drop points that repeat an earlier point's position, or share its cell of a "
+                             "SIZE grid, before sampling (without SIZE: exact duplicates only)")
+    parser.add_argument('--remove-outliers', type=float, nargs='?', const=DEFAULT_OUTLIER_STD_RATIO,
+                        metavar='STD',
+                        help="drop points whose mean distance to their nearest neighbours is more than STD "
+                             f"standard deviations above average (without STD: {DEFAULT_OUTLIER_STD_RATIO:g}); "
+                             "needs scipy and about 50 bytes of memory per point plus a few hundred MB")
+    parser.add_argument('--outlier-neighbors', type=int, default=DEFAULT_OUTLIER_NEIGHBORS, metavar='K',
+                        help=f"neighbours used by --remove-outliers (default: {DEFAULT_OUTLIER_NEIGHBORS})")
+    parser.add_argument('--path', metavar='FILE',
+                        help="with --sampling path, the viewer path config holding the walking route "
+                             f"(default: {DEFAULT_PATH_CONFIG})")
+    parser.add_argument('--path-falloff', type=float, default=DEFAULT_PATH_FALLOFF, metavar='M',
+                        help="with --sampling path, the distance from the path at which point density "
+                             f"halves (default: {DEFAULT_PATH_FALLOFF:g})")
+    parser.add_argument('--models-config', metavar='FILE',
+                        help="with --sampling path, the viewer model config placing each model in the "
+                             f"path's world space (default: {DEFAULT_MODELS_CONFIG})")
+
+def get_shrink_options(args):
+    """
+    Keyword arguments for shrink_ply_file_multi from the parsed shrink options.
+    """
+    options = {
+        'chunk_size': args.chunk_size * 1024 * 1024 if args.chunk_size > 0 else None,
+        'sampling': args.sampling,
+        'voxel_centroid': args.voxel_centroid,
+        'morton_order': args.morton_order,
+        'quantize_bits': args.quantize or None,
+        'keep': [name.strip() for name in args.keep.split(',') if name.strip()] if args.keep else None,
+        'byte_filter': args.byte_filter,
+        'remove_duplicates': args.remove_duplicates,
+        'remove_outliers': args.remove_outliers,
+        'outlier_neighbors': args.outlier_neighbors,
+    }
+    if args.sampling == 'path':
+        path_config = args.path or PROJECT_ROOT / DEFAULT_PATH_CONFIG
+        options['path_points'] = load_path_points(path_config).tolist()
+        options['path_falloff'] = args.path_falloff
+    return options
+
+def get_model_transforms(args):
+    """
+    Placement matrices of the viewer models by source file stem, needed for
+    path sampling only.
+    """
+    if args.sampling != 'path':
+        return {}
+    return load_model_transforms(args.models_config or PROJECT_ROOT / DEFAULT_MODELS_CONFIG)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Create compressed quality levels for all PLY models.")
+    parser.add_argument('--models-dir', metavar='DIR',
+                        help="directory holding the source PLY models (default: public/models)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+                        help="process up to N tasks in parallel; 0 uses every CPU core (default: 1)")
+    parser.add_argument('--single-pass', action='store_true',
+                        help="read each source once and write all quality levels from that read "
+                             "(parallelises across files instead of (file, quality) pairs)")
+    add_shrink_arguments(parser)
+    parser.add_argument('--budget', type=parse_budgets, metavar='LEVELS',
+                        help="fit quality levels to a compressed size in MB instead of their fixed "
+                             "resolution, e.g. ultra_low=2,low=5; the resolution is searched on quick "
+                             "size estimates of each file")
+    parser.add_argument('--gzip-threads', type=int, default=0, metavar='N',
+                        help="compression threads per output (default: CPU cores divided by --jobs)")
+    parser.add_argument('--progressive', action='store_true',
+                        help="also write an uncompressed, prefix-ordered copy of each model plus a "
+                             ".lod.json index of the byte offset that ends every quality level")
+    parser.add_argument('--draco', metavar='LEVELS',
+                        help="also encode quality levels as Draco .drc files in <models-dir>/draco, e.g. "
+                             "ultra_low=11:7,low=12:7,medium with optional quantization bits and "
+                             "compression level 0-10 per level (default: 14:7); needs DracoPy")
+    parser.add_argument('--report', metavar='FILE',
+                        help="write per-file, per-level and per-stage timings, byte counts and peak "
+                             "memory to FILE (.json, or .csv for one row per stage)")
+    parser.add_argument('--profile', action='store_true',
+                        help="rebuild the slowest file under cProfile and tracemalloc and write "
+                             "<name>.prof and <name>.tracemalloc next to the report")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every output even if the build manifest says it is up to date")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    unknown = sorted(set(args.budget or ()) - set(QUALITY_LEVELS))
+    if unknown:
+        sys.exit(f"Unknown quality levels in --budget: {', '.join(unknown)}")
+    draco_levels = {}
+    if args.draco:
+        try:
+            draco_levels = parse_draco_levels(args.draco)
+        except ValueError as e:
+            sys.exit(str(e))
+        unknown = sorted(set(draco_levels) - set(QUALITY_LEVELS))
+        if unknown:
+            sys.exit(f"Unknown quality levels in --draco: {', '.join(unknown)}")
+        if not draco_available():
+            sys.exit("--draco needs the DracoPy package (pip install DracoPy)")
+    if args.remove_outliers is not None and not outlier_removal_available():
+        sys.exit("--remove-outliers needs the scipy package (pip install scipy)")
+    if args.sampling == 'path' and not path_sampling_available():
+        sys.exit("--sampling path needs the scipy package (pip install scipy)")
+    cpu_count = os.cpu_count() or 1
+    try:
+        shrink_options = get_shrink_options(args)
+        transforms = get_model_transforms(args)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Cannot read the viewer configs for path sampling: {e}")
+    gzip_threads = args.gzip_threads or max(1, cpu_count // (args.jobs or cpu_count))
+    
     # Define paths
     script_dir = Path(__file__).parent
     project_root = script_dir.parent
-    models_dir = project_root / 'public' / 'models'
+    models_dir = Path(args.models_dir) if args.models_dir else project_root / 'public' / 'models'
     compressed_dir = models_dir / 'compressed'
     
     # Create compressed directory if it doesn't exist
     compressed_dir.mkdir(exist_ok=True)
     
-    # Define quality levels and their resolutions
-    quality_levels = {
-        'ultra_low': 0.1,   # 10% of points
-        'low': 0.25,        # 25% of points
-        'medium': 0.5,      # 50% of points
-        'high': 1.0         # 100% of points (original)
-    }
+    quality_levels = QUALITY_LEVELS
     
     # Find all PLY files in the models directory (excluding compressed folder)
     ply_files = []
@@ -140,61 +610,156 @@ def main():
     for ply_file in ply_files:
         size_mb = get_file_size_mb(ply_file)
         print(f"  - {ply_file.name} ({size_mb:.1f} MB)")
+    file_options = {ply_file: file_shrink_options(shrink_options, ply_file, transforms) for ply_file in ply_files}
+    
+    # Sizes of the existing outputs, to report how much the rebuilt ones changed
+    previous_sizes = {f.name: get_file_size_mb(f) for f in compressed_dir.glob('*.ply.gz')}
     
     print("\nProcessing files...")
     
-    total_files = len(ply_files) * len(quality_levels)
+    total_files = len(ply_files) * (len(quality_levels) + args.progressive + len(draco_levels))
     processed_files = 0
     skipped_files = 0
     
-    for ply_file in ply_files:
-        base_name = ply_file.stem  # filename without extension
-        original_size = get_file_size_mb(ply_file)
-        
-        print(f"\nProcessing {ply_file.name} ({original_size:.1f} MB):")
+    run_started = time.strftime('%Y-%m-%dT%H:%M:%S')
+    run_start = time.perf_counter()
+    run_timer = StageTimer()
+    file_reports = {ply_file: {'file': ply_file.name, 'bytes': ply_file.stat().st_size, 'seconds': 0.0,
+                               'cpu_seconds': 0.0, 'peak_rss_mb': 0.0, 'stages': StageTimer(), 'levels': {},
+                               'draco': {}}
+                    for ply_file in ply_files}
+    
+    # Budgeted levels get a resolution of their own for every file
+    file_levels = {ply_file: quality_levels for ply_file in ply_files}
+    if args.budget:
+        with run_timer.stage('fit'):
+            for ply_file in ply_files:
+                print(f"Fitting {ply_file.name} to the size budgets:")
+                fits = fit_budgets(ply_file, args.budget, file_options[ply_file])
+                print_budget_fits(args.budget, fits)
+                file_levels[ply_file] = {quality: fits[quality][0] if quality in fits else resolution
+                                         for quality, resolution in quality_levels.items()}
+    
+    # Work out which outputs are still current for their source content and parameters
+    with run_timer.stage('fingerprint'):
+        manifest = BuildManifest(compressed_dir / MANIFEST_NAME)
+        fingerprints = {ply_file: manifest.fingerprint(ply_file) for ply_file in ply_files}
+    up_to_date = {
+        ply_file: {quality for quality, resolution in file_levels[ply_file].items()
+                   if not args.force and manifest.is_current(
+                       compressed_dir / f"{ply_file.stem}_{quality}.ply.gz", fingerprints[ply_file],
+                       get_output_params(resolution, file_options[ply_file]), ENGINE_VERSION)}
+        for ply_file in ply_files
+    }
+    
+    if args.single_pass:
+        # One task per file, producing every quality level from a single read
+        tasks = [(ply_file, file_levels[ply_file], compressed_dir, file_options[ply_file], gzip_threads,
+                  up_to_date[ply_file])
+                 for ply_file in ply_files]
+    else:
+        # One task per (file, quality) pair
+        tasks = [(ply_file, {quality: resolution}, compressed_dir, file_options[ply_file], gzip_threads,
+                  up_to_date[ply_file])
+                 for ply_file in ply_files
+                 for quality, resolution in file_levels[ply_file].items()]
+    
+    current_file = None
+    for task, (results, metrics) in zip(tasks, run_in_order(process_quality_levels, tasks, args.jobs)):
+        ply_file, levels = task[:2]
+        add_task_metrics(file_reports[ply_file], levels, results, metrics)
+        if ply_file != current_file:
+            current_file = ply_file
+            print(f"\nProcessing {ply_file.name} ({get_file_size_mb(ply_file):.1f} MB):")
         
-        for quality, resolution in quality_levels.items():
-            # Check if compressed file already exists
-            final_compressed = compressed_dir / f"{base_name}_{quality}.ply.gz"
-            
-            if final_compressed.exists():
-                compressed_size = get_file_size_mb(final_compressed)
-                print(f"  {quality} quality ({int(resolution*100)}%) already exists ({compressed_size:.1f} MB) - SKIPPED")
+        for (quality, resolution), (status, message) in zip(levels.items(), results):
+            print(message)
+            if status == 'processed':
+                processed_files += 1
+                manifest.record(compressed_dir / f"{ply_file.stem}_{quality}.ply.gz", ply_file,
+                                fingerprints[ply_file], get_output_params(resolution, file_options[ply_file]),
+                                ENGINE_VERSION)
+            elif status == 'skipped':
                 skipped_files += 1
-                continue
-            
-            try:
-                # Create temporary shrunk file
-                temp_shrunk = compressed_dir / f"{base_name}_{quality}_temp.ply"
-                
-                # Shrink the PLY file
-                print(f"  Creating {quality} quality ({int(resolution*100)}%)...", end=" ")
-                shrink_ply_file(str(ply_file), str(temp_shrunk), resolution)
-                
-                # Get shrunk file size
-                shrunk_size = get_file_size_mb(temp_shrunk)
-                
-                # Compress with gzip
-                compress_with_gzip(str(temp_shrunk), str(final_compressed))
-                
-                # Get final compressed size
-                compressed_size = get_file_size_mb(final_compressed)
-                
-                # Remove temporary file
-                temp_shrunk.unlink()
-                
-                # Calculate compression ratio
-                compression_ratio = (1 - compressed_size / original_size) * 100
-                
-                print(f"{shrunk_size:.1f} MB → {compressed_size:.1f} MB ({compression_ratio:.1f}% reduction)")
-                
+        
+        # Save after every task so an interrupted run keeps its progress
+        with run_timer.stage('manifest'):
+            manifest.save()
+    
+    if args.progressive:
+        print("\nWriting progressive copies...")
+        tasks = [(ply_file, file_levels[ply_file], compressed_dir,
+                  not args.force and manifest.is_current(compressed_dir / f"{ply_file.stem}_progressive.ply",
+                                                         fingerprints[ply_file],
+                                                         {'progressive': True, 'levels': file_levels[ply_file]},
+                                                         ENGINE_VERSION))
+                 for ply_file in ply_files]
+        for task, (status, message) in zip(tasks, run_in_order(process_progressive, tasks, args.jobs)):
+            ply_file = task[0]
+            print(message)
+            if status == 'processed':
                 processed_files += 1
-                
-            except Exception as e:
-                print(f"ERROR: {str(e)}")
-                # Clean up temp file if it exists
-                if temp_shrunk.exists():
-                    temp_shrunk.unlink()
+                manifest.record(compressed_dir / f"{ply_file.stem}_progressive.ply", ply_file,
+                                fingerprints[ply_file], {'progressive': True, 'levels': task[1]},
+                                ENGINE_VERSION)
+            elif status == 'skipped':
+                skipped_files += 1
+            manifest.save()
+    
+    if draco_levels:
+        print("\nEncoding Draco copies...")
+        draco_dir = models_dir / 'draco'
+        draco_dir.mkdir(exist_ok=True)
+        tasks = []
+        for ply_file in ply_files:
+            levels = {quality: (file_levels[ply_file][quality], *settings) for quality, settings in draco_levels.items()}
+            current = {quality for quality, (resolution, *settings) in levels.items()
+                       if not args.force and manifest.is_current(
+                           draco_dir / f"{ply_file.stem}_{quality}.drc", fingerprints[ply_file],
+                           get_draco_params(resolution, settings, file_options[ply_file]), ENGINE_VERSION)}
+            tasks.append((ply_file, levels, draco_dir, file_options[ply_file], current, gzip_threads))
+        
+        for task, (results, metrics) in zip(tasks, run_in_order(process_draco, tasks, args.jobs)):
+            ply_file, levels = task[:2]
+            file_reports[ply_file]['draco'].update(metrics)
+            for (quality, (resolution, *settings)), (status, message) in zip(levels.items(), results):
+                print(message)
+                if status == 'processed':
+                    processed_files += 1
+                    manifest.record(draco_dir / f"{ply_file.stem}_{quality}.drc", ply_file, fingerprints[ply_file],
+                                    get_draco_params(resolution, settings, file_options[ply_file]),
+                                    ENGINE_VERSION)
+                elif status == 'skipped':
+                    skipped_files += 1
+            manifest.save()
+    
+    if args.report or args.profile:
+        report = {
+            'version': 1,
+            'started': run_started,
+            'seconds': time.perf_counter() - run_start,
+            'options': {**recorded_options(shrink_options), 'jobs': args.jobs, 'single_pass': args.single_pass,
+                        'gzip_threads': gzip_threads},
+            'stages': run_timer.stages,
+            'files': [{**file_report, 'stages': file_report['stages'].stages}
+                      for file_report in file_reports.values()],
+        }
+        if args.report:
+            write_report(args.report, report)
+            print(f"\nReport written to {args.report}")
+        
+        built = [ply_file for ply_file, file_report in file_reports.items()
+                 if any(level['status'] == 'processed' for level in file_report['levels'].values())]
+        if args.profile and built:
+            slowest = max(built, key=lambda ply_file: file_reports[ply_file]['seconds'])
+            output_dir = Path(args.report).parent if args.report else Path.cwd()
+            print(f"Profiling {slowest.name} ({file_reports[slowest]['seconds']:.1f} s)...")
+            profile_path, snapshot_path, peak_traced = profile_file(slowest, file_levels[slowest],
+                                                                    file_options[slowest], gzip_threads, output_dir)
+            print(f"  cProfile stats: {profile_path}")
+            print(f"  tracemalloc snapshot: {snapshot_path} (peak traced {peak_traced / (1024 * 1024):.1f} MB)")
+        elif args.profile:
+            print("\nNothing was rebuilt, so there is no file to profile.")
     
     print(f"\nProcessing complete! {processed_files} files processed, {skipped_files} files skipped, {processed_files + skipped_files}/{total_files} total.")
     
@@ -202,11 +767,22 @@ def main():
     print("\nCompressed files created:")
     compressed_files = list(compressed_dir.glob('*.ply.gz'))
     total_compressed_size = 0
+    # Current and previous size of the outputs that already existed before this run
+    compared_size = 0
+    compared_previous_size = 0
     
     for compressed_file in sorted(compressed_files):
         size_mb = get_file_size_mb(compressed_file)
         total_compressed_size += size_mb
-        print(f"  - {compressed_file.name} ({size_mb:.1f} MB)")
+        previous_size = previous_sizes.get(compressed_file.name)
+        if previous_size is not None:
+            compared_size += size_mb
+            compared_previous_size += previous_size
+        if previous_size and abs(size_mb - previous_size) >= 0.001:
+            change = (size_mb / previous_size - 1) * 100
+            print(f"  - {compressed_file.name} ({size_mb:.1f} MB, {change:+.1f}% vs previous {previous_size:.1f} MB)")
+        else:
+            print(f"  - {compressed_file.name} ({size_mb:.1f} MB)")
     
     # Calculate total original size
     total_original_size = sum(get_file_size_mb(f) for f in ply_files)
@@ -214,6 +790,9 @@ def main():
     
     print(f"\nTotal original size: {total_original_size:.1f} MB")
     print(f"Total compressed size: {total_compressed_size:.1f} MB")
+    if compared_previous_size and abs(compared_size - compared_previous_size) >= 0.001:
+        change = (compared_size / compared_previous_size - 1) * 100
+        print(f"Change in compressed size: {compared_size - compared_previous_size:+.1f} MB ({change:+.1f}%)")
     print(f"Overall reduction: {total_reduction:.1f}%")
 
 if __name__ == '__main__':
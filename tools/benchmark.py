@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+PLY Pipeline Benchmark
+Times each stage of the PLY processing pipeline (header parsing, sampling,
+gzip compression and an end-to-end batch_compress run) on deterministic
+synthetic scans, and reports throughput in MB/s and points/s together with the
+peak resident memory of every stage. The filter stage compares the compressed
+size and decompression throughput of byte-filtered .ply.gz outputs with the
+plain ones. Each stage runs in a fresh process so its
+peak RSS is its own. Results are saved as JSON; pass an earlier result file
+with --compare to see the speed change between two commits.
+
+The synthetic scans are terrain height fields sampled along scan lines, with
+optional normals and colours, so that compression ratios resemble those of
+real scans rather than random noise. Generated files are cached in the data
+directory and reused by later runs.
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# Add the current directory to Python path to import the shared tool modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from plyio import read_ply_header, read_header
+from byte_filter import unshuffle_vertices
+
+RESULTS_VERSION = 1
+
+# Point counts benchmarked by default
+DEFAULT_SIZES = '1M,10M,50M'
+STAGES = ('header', 'sample', 'compress', 'batch', 'filter')
+
+# Resolution used by the sampling stage
+SAMPLE_RESOLUTION = 0.25
+# Header parses timed per measurement; a single parse is too quick to time
+HEADER_REPEATS = 200
+# Outputs written by the filter stage: the plain .ply.gz and each byte filter
+FILTER_VARIANTS = ('plain', 'shuffle', 'delta')
+# Points generated and written at a time
+GENERATE_CHUNK_POINTS = 1024 * 1024
+
+
+def parse_count(text):
+    """
+    Parse a point count such as 500K, 10M or 2500000.
+    """
+    text = text.strip().upper()
+    multiplier = {'K': 1000, 'M': 1000 * 1000}.get(text[-1:], 1)
+    return int(float(text.rstrip('KM')) * multiplier)
+
+
+def dataset_name(points, colors, normals):
+    attributes = ('_normals' if normals else '') + ('_colors' if colors else '')
+    return f"synthetic_{points}{attributes}"
+
+
+def generate_ply(path, points, colors=True, normals=True, seed=0):
+    """
+    Write a deterministic synthetic binary PLY scan with the given number of points.
+    """
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if normals:
+        fields += [('nx', '<f4'), ('ny', '<f4'), ('nz', '<f4')]
+    if colors:
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    dtype = np.dtype(fields)
+
+    header = ["ply", "format binary_little_endian 1.0", "comment synthetic benchmark scan",
+              f"element vertex {points}"]
+    header += [f"property {'float' if dtype.fields[name][0].kind == 'f' else 'uchar'} {name}"
+               for name in dtype.names]
+    header.append("end_header")
+
+    # Scan lines across a square patch of terrain
+    row_length = max(1, int(np.sqrt(points)))
+    extent = 100.0
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode('ascii'))
+        for start in range(0, points, GENERATE_CHUNK_POINTS):
+            rng = np.random.default_rng([seed, start])
+            index = np.arange(start, min(points, start + GENERATE_CHUNK_POINTS))
+            x = (index % row_length) * (extent / row_length) + rng.normal(0, 0.01, len(index))
+            y = (index // row_length) * (extent / row_length) + rng.normal(0, 0.01, len(index))
+            z = 2 * np.sin(x / 7) * np.cos(y / 11) + 0.5 * np.sin(x / 1.3 + y / 2.1) + rng.normal(0, 0.005, len(index))
+
+            block = np.empty(len(index), dtype=dtype)
+            block['x'], block['y'], block['z'] = x, y, z
+            if normals:
+                dz_dx = 2 / 7 * np.cos(x / 7) * np.cos(y / 11) + 0.5 / 1.3 * np.cos(x / 1.3 + y / 2.1)
+                dz_dy = -2 / 11 * np.sin(x / 7) * np.sin(y / 11) + 0.5 / 2.1 * np.cos(x / 1.3 + y / 2.1)
+                length = np.sqrt(dz_dx ** 2 + dz_dy ** 2 + 1)
+                block['nx'], block['ny'], block['nz'] = -dz_dx / length, -dz_dy / length, 1 / length
+            if colors:
+                shade = np.clip((z + 3) / 6, 0, 1)
+                block['red'] = np.clip(80 + 120 * shade + rng.normal(0, 6, len(index)), 0, 255)
+                block['green'] = np.clip(110 + 90 * shade + rng.normal(0, 6, len(index)), 0, 255)
+                block['blue'] = np.clip(60 + 60 * shade + rng.normal(0, 6, len(index)), 0, 255)
+            f.write(block.tobytes())
+    os.replace(temp_path, path)
+
+
+def ensure_dataset(data_dir, points, colors, normals, seed=0):
+    """
+    Path of a cached synthetic scan, generating it if missing.
+    """
+    path = os.path.join(data_dir, dataset_name(points, colors, normals) + '.ply')
+    if not os.path.exists(path):
+        print(f"Generating {os.path.basename(path)}...")
+        generate_ply(path, points, colors, normals, seed)
+    return path
+
+
+def _peak_rss_mb():
+    """
+    Peak resident memory of this process in MB.
+    """
+    # VmHWM starts afresh in every exec'd process, unlike ru_maxrss which
+    # Linux carries over from the parent
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_stage(stage, input_path, work_dir):
+    """
+    Run one stage and return its wall time, CPU time and peak RSS.
+    Called in a fresh worker process.
+    """
+    from shrink_engine import shrink_ply_file
+    from batch_compress import compress_with_gzip, main as batch_main
+    from parallel_gzip import ParallelGzipWriter
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    extra = {}
+
+    if stage == 'header':
+        for _ in range(HEADER_REPEATS):
+            read_ply_header(input_path)
+    elif stage == 'sample':
+        shrink_ply_file(input_path, os.path.join(work_dir, 'sampled.ply'), SAMPLE_RESOLUTION)
+    elif stage == 'compress':
+        compress_with_gzip(input_path, os.path.join(work_dir, 'compressed.ply.gz'))
+    elif stage == 'batch':
+        models_dir = os.path.join(work_dir, 'models')
+        os.makedirs(models_dir, exist_ok=True)
+        os.symlink(os.path.abspath(input_path), os.path.join(models_dir, os.path.basename(input_path)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            batch_main(['--models-dir', models_dir, '--single-pass', '--force'])
+    elif stage == 'filter':
+        extra['filters'] = {}
+        for variant in FILTER_VARIANTS:
+            output_path = os.path.join(work_dir, f'{variant}.ply.gz')
+            with ParallelGzipWriter(output_path) as f_out:
+                shrink_ply_file(input_path, f_out, SAMPLE_RESOLUTION,
+                                byte_filter=None if variant == 'plain' else variant)
+            extra['filters'][variant] = measure_inflate(output_path)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+    seconds = time.perf_counter() - wall_start
+    if stage == 'header':
+        seconds /= HEADER_REPEATS
+    return {
+        'seconds': seconds,
+        'cpu_seconds': time.process_time() - cpu_start,
+        'peak_rss_mb': _peak_rss_mb(),
+        **extra,
+    }
+
+
+def measure_inflate(path):
+    """
+    Compressed size of a .ply.gz output and the throughput of decompressing
+    it on one thread, as the viewer does, and undoing any byte filter.
+    """
+    with open(path, 'rb') as f:
+        compressed = f.read()
+    start = time.perf_counter()
+    data = gzip.decompress(compressed)
+    header = read_header(io.BytesIO(data))
+    for line in header.lines:
+        parts = line.split()
+        if parts[:3] == ['comment', 'filter', 'shuffle']:
+            delta_fields = parts[5:] if parts[4:5] == ['delta'] else ()
+            unshuffle_vertices(memoryview(data)[header.header_size:], header.vertex_dtype(), int(parts[3]),
+                               delta_fields)
+    seconds = time.perf_counter() - start
+    return {
+        'gzip_bytes': len(compressed),
+        'raw_bytes': len(data),
+        'inflate_seconds': seconds,
+        'inflate_mb_per_s': len(data) / (1024 * 1024) / seconds if seconds > 0 else 0.0,
+    }
+
+
+def print_filter_comparison(filters):
+    """
+    Print the size and decompression speed of each filter against the plain .ply.gz.
+    """
+    plain = filters['plain']
+    for variant, result in filters.items():
+        size_change = result['gzip_bytes'] / plain['gzip_bytes'] - 1 if plain['gzip_bytes'] else 0.0
+        speedup = result['inflate_mb_per_s'] / plain['inflate_mb_per_s'] if plain['inflate_mb_per_s'] else 0.0
+        print(f"      {variant:<9} {result['gzip_bytes'] / (1024 * 1024):9.2f} MB gzip  {size_change:+7.1%}  "
+              f"{result['inflate_mb_per_s']:9.1f} MB/s inflate  {speedup:5.2f}x")
+
+
+def measure(stage, input_path, work_dir):
+    """
+    Run a stage in its own process and return its measurements.
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+    os.makedirs(work_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            return executor.submit(_run_stage, stage, input_path, work_dir).result()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare_results(old, new):
+    """
+    Print the speed change of every (dataset, stage) present in both runs.
+    """
+    previous = {(r['dataset'], r['stage']): r for r in old['results']}
+    print(f"\nComparison with {old['environment'].get('commit') or 'previous run'}:")
+    for result in new['results']:
+        before = previous.get((result['dataset'], result['stage']))
+        if before and result['seconds'] > 0:
+            speedup = before['seconds'] / result['seconds']
+            rss_change = result['peak_rss_mb'] - before['peak_rss_mb']
+            print(f"  {result['dataset']:<36} {result['stage']:<9} {speedup:5.2f}x speed  "
+                  f"{rss_change:+8.1f} MB peak RSS")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PLY processing pipeline on synthetic scans.")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"comma-separated point counts, e.g. 1M,10M (default: {DEFAULT_SIZES})")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help=f"comma-separated stages to run (default: {','.join(STAGES)})")
+    parser.add_argument('--data-dir', default=os.path.join('/tmp', 'ply-benchmark'),
+                        help="directory for the cached synthetic scans (default: /tmp/ply-benchmark)")
+    parser.add_argument('--output', default='benchmark.json', help="result file (default: benchmark.json)")
+    parser.add_argument('--compare', metavar='JSON', help="earlier result file to compare against")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic scans (default: 0)")
+    args = parser.parse_args(argv)
+
+    sizes = [parse_count(size) for size in args.sizes.split(',') if size.strip()]
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    work_dir = os.path.join(args.data_dir, 'work')
+    results = []
+
+    for points in sizes:
+        # Positions only, and positions with normals and colours
+        for colors, normals in ((False, False), (True, True)):
+            input_path = ensure_dataset(args.data_dir, points, colors, normals, args.seed)
+            input_bytes = os.path.getsize(input_path)
+            name = dataset_name(points, colors, normals)
+
+            for stage in stages:
+                measurement = measure(stage, input_path, work_dir)
+                seconds = measurement['seconds']
+                # A header parse touches only the header; the other stages process the whole file
+                stage_points = 0 if stage == 'header' else points
+                stage_bytes = read_ply_header(input_path).header_size if stage == 'header' else input_bytes
+                result = {
+                    'dataset': name,
+                    'points': points,
+                    'colors': colors,
+                    'normals': normals,
+                    'input_bytes': input_bytes,
+                    'stage': stage,
+                    **measurement,
+                    'mb_per_s': stage_bytes / (1024 * 1024) / seconds if seconds > 0 else 0.0,
+                    'points_per_s': stage_points / seconds if seconds > 0 else 0.0,
+                }
+                results.append(result)
+                print(f"  {name:<36} {stage:<9} {seconds * 1000:10.3f} ms  {result['mb_per_s']:9.1f} MB/s  "
+                      f"{result['points_per_s'] / 1e6:8.2f} Mpts/s  {result['peak_rss_mb']:8.1f} MB RSS")
+                if 'filters' in result:
+                    print_filter_comparison(result['filters'])
+
+    report = {
+        'version': RESULTS_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_results(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Incremental Build Cache
+Build manifest for batch_compress. Every output records the fingerprint of its
+source scan (size, mtime and content hash), the shrink parameters and the
+engine version it was built with, so reruns only rebuild outputs whose inputs
+really changed. Unchanged sources are recognised from their size and mtime
+alone; the content is only hashed when those differ.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+
+# Manifest file name inside the output directory
+MANIFEST_NAME = '.build-manifest.json'
+
+# Bytes handed to the hash function at a time
+HASH_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def hash_file(file_path):
+    """
+    BLAKE2b content hash of a file, read through a memory map.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, len(view), HASH_BLOCK_SIZE):
+                    digest.update(view[start:start + HASH_BLOCK_SIZE])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    JSON manifest of source fingerprints and the outputs built from them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = {}
+        self.outputs = {}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.sources = data.get('sources', {})
+                self.outputs = data.get('outputs', {})
+            except (OSError, ValueError):
+                # A corrupt manifest only costs a rebuild
+                self.sources = {}
+                self.outputs = {}
+
+    def fingerprint(self, source_path):
+        """
+        Return the fingerprint of a source file, rehashing only if its size
+        or mtime changed since the last run.
+        """
+        key = os.path.abspath(source_path)
+        stat = os.stat(source_path)
+        previous = self.sources.get(key)
+
+        if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            return previous
+
+        fingerprint = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': hash_file(source_path),
+        }
+        self.sources[key] = fingerprint
+        return fingerprint
+
+    def is_current(self, output_path, fingerprint, params, tool_version):
+        """
+        True if output_path exists and was built from the same source content
+        with the same parameters and tool version.
+        """
+        record = self.outputs.get(os.path.basename(output_path))
+        return (record is not None and os.path.exists(output_path)
+                and record['source_hash'] == fingerprint['hash']
+                and record['params'] == params
+                and record['tool_version'] == tool_version)
+
+    def record(self, output_path, source_path, fingerprint, params, tool_version):
+        self.outputs[os.path.basename(output_path)] = {
+            'source': os.path.basename(source_path),
+            'source_hash': fingerprint['hash'],
+            'params': params,
+            'tool_version': tool_version,
+        }
+
+    def save(self):
+        """
+        Write the manifest atomically.
+        """
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'sources': self.sources, 'outputs': self.outputs}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Byte Shuffle Filter
+Blosc-style pre-filter for the vertex block of shrunk outputs. Interleaved
+records (x, y, z floats next to colour bytes) give DEFLATE short, mixed
+matches; transposing each block of records into byte planes stores byte 0 of
+every record, then byte 1, and so on, which both de-interleaves the columns
+and groups the slowly varying high bytes of each float together. With the
+'delta' mode the position fields are first replaced, as unsigned integers of
+their own width, by their wrapping difference from the previous vertex of the
+block, which turns coordinates that are sorted along the scan or a Morton
+curve into runs of small numbers. Both steps are lossless.
+
+The vertex block is filtered in blocks of a fixed number of records (the last
+one may be shorter), described by a PLY header comment:
+
+    comment filter shuffle <block rows> [delta <field> ...]
+
+so a loader restores the interleaved records, and sums the deltas, in a
+single pass over each block before parsing the file as usual.
+"""
+
+import numpy as np
+
+# Filters supported by shrink_ply_file_multi
+FILTER_MODES = ('shuffle', 'delta')
+
+# Records transposed together; the writer buffers one block per output
+FILTER_BLOCK_ROWS = 64 * 1024
+
+POSITION_FIELDS = ('x', 'y', 'z')
+
+
+def make_filter(dtype, mode, block_rows=FILTER_BLOCK_ROWS):
+    """
+    Work out the filter for records of the given dtype.
+    Returns a dict with the 'block_rows', the 'delta_fields' and the header
+    'comments' describing them.
+    """
+    if mode not in FILTER_MODES:
+        raise ValueError(f"Unknown filter: {mode}")
+
+    delta_fields = ()
+    if mode == 'delta':
+        delta_fields = tuple(name for name in POSITION_FIELDS if name in dtype.names)
+
+    comment = f"filter shuffle {block_rows}"
+    if delta_fields:
+        comment += " delta " + ' '.join(delta_fields)
+    return {
+        'block_rows': block_rows,
+        'delta_fields': delta_fields,
+        'comments': [comment],
+    }
+
+
+def _unsigned_view(values):
+    """
+    View a field of integer or float values as unsigned integers of the same width.
+    """
+    byte_order = '>' if values.dtype.byteorder == '>' else '<'
+    return values.view(np.dtype(f"{byte_order}u{values.dtype.itemsize}"))
+
+
+def shuffle_block(records, delta_fields=()):
+    """
+    Filter one block of structured records into its byte planes.
+    """
+    records = np.ascontiguousarray(records)
+    if delta_fields and len(records) > 1:
+        records = records.copy()
+        for name in delta_fields:
+            values = _unsigned_view(records[name])
+            # Unsigned subtraction wraps, so the deltas are exact for any bits
+            values[1:] = np.diff(values)
+    return records.view(np.uint8).reshape(len(records), records.dtype.itemsize).T.tobytes()
+
+
+def unshuffle_block(data, dtype, delta_fields=()):
+    """
+    Restore the structured records of one filtered block.
+    """
+    rows = len(data) // dtype.itemsize
+    planes = np.frombuffer(data, dtype=np.uint8, count=rows * dtype.itemsize).reshape(dtype.itemsize, rows)
+    records = np.ascontiguousarray(planes.T).view(dtype).reshape(rows)
+    for name in delta_fields:
+        values = _unsigned_view(records[name])
+        np.cumsum(values, dtype=values.dtype, out=values)
+    return records
+
+
+def unshuffle_vertices(data, dtype, block_rows, delta_fields=()):
+    """
+    Restore a whole filtered vertex block as a structured array.
+    """
+    block_bytes = block_rows * dtype.itemsize
+    vertices = np.empty(len(data) // dtype.itemsize, dtype=dtype)
+    for start in range(0, len(data), block_bytes):
+        block = unshuffle_block(data[start:start + block_bytes], dtype, delta_fields)
+        vertices[start // dtype.itemsize:start // dtype.itemsize + len(block)] = block
+    return vertices
+
+
+class ShuffleWriter:
+    """
+    File-like wrapper that filters the records written to it block by block.
+    Closing it writes the last, partial block; the wrapped file stays open.
+    """
+
+    def __init__(self, output_f, dtype, byte_filter):
+        self.output_f = output_f
+        self.dtype = dtype
+        self.block_rows = byte_filter['block_rows']
+        self.delta_fields = byte_filter['delta_fields']
+        self.pending = bytearray()
+
+    def write(self, data):
+        self.pending += memoryview(data).cast('B')
+        block_bytes = self.block_rows * self.dtype.itemsize
+        if len(self.pending) >= block_bytes:
+            full = len(self.pending) - len(self.pending) % block_bytes
+            blocks = np.frombuffer(self.pending, dtype=self.dtype, count=full // self.dtype.itemsize)
+            for start in range(0, len(blocks), self.block_rows):
+                self.output_f.write(shuffle_block(blocks[start:start + self.block_rows], self.delta_fields))
+            del blocks
+            del self.pending[:full]
+        return len(data)
+
+    def close(self):
+        if self.pending:
+            self.output_f.write(shuffle_block(np.frombuffer(self.pending, dtype=self.dtype), self.delta_fields))
+            self.pending = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A failed run leaves an incomplete output anyway
+        if exc_type is None:
+            self.close()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Point Cleaning
+Optional removal of useless geometry before sampling. Overlapping scans leave
+exact or near-duplicate points: positions are quantized onto a grid of the
+duplicate tolerance (or taken bit for bit with a tolerance of 0), hashed into
+one 64-bit key each, and all but the first point of every cell are dropped.
+Scanner noise leaves floating outliers: as in PCL's statistical outlier
+filter, a point is removed when the mean distance to its k nearest neighbours
+is more than std_ratio standard deviations above the mean of that distance
+over all points.
+
+The neighbour search uses scipy's cKDTree, which is optional (pip install
+scipy); duplicate removal needs only NumPy. Both work through the vertices in
+chunks, so the temporary memory is a few 8-byte values per point. The
+neighbour search is tiled as well: the points are sorted in Morton order and
+cut at octree cell boundaries into tiles of at most OUTLIER_TILE_ROWS, and
+each tile gets its own k-d tree over the tile plus a halo of the points
+around it, wide enough that every neighbour found is exact. No tree holds
+more than OUTLIER_HALO_ROWS points.
+"""
+
+import numpy as np
+
+from morton import MORTON_BITS, morton_codes, bounding_cube
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Neighbours and threshold of the statistical outlier test
+DEFAULT_OUTLIER_NEIGHBORS = 8
+DEFAULT_OUTLIER_STD_RATIO = 2.0
+
+# Vertices hashed or queried at a time
+CLEAN_CHUNK_ROWS = 1024 * 1024
+
+# Points per tile of the outlier search, most points in the halo of a tile,
+# points sampled to size a halo, and the share of their neighbourhoods the
+# first halo is sized to cover
+OUTLIER_TILE_ROWS = 1024 * 1024
+OUTLIER_HALO_ROWS = 2 * OUTLIER_TILE_ROWS
+OUTLIER_SAMPLE_ROWS = 16 * 1024
+OUTLIER_HALO_QUANTILE = 0.99
+
+POSITION_DTYPE = np.dtype([('x', np.float64), ('y', np.float64), ('z', np.float64)])
+
+# Odd 64-bit multipliers that mix the three cell coordinates into one hash
+HASH_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+
+def outlier_removal_available():
+    return cKDTree is not None
+
+
+def _cell_keys(vertices, tolerance):
+    """
+    Integer cell coordinates of the vertices, one row per vertex.
+    """
+    keys = np.empty((len(vertices), 3), dtype=np.int64)
+    for i, axis in enumerate('xyz'):
+        values = vertices[axis].astype(np.float64)
+        if tolerance:
+            keys[:, i] = np.floor(values / tolerance)
+        else:
+            # Exact duplicates: every distinct position has distinct bits
+            keys[:, i] = values.view(np.int64)
+    return keys
+
+
+def _position_hashes(vertices, tolerance):
+    """
+    64-bit hash of the quantized position of every vertex.
+    """
+    hashes = np.empty(len(vertices), dtype=np.uint64)
+    for start in range(0, len(vertices), CLEAN_CHUNK_ROWS):
+        keys = _cell_keys(vertices[start:start + CLEAN_CHUNK_ROWS], tolerance).view(np.uint64)
+        block = np.zeros(len(keys), dtype=np.uint64)
+        for i, multiplier in enumerate(HASH_MULTIPLIERS):
+            block ^= keys[:, i] * np.uint64(multiplier)
+        hashes[start:start + CLEAN_CHUNK_ROWS] = block ^ (block >> np.uint64(29))
+    return hashes
+
+
+def duplicate_mask(vertices, tolerance=0.0):
+    """
+    Boolean mask of the vertices that repeat the quantized position of an
+    earlier vertex. Vertices are grouped by hash, and every group is checked
+    on the full cell coordinates: a group whose members all share the first
+    member's cell drops all but that first vertex in file order, and the
+    rare groups mixing cells through a hash collision are sorted by cell, so
+    a collision never removes a distinct point.
+    """
+    hashes = _position_hashes(vertices, tolerance)
+    # Stable, so every group is in file order
+    order = np.argsort(hashes, kind='stable')
+    hashes = hashes[order]
+    same = hashes[1:] == hashes[:-1]
+    del hashes
+
+    # Members of the groups of more than one vertex, and where each group starts
+    shared = np.zeros(len(vertices), dtype=bool)
+    shared[1:] |= same
+    shared[:-1] |= same
+    starts_group = np.ones(len(vertices), dtype=bool)
+    starts_group[1:] = ~same
+    members = order[shared]
+    firsts = starts_group[shared]
+    del order, shared, same, starts_group
+    group_starts = np.flatnonzero(firsts)
+    groups = np.cumsum(firsts) - 1
+    del firsts
+
+    keys = np.empty((len(members), 3), dtype=np.int64)
+    for start in range(0, len(members), CLEAN_CHUNK_ROWS):
+        block = members[start:start + CLEAN_CHUNK_ROWS]
+        keys[start:start + len(block)] = _cell_keys(vertices[block], tolerance)
+    matches_first = (keys == keys[group_starts[groups]]).all(axis=1)
+
+    mask = np.zeros(len(vertices), dtype=bool)
+    mixed = np.zeros(len(group_starts), dtype=bool)
+    mixed[groups[~matches_first]] = True
+    plain = ~mixed[groups]
+    plain[group_starts] = False
+    mask[members[plain]] = True
+
+    # Groups holding several cells: sort their members by cell, then file order
+    colliding = np.flatnonzero(mixed[groups])
+    if len(colliding):
+        rows = colliding[np.lexsort((members[colliding], keys[colliding, 2], keys[colliding, 1],
+                                     keys[colliding, 0]))]
+        repeats = (keys[rows[1:]] == keys[rows[:-1]]).all(axis=1)
+        mask[members[rows[1:][repeats]]] = True
+    return mask
+
+
+def _clearance(points, lo, hi, mins, maxs):
+    """
+    Distance of every point inside the box [lo, hi] to the nearest box face
+    that has points beyond it; faces on the bounds [mins, maxs] of the
+    whole cloud do not count.
+    """
+    lo = np.where(lo <= mins, -np.inf, lo)
+    hi = np.where(hi >= maxs, np.inf, hi)
+    return np.minimum(points - lo, hi - points).min(axis=1)
+
+
+def _tree(points):
+    # Unbalanced trees without compacted nodes build several times faster
+    return cKDTree(points, balanced_tree=False, compact_nodes=False)
+
+
+def _code_range(codes, origin, size, lo, hi):
+    """
+    Range of the sorted Morton codes that holds every point of the box
+    [lo, hi]. Morton codes grow with every coordinate, so those points all
+    lie between the codes of the two corners.
+    """
+    corners = np.array([tuple(lo), tuple(hi)], dtype=POSITION_DTYPE)
+    corner_codes = morton_codes(corners, origin, size)
+    return (np.searchsorted(codes, corner_codes[0], side='left'),
+            np.searchsorted(codes, corner_codes[1], side='right'))
+
+
+def _points_in_box(positions, codes, origin, size, lo, hi, limit=None):
+    """
+    Points of the Morton-sorted positions inside the box [lo, hi], or None
+    when there are more than limit of them.
+    """
+    first, last = _code_range(codes, origin, size, lo, hi)
+    blocks, found = [], 0
+    for start in range(first, last, CLEAN_CHUNK_ROWS):
+        candidates = positions[start:min(start + CLEAN_CHUNK_ROWS, last)]
+        blocks.append(candidates[((candidates >= lo) & (candidates <= hi)).all(axis=1)])
+        found += len(blocks[-1])
+        if limit is not None and found > limit:
+            return None
+    return np.concatenate(blocks) if blocks else np.empty((0, 3), dtype=np.float64)
+
+
+def _octree_tiles(codes, rows):
+    """
+    (start, end) ranges of the Morton-sorted codes, in order, that each hold
+    one octree cell: the largest cells with at most rows points, or cells of
+    the finest level. Empty cells get no tile.
+    """
+    tiles = []
+    stack = [(0, len(codes), 0)]
+    while stack:
+        start, end, depth = stack.pop()
+        if end - start <= rows or depth == MORTON_BITS:
+            tiles.append((start, end))
+            continue
+        # Every child cell starts at the code of its prefix followed by zeros
+        shift = 3 * (MORTON_BITS - depth - 1)
+        parent = int(codes[start]) >> shift & ~7
+        child_codes = np.array([(parent | child) << shift for child in range(1, 8)], dtype=np.uint64)
+        bounds = [start] + list(start + np.searchsorted(codes[start:end], child_codes)) + [end]
+        for child_start, child_end in reversed(list(zip(bounds[:-1], bounds[1:]))):
+            if child_end > child_start:
+                stack.append((child_start, child_end, depth + 1))
+    return tiles
+
+
+def _scan_neighbors(positions, codes, origin, size, point, radius, count):
+    """
+    Sorted distances from point to its count nearest positions, which must
+    all lie within radius. The box around the point is scanned in chunks
+    without a tree, so any radius is searched in bounded memory.
+    """
+    first, last = _code_range(codes, origin, size, point - radius, point + radius)
+    nearest = np.empty(0, dtype=np.float64)
+    for start in range(first, last, CLEAN_CHUNK_ROWS):
+        candidates = positions[start:min(start + CLEAN_CHUNK_ROWS, last)]
+        distances = np.sqrt(((candidates - point) ** 2).sum(axis=1))
+        nearest = np.concatenate([nearest, distances[distances <= radius]])
+        if len(nearest) > count:
+            nearest = np.partition(nearest, count - 1)[:count]
+    return np.sort(nearest)
+
+
+def _mean_neighbor_distances(positions, codes, origin, size, neighbors):
+    """
+    Mean distance of every Morton-sorted position to its nearest neighbours,
+    one tile at a time. Tiles are octree cells, so a box around a tile's
+    points holds no other points until it reaches past the cell. Each tile
+    is searched in a tree over all points within a margin of its bounding
+    box: the margin is first sized from a sample of the tile searched on its
+    own, so it covers the neighbours of most points, and then grown for the
+    points whose neighbours may lie further out until every result is exact.
+    Halos never hold more than OUTLIER_HALO_ROWS points; the few points
+    still open when a halo would outgrow that are scanned one at a time.
+    """
+    mins, maxs = positions.min(axis=0), positions.max(axis=0)
+    # Width of a cell of the finest level, the smallest margin step
+    step = size / (1 << MORTON_BITS)
+    mean_distances = np.empty(len(positions), dtype=np.float64)
+
+    for start, end in _octree_tiles(codes, OUTLIER_TILE_ROWS):
+        tile = positions[start:end]
+        lo, hi = tile.min(axis=0), tile.max(axis=0)
+        # Neighbours within the tile alone are at least as far as the true ones
+        sample = tile[::max(1, len(tile) // OUTLIER_SAMPLE_ROWS)]
+        bounds, _ = _tree(tile).query(sample, k=[neighbors + 1], workers=-1)
+        # Tiles of fewer points than neighbours find none of them, at infinity
+        margin = min(np.quantile(bounds, OUTLIER_HALO_QUANTILE, method='higher'), size)
+
+        distances = None
+        pending = np.ones(len(tile), dtype=bool)
+        while pending.any():
+            box_lo, box_hi = np.maximum(lo - margin, mins), np.minimum(hi + margin, maxs)
+            # The box of the tile alone only holds the tile, so it always fits
+            halo = _points_in_box(positions, codes, origin, size, box_lo, box_hi,
+                                  OUTLIER_HALO_ROWS if margin > 0 else None)
+            if halo is None:
+                if distances is not None:
+                    break
+                margin = margin / 2 if margin > step else 0.0
+                continue
+            queries = tile[pending]
+            # The nearest neighbour of every point is the point itself
+            found, _ = _tree(halo).query(queries, k=neighbors + 1, workers=-1)
+            del halo
+            if distances is None:
+                distances = found
+            else:
+                distances[pending] = found
+            # Neighbour distances found so far bound the true ones, so the
+            # shortfall is how much further the box must reach
+            shortfall = found[:, -1] - _clearance(queries, box_lo, box_hi, mins, maxs)
+            pending[pending] = shortfall > 0
+            if pending.any():
+                margin = min(margin + shortfall.max(), max(4 * margin, step))
+
+        for row in np.flatnonzero(pending):
+            distances[row] = _scan_neighbors(positions, codes, origin, size, tile[row],
+                                             distances[row, -1], neighbors + 1)
+        mean_distances[start:end] = distances[:, 1:].mean(axis=1)
+    return mean_distances
+
+
+def outlier_mask(vertices, std_ratio=DEFAULT_OUTLIER_STD_RATIO, neighbors=DEFAULT_OUTLIER_NEIGHBORS, indices=None):
+    """
+    Boolean mask of the statistical outliers among the vertices, or among
+    the vertices at the given indices only (one entry per index). Needs
+    about 50 bytes per point for the positions, Morton codes, order and
+    results, plus the k-d tree of one tile and its halo (a few hundred MB
+    with the default tile size).
+    """
+    if cKDTree is None:
+        raise RuntimeError("Outlier removal needs the scipy package (pip install scipy)")
+    count = len(vertices) if indices is None else len(indices)
+    if count <= neighbors:
+        return np.zeros(count, dtype=bool)
+
+    # Only the positions are gathered, not whole records
+    positions = np.empty(count, dtype=POSITION_DTYPE)
+    for start in range(0, count, CLEAN_CHUNK_ROWS):
+        block = vertices[start:start + CLEAN_CHUNK_ROWS] if indices is None \
+            else vertices[indices[start:start + CLEAN_CHUNK_ROWS]]
+        for axis in 'xyz':
+            positions[axis][start:start + len(block)] = block[axis]
+
+    # Morton order makes contiguous tiles spatially compact, and neighbouring
+    # queries walk the same branches of the tree
+    origin, size = bounding_cube(positions)
+    codes = morton_codes(positions, origin, size)
+    order = np.argsort(codes)
+    codes = codes[order]
+    positions = positions[order].view(np.float64).reshape(count, 3)
+    mean_distances = _mean_neighbor_distances(positions, codes, origin, size, neighbors)
+    del positions, codes
+
+    mask = np.empty(count, dtype=bool)
+    mask[order] = mean_distances > mean_distances.mean() + std_ratio * mean_distances.std()
+    return mask
+
+
+def clean_vertices(vertices, duplicate_tolerance=None, outlier_std_ratio=None,
+                   outlier_neighbors=DEFAULT_OUTLIER_NEIGHBORS):
+    """
+    Find the vertices that survive duplicate removal (if duplicate_tolerance
+    is given; 0 removes exact duplicates only) and then outlier removal (if
+    outlier_std_ratio is given). Returns the sorted indices of the surviving
+    vertices and a dict with the number of points each filter removed.
+    """
+    indices = np.arange(len(vertices), dtype=np.int64)
+    removed = {}
+
+    if duplicate_tolerance is not None:
+        duplicates = duplicate_mask(vertices, duplicate_tolerance)
+        indices = indices[~duplicates]
+        removed['duplicates'] = int(np.count_nonzero(duplicates))
+        del duplicates
+
+    if outlier_std_ratio is not None:
+        outliers = outlier_mask(vertices, outlier_std_ratio, outlier_neighbors,
+                                indices if len(indices) < len(vertices) else None)
+        indices = indices[~outliers]
+        removed['outliers'] = int(np.count_nonzero(outliers))
+
+    return indices, removed
+
+
+def format_removed(removed):
+    """
+    Short description of the points removed by each filter, e.g.
+    "removed 120 duplicates, 35 outliers".
+    """
+    return "removed " + ', '.join(f"{count} {name}" for name, count in removed.items()) if removed else ''
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Draco Point Cloud Encoding
+Encodes shrunk point clouds as Draco (.drc) files for the viewer's
+ProgressiveDracoLoader, using the DracoPy bindings of Google's Draco library
+(pip install DracoPy). DracoPy is optional: the rest of the toolchain works
+without it, and encode_point_cloud() raises a RuntimeError explaining how to
+install it when it is missing.
+
+Positions are quantized by Draco to quantization_bits per axis over the
+bounding box; colours are stored as 8-bit RGB. compression_level runs from 0
+(fastest) to 10 (smallest), as in the draco_encoder command line tool.
+
+PointCloudCollector takes the place of an output file of the shrink engine
+and keeps only the attributes Draco encodes, so a sampled level is never held
+in memory as a serialized PLY.
+"""
+
+import time
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+try:
+    import DracoPy
+except ImportError:
+    DracoPy = None
+
+# Settings used for a level when none are given
+DEFAULT_QUANTIZATION_BITS = 14
+DEFAULT_COMPRESSION_LEVEL = 7
+
+COLOR_FIELDS = ('red', 'green', 'blue')
+DRACO_FIELDS = ('x', 'y', 'z') + COLOR_FIELDS
+
+
+def draco_available():
+    return DracoPy is not None
+
+
+def parse_draco_levels(text, default_bits=DEFAULT_QUANTIZATION_BITS, default_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Parse a Draco level list such as "ultra_low=11:7,low=12,medium" into a
+    dict of level names and (quantization_bits, compression_level) pairs;
+    omitted settings take the defaults.
+    """
+    levels = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, settings = item.partition('=')
+        bits, _, level = settings.partition(':')
+        try:
+            bits = int(bits) if bits else default_bits
+            level = int(level) if level else default_level
+        except ValueError:
+            raise ValueError(f"invalid Draco settings: {item}")
+        if not 1 <= bits <= 30 or not 0 <= level <= 10:
+            raise ValueError(f"Draco quantization bits must be 1-30 and compression level 0-10: {item}")
+        levels[name.strip()] = (bits, level)
+    return levels
+
+
+def encode_point_cloud(vertices, quantization_bits=DEFAULT_QUANTIZATION_BITS,
+                       compression_level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Encode the positions (and colours, if present) of a structured vertex
+    array as a Draco point cloud. Returns the encoded bytes and the CPU
+    seconds spent encoding.
+    """
+    if DracoPy is None:
+        raise RuntimeError("Draco encoding needs the DracoPy package (pip install DracoPy)")
+
+    points = np.column_stack([vertices[axis] for axis in 'xyz']).astype(np.float32)
+    colors = None
+    if all(name in vertices.dtype.names for name in COLOR_FIELDS):
+        colors = np.column_stack([vertices[name] for name in COLOR_FIELDS])
+        if colors.dtype != np.uint8:
+            # Float colours are in 0-1
+            colors = np.clip(np.rint(colors * 255 if colors.dtype.kind == 'f' else colors), 0, 255)
+        colors = colors.astype(np.uint8)
+
+    cpu_start = time.process_time()
+    data = DracoPy.encode(points, quantization_bits=quantization_bits, compression_level=compression_level,
+                          colors=colors)
+    return data, time.process_time() - cpu_start
+
+
+class PointCloudCollector:
+    """
+    Write-only file object for one binary PLY output of shrink_ply_file_multi
+    with the source vertex layout dtype. The engine writes the header in one
+    call and then whole records; the header is skipped and only the fields
+    Draco encodes are kept from the records, packed. Everything written is
+    also passed on to tee, if given, e.g. a gzip writer measuring the
+    compressed size of the same output. bytes_in counts the bytes written.
+    """
+
+    def __init__(self, dtype, tee=None):
+        self.dtype = dtype
+        self.fields = [name for name in DRACO_FIELDS if name in dtype.names]
+        self.tee = tee
+        self.bytes_in = 0
+        self._header_written = False
+        self._blocks = []
+
+    def write(self, data):
+        if self.tee is not None:
+            self.tee.write(data)
+        size = memoryview(data).nbytes
+        self.bytes_in += size
+        if not self._header_written:
+            self._header_written = True
+        elif size:
+            records = np.frombuffer(data, dtype=self.dtype)
+            # Copied, since with a matching layout repack_fields returns a view
+            # into the engine's read buffer, which the next chunk overwrites
+            self._blocks.append(np.array(repack_fields(records[self.fields]), copy=True))
+        return size
+
+    def vertices(self):
+        """
+        The collected vertices as one packed structured array.
+        """
+        if not self._blocks:
+            return np.empty(0, dtype=repack_fields(np.empty(0, dtype=self.dtype)[self.fields]).dtype)
+        if len(self._blocks) > 1:
+            self._blocks = [np.concatenate(self._blocks)]
+        return self._blocks[0]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Pipeline Instrumentation
+Lightweight per-stage accounting for the PLY tools: wall time, CPU time of
+the calling thread and bytes in and out, accumulated under stage names, plus
+a peak resident memory probe that can be reset between tasks on Linux.
+"""
+
+import contextlib
+import resource
+import time
+
+
+class StageTimer:
+    """
+    Accumulates wall time, thread CPU time and byte counts per named stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds=0.0, cpu_seconds=0.0, bytes_in=0, bytes_out=0):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'cpu_seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0})
+        stage['seconds'] += seconds
+        stage['cpu_seconds'] += cpu_seconds
+        stage['bytes_in'] += bytes_in
+        stage['bytes_out'] += bytes_out
+
+    @contextlib.contextmanager
+    def stage(self, name, bytes_in=0, bytes_out=0):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start, bytes_in, bytes_out)
+
+    def iterate(self, name, iterable):
+        """
+        Yield the items of iterable, timing each step under the given stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of this process, where the kernel allows it.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process in MB since start or the last reset.
+    """
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and cannot be reset
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Multi-Part Scan Merger
+Bakes the placement of several models of a viewer config into their vertices
+and merges them into a single source PLY, so the viewer fetches, decodes and
+draws one asset instead of one per part and applies no transforms at runtime.
+
+Every model of the config carries a three.js position, rotation (Euler
+angles in XYZ order, radians) and scale. They are combined into one 4x4
+matrix per part, T * Rx * Ry * Rz * S, and applied to each chunk of
+positions in a single matrix product; normals go through the inverse
+transpose of the linear part and are renormalized. The merged points can be
+deduplicated on a grid, where overlapping parts cover the same surface, and
+optionally tiled with plytiles. An updated config replaces the parts by one
+model, at the identity transform, pointing at the quality levels and Draco
+files that batch_compress builds from the merged source.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add the current directory to Python path to import the shared tool modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from plyio import map_vertices, format_header
+from cleaning import duplicate_mask
+from plytiles import write_tiles, DEFAULT_MAX_POINTS
+from batch_compress import QUALITY_LEVELS
+from scene_config import transform_matrix, source_stem, DEFAULT_MODELS_CONFIG
+
+# Vertices transformed and written at a time
+MERGE_CHUNK_ROWS = 1024 * 1024
+
+# Grid size in scene units (metres) within which merged points count as duplicates
+DEFAULT_DEDUPE_SIZE = 0.005
+
+POSITION_FIELDS = ('x', 'y', 'z')
+NORMAL_FIELDS = ('nx', 'ny', 'nz')
+
+
+def transform_vertices(vertices, matrix, out):
+    """
+    Write the vertices, transformed by matrix, into the structured array out,
+    copying the other fields of out unchanged.
+    """
+    positions = np.column_stack([vertices[axis].astype(np.float64) for axis in POSITION_FIELDS])
+    positions = positions @ matrix[:3, :3].T + matrix[:3, 3]
+    for i, axis in enumerate(POSITION_FIELDS):
+        out[axis] = positions[:, i]
+
+    if all(name in out.dtype.names for name in NORMAL_FIELDS):
+        normals = np.column_stack([vertices[name].astype(np.float64) for name in NORMAL_FIELDS])
+        normals = normals @ np.linalg.inv(matrix[:3, :3])
+        lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+        normals /= np.where(lengths > 0, lengths, 1.0)
+        for i, name in enumerate(NORMAL_FIELDS):
+            out[name] = normals[:, i]
+
+    for name in out.dtype.names:
+        if name not in POSITION_FIELDS + NORMAL_FIELDS:
+            out[name] = vertices[name]
+
+
+def select_models(models, selectors):
+    """
+    Config models matching any selector: a model id, a model name or a
+    source stem, which may contain shell wildcards. Keeps the config order.
+    """
+    selected = []
+    for selector in selectors:
+        matches = [model for model in models
+                   if selector in (model['id'], model['name']) or fnmatch.fnmatchcase(source_stem(model), selector)]
+        if not matches:
+            raise ValueError(f"No model in the config matches {selector!r}")
+        selected += [model for model in matches if model not in selected]
+    return [model for model in models if model in selected]
+
+
+def merged_dtype(dtypes):
+    """
+    Vertex layout of the merged file: the properties present in every part,
+    in the order and byte order of the first, with float positions and normals.
+    """
+    first = dtypes[0]
+    byte_order = '>' if first.fields['x'][0].str[0] == '>' else '<'
+    fields = []
+    for name in first.names:
+        if not all(name in dtype.names for dtype in dtypes[1:]):
+            continue
+        field_type = first.fields[name][0]
+        if name in POSITION_FIELDS + NORMAL_FIELDS and field_type.kind != 'f':
+            field_type = np.dtype(byte_order + 'f4')
+        fields.append((name, field_type))
+    return np.dtype(fields)
+
+
+def merge_parts(parts, output_path, dedupe_size=DEFAULT_DEDUPE_SIZE):
+    """
+    Transform and merge PLY parts into one binary PLY file. parts is a list
+    of (path, matrix) pairs; points sharing a cell of the dedupe_size grid
+    with an earlier point are dropped (0 keeps exact duplicates out only,
+    None keeps all points). Returns a dict of statistics.
+    """
+    sources = [map_vertices(path) for path, _ in parts]
+    for (path, _), (header, dtype, _, _) in zip(parts, sources):
+        if not all(axis in dtype.names for axis in POSITION_FIELDS):
+            raise ValueError(f"PLY file has no x, y and z vertex properties: {path}")
+    out_dtype = merged_dtype([dtype for _, dtype, _, _ in sources])
+    dropped = sorted({name for _, dtype, _, _ in sources for name in dtype.names} - set(out_dtype.names))
+
+    # The transformed records go to a headerless temporary file first, so the
+    # duplicates can be found over all parts before the final file is written
+    records_path = f"{output_path}.records.part"
+    total = 0
+    try:
+        with open(records_path, 'wb') as records_f:
+            for (path, matrix), (header, dtype, data_offset, available) in zip(parts, sources):
+                if available == 0:
+                    continue
+                vertices = np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+                for start in range(0, available, MERGE_CHUNK_ROWS):
+                    block = vertices[start:start + MERGE_CHUNK_ROWS]
+                    out = np.empty(len(block), dtype=out_dtype)
+                    transform_vertices(block, matrix, out)
+                    records_f.write(out.view(np.uint8))
+                total += available
+                del vertices
+
+        merged = np.memmap(records_path, dtype=out_dtype, mode='r', shape=(total,)) if total \
+            else np.empty(0, dtype=out_dtype)
+        duplicates = duplicate_mask(merged, dedupe_size) if dedupe_size is not None and total \
+            else np.zeros(total, dtype=bool)
+        kept = total - int(np.count_nonzero(duplicates))
+
+        header_bytes = format_header(sources[0][0], {'vertex': kept}, out_dtype, [f"merged from {len(parts)} parts"])
+        partial = f"{output_path}.part"
+        with open(partial, 'wb') as output_f:
+            output_f.write(header_bytes)
+            for start in range(0, total, MERGE_CHUNK_ROWS):
+                block = merged[start:start + MERGE_CHUNK_ROWS][~duplicates[start:start + MERGE_CHUNK_ROWS]]
+                output_f.write(block.view(np.uint8))
+        del merged
+        os.replace(partial, output_path)
+    finally:
+        if os.path.exists(records_path):
+            os.remove(records_path)
+
+    return {
+        'input_points': total,
+        'output_points': kept,
+        'duplicates': total - kept,
+        'dropped_properties': dropped,
+        'bytes_written': os.path.getsize(output_path),
+    }
+
+
+def merged_model(parts, name, label, tile_index=None):
+    """
+    Config entry for the merged asset, replacing the given part models.
+    Display settings are taken from the first part.
+    """
+    first = parts[0]
+    model = {
+        'id': f"merged-{name}",
+        'url': f"/models/compressed/{name}_ultra_low.ply.gz",
+        'urls': {quality: f"/models/compressed/{name}_{quality}.ply.gz" for quality in QUALITY_LEVELS},
+        'dracoUrls': {quality: f"/models/draco/{name}_{quality}.drc" for quality in QUALITY_LEVELS},
+        'name': label,
+        'position': [0, 0, 0],
+        'rotation': [0, 0, 0],
+        'scale': [1, 1, 1],
+    }
+    for key in ('pointSize', 'color', 'visible', 'useDraco'):
+        if key in first:
+            model[key] = first[key]
+    if tile_index:
+        model['tileIndex'] = tile_index
+    return model
+
+
+def default_name(stems):
+    """
+    Name of the merged source: the common prefix of the part names, e.g.
+    "scan_22-merged" for scan_22-main and scan_22-remain.
+    """
+    prefix = os.path.commonprefix(stems).rstrip('-_')
+    return f"{prefix or 'merged'}-merged"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bake the config transforms of several scan parts into their "
+                                                 "vertices and merge them into one model.")
+    parser.add_argument('parts', nargs='+',
+                        help="models to merge, by id, name or source file stem (wildcards allowed, e.g. "
+                             "'Untitled_Scan-2025-Aug-05_22-*')")
+    parser.add_argument('--config', default=DEFAULT_MODELS_CONFIG,
+                        help=f"viewer model config (default: {DEFAULT_MODELS_CONFIG})")
+    parser.add_argument('--models-dir', default=os.path.join('public', 'models'),
+                        help="directory of the source PLY files; the merged file is written here too "
+                             "(default: public/models)")
+    parser.add_argument('--name', help="file stem of the merged source (default: common prefix of the parts "
+                                       "+ '-merged')")
+    parser.add_argument('--label', help="display name of the merged model (default: --name)")
+    parser.add_argument('--dedupe', type=float, default=DEFAULT_DEDUPE_SIZE, metavar='SIZE',
+                        help="drop merged points within the same SIZE grid cell as an earlier point; 0 drops "
+                             f"exact duplicates only (default: {DEFAULT_DEDUPE_SIZE:g})")
+    parser.add_argument('--no-dedupe', action='store_true', help="keep every point")
+    parser.add_argument('--tile', action='store_true',
+                        help="also split the merged file into octree tiles in <models-dir>/tiles/<name>")
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS,
+                        help=f"most points per tile with --tile (default: {DEFAULT_MAX_POINTS})")
+    parser.add_argument('--output-config', metavar='FILE',
+                        help="updated config to write (default: the config name with a -merged suffix)")
+    args = parser.parse_args(argv)
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    try:
+        parts = select_models(config['models'], args.parts)
+    except ValueError as e:
+        sys.exit(str(e))
+    if len(parts) < 2:
+        sys.exit("Select at least two models to merge")
+
+    models_dir = Path(args.models_dir)
+    stems = [source_stem(model) for model in parts]
+    sources = [models_dir / f"{stem}.ply" for stem in stems]
+    missing = [str(path) for path in sources if not path.is_file()]
+    if missing:
+        sys.exit(f"Source PLY files not found: {', '.join(missing)}")
+
+    name = args.name or default_name(stems)
+    output_path = models_dir / f"{name}.ply"
+    print(f"Merging {len(parts)} models into {output_path}:")
+    for model, path in zip(parts, sources):
+        print(f"  - {model['name']} ({path.name}): position {model['position']}, rotation {model['rotation']}, "
+              f"scale {model['scale']}")
+
+    start_time = time.perf_counter()
+    matrices = [transform_matrix(model['position'], model['rotation'], model['scale']) for model in parts]
+    stats = merge_parts([(str(path), matrix) for path, matrix in zip(sources, matrices)], str(output_path),
+                        None if args.no_dedupe else args.dedupe)
+    print(f"Wrote {stats['output_points']:,} of {stats['input_points']:,} points "
+          f"({stats['duplicates']:,} duplicates removed, {stats['bytes_written'] / (1024 * 1024):.1f} MB) "
+          f"in {time.perf_counter() - start_time:.1f} s")
+    if stats['dropped_properties']:
+        print(f"Dropped properties missing from some parts: {', '.join(stats['dropped_properties'])}")
+
+    tile_index = None
+    if args.tile:
+        tiles_dir = models_dir / 'tiles' / name
+        index = write_tiles(str(output_path), str(tiles_dir), args.max_points, compress=True)
+        tile_index = f"/models/tiles/{name}/index.json"
+        print(f"Tiled into {len(index['nodes'])} tiles in {tiles_dir}")
+
+    # The merged model takes the place of the first part
+    merged = merged_model(parts, name, args.label or name, tile_index)
+    models = []
+    for model in config['models']:
+        if model is parts[0]:
+            models.append(merged)
+        elif model not in parts:
+            models.append(model)
+    config['models'] = models
+
+    config_path = args.output_config or str(Path(args.config).with_name(Path(args.config).stem + '-merged.json'))
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    print(f"Updated config written to {config_path}")
+    print(f"Build its quality levels with: python tools/batch_compress.py --models-dir {models_dir}"
+          + (" --draco ultra_low,low,medium,high" if merged.get('useDraco') else ''))
+
+
+if __name__ == '__main__':
+    main()
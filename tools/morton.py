@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Morton Codes
+Vectorized 3D Morton (Z-order) encoding for point clouds. Positions are
+quantized onto a 2^21 grid over a cube around the bounding box and the bits
+of the three cell coordinates are interleaved into one 63-bit code, so that
+sorting by code groups points by octree cell at every depth.
+"""
+
+import numpy as np
+
+# Bits per axis; three axes fill 63 bits of a uint64
+MORTON_BITS = 21
+
+# Vertices encoded at a time, to bound temporary memory on large inputs
+MORTON_CHUNK_ROWS = 4 * 1024 * 1024
+
+
+def bounding_cube(vertices):
+    """
+    Origin and edge length of the smallest axis-aligned cube holding all
+    vertices (anything with 'x', 'y' and 'z' fields).
+    """
+    mins = np.array([vertices[axis].min() for axis in 'xyz'], dtype=np.float64)
+    maxs = np.array([vertices[axis].max() for axis in 'xyz'], dtype=np.float64)
+    size = float((maxs - mins).max())
+    return mins, size if size > 0 else 1.0
+
+
+def _spread_bits(values):
+    """
+    Insert two zero bits between each of the low 21 bits.
+    """
+    values = values & np.uint64(0x1fffff)
+    values = (values | values << np.uint64(32)) & np.uint64(0x1f00000000ffff)
+    values = (values | values << np.uint64(16)) & np.uint64(0x1f0000ff0000ff)
+    values = (values | values << np.uint64(8)) & np.uint64(0x100f00f00f00f00f)
+    values = (values | values << np.uint64(4)) & np.uint64(0x10c30c30c30c30c3)
+    values = (values | values << np.uint64(2)) & np.uint64(0x1249249249249249)
+    return values
+
+
+def _compact_bits(code):
+    """
+    Inverse of _spread_bits for a single Python integer.
+    """
+    value = 0
+    for bit in range(MORTON_BITS):
+        value |= ((code >> (3 * bit)) & 1) << bit
+    return value
+
+
+def morton_codes(vertices, origin=None, size=None):
+    """
+    Morton code of every vertex within the cube (origin, size), which
+    defaults to the bounding cube of the vertices. x takes the most
+    significant bit of each 3-bit group, so at every octree depth the child
+    index is (x_bit << 2) | (y_bit << 1) | z_bit.
+    """
+    if origin is None or size is None:
+        origin, size = bounding_cube(vertices)
+
+    scale = (1 << MORTON_BITS) / size
+    codes = np.empty(len(vertices), dtype=np.uint64)
+
+    for start in range(0, len(vertices), MORTON_CHUNK_ROWS):
+        block = vertices[start:start + MORTON_CHUNK_ROWS]
+        block_codes = codes[start:start + MORTON_CHUNK_ROWS]
+        block_codes[:] = 0
+        for i, axis in enumerate('xyz'):
+            cells = np.clip((block[axis] - origin[i]) * scale, 0, (1 << MORTON_BITS) - 1).astype(np.uint64)
+            block_codes |= _spread_bits(cells) << np.uint64(2 - i)
+
+    return codes
+
+
+def cell_bounds(level, key, origin, size):
+    """
+    Bounds [min_x, min_y, min_z, max_x, max_y, max_z] of the octree cell at
+    the given depth whose Morton prefix is key.
+    """
+    cell_size = size / (1 << level)
+    cell = [_compact_bits(int(key) >> (2 - i)) for i in range(3)]
+    mins = [float(origin[i]) + cell[i] * cell_size for i in range(3)]
+    return mins + [value + cell_size for value in mins]
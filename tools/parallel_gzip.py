@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Parallel Gzip Writer
+pigz-style gzip compression: the input is cut into independent blocks that are
+deflated on a thread pool (zlib releases the GIL), each block primed with the
+last 32 KB of the previous one. The blocks are stitched back together into a
+single standard gzip stream that any inflater (gzip, pako) can decode.
+"""
+
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Uncompressed bytes per independently compressed block
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Deflate window size, used as the dictionary carried between blocks
+DICTIONARY_SIZE = 32 * 1024
+
+
+def _compress_block(block, dictionary, compresslevel):
+    """
+    Deflate one block as raw deflate data ending on a byte boundary.
+    Returns the data and the CPU time the worker thread spent on it.
+    """
+    cpu_start = time.thread_time()
+    if dictionary:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS,
+                                      zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    else:
+        compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+    data = compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data, time.thread_time() - cpu_start
+
+
+class ParallelGzipWriter:
+    """
+    Write-only file object producing a gzip file with multi-threaded compression.
+    bytes_in and bytes_out count the uncompressed and compressed bytes,
+    compress_seconds the CPU time of all compression threads and wait_seconds
+    the time the writer blocked waiting for them.
+    """
+
+    def __init__(self, filename, compresslevel=9, threads=None, block_size=DEFAULT_BLOCK_SIZE, mtime=None):
+        self.compresslevel = compresslevel
+        self.block_size = block_size
+        self.threads = threads or os.cpu_count() or 1
+
+        self._file = open(filename, 'wb')
+        self._executor = ThreadPoolExecutor(max_workers=self.threads)
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._dictionary = b''
+        self._crc = 0
+        self._size = 0
+        self.bytes_out = 0
+        self.compress_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.closed = False
+
+        self._write_header(int(time.time()) if mtime is None else mtime)
+
+    def _write_header(self, mtime):
+        # Extra flags follow the gzip module: 2 = best compression, 4 = fastest
+        xfl = 2 if self.compresslevel == 9 else 4 if self.compresslevel == 1 else 0
+        self._write_raw(b'\x1f\x8b\x08\x00' + struct.pack('<I', mtime & 0xffffffff) + bytes([xfl, 255]))
+
+    @property
+    def bytes_in(self):
+        return self._size
+
+    def _write_raw(self, data):
+        self._file.write(data)
+        self.bytes_out += len(data)
+
+    def _write_finished_block(self):
+        wait_start = time.perf_counter()
+        data, cpu_seconds = self._pending.popleft().result()
+        self.wait_seconds += time.perf_counter() - wait_start
+        self.compress_seconds += cpu_seconds
+        self._write_raw(data)
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("write to closed file")
+
+        view = memoryview(data).cast('B')
+        size = len(view)
+        self._crc = zlib.crc32(view, self._crc)
+        self._size += size
+
+        # Top up a partially filled block first, then cut whole blocks straight from the input
+        offset = 0
+        if self._buffer:
+            offset = min(size, self.block_size - len(self._buffer))
+            self._buffer += view[:offset]
+            if len(self._buffer) == self.block_size:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+
+        while size - offset >= self.block_size:
+            self._submit(bytes(view[offset:offset + self.block_size]))
+            offset += self.block_size
+
+        self._buffer += view[offset:]
+        return size
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(_compress_block, block, self._dictionary, self.compresslevel))
+        self._dictionary = block[-DICTIONARY_SIZE:]
+
+        # Bound memory by writing out finished blocks in order
+        while len(self._pending) > self.threads * 2:
+            self._write_finished_block()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._buffer:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._write_finished_block()
+
+            # Empty final block, then the CRC32 and length trailer
+            self._write_raw(zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS).flush())
+            self._write_raw(struct.pack('<II', self._crc, self._size & 0xffffffff))
+        finally:
+            self.closed = True
+            self._executor.shutdown()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Path-Aware Sampling
+Spends the point budget of an output where visitors actually walk. Every
+vertex gets its distance to the walking path polyline (in world space, after
+the model's placement transform) and a weight that falls off with it,
+
+    weight = 1 / (1 + (distance / falloff) ** 2)
+
+so geometry within about `falloff` of the path is kept densely and far-away
+geometry thins out smoothly. Exactly the requested number of vertices is then
+drawn without replacement with probabilities proportional to the weights,
+using one random key per vertex (Efraimidis-Spirakis: an exponential variate
+divided by the weight, smallest keys first). The keys are shared by all
+outputs of a run, so every smaller output is a subset of every larger one.
+
+Distances use a k-d tree over points resampled along the path every
+falloff / PATH_SAMPLES_PER_FALLOFF, which finds the segments of the nearest
+few path samples of each vertex; the exact distances to those segments are
+then computed and the smallest kept. The tree comes from scipy, which is
+optional (pip install scipy).
+"""
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# Distance from the path (scene units, metres) at which the keep weight halves
+DEFAULT_PATH_FALLOFF = 3.0
+
+# Path resampling density of the segment index
+PATH_SAMPLES_PER_FALLOFF = 8
+# Nearest path samples whose segments are measured for every vertex
+PATH_CANDIDATES = 4
+
+# Vertices processed at a time
+PATH_CHUNK_ROWS = 1024 * 1024
+
+# Seed of the sampling keys, so rebuilds write the same vertices
+PATH_SEED = 0
+
+
+def path_sampling_available():
+    return cKDTree is not None
+
+
+def _resample_path(path_points, spacing):
+    """
+    Points every `spacing` along the polyline, with the index of the segment
+    each one lies on.
+    """
+    starts, ends = path_points[:-1], path_points[1:]
+    lengths = np.linalg.norm(ends - starts, axis=1)
+    counts = np.maximum(1, np.ceil(lengths / spacing).astype(np.int64))
+    segments = np.repeat(np.arange(len(starts)), counts)
+    # Fraction along its segment of every sample
+    offsets = np.arange(len(segments)) - np.repeat(np.cumsum(counts) - counts, counts)
+    fractions = (offsets / counts[segments])[:, None]
+    samples = starts[segments] + fractions * (ends[segments] - starts[segments])
+    return np.vstack([samples, path_points[-1:]]), np.append(segments, len(starts) - 1)
+
+
+def path_distances(vertices, path_points, transform=None, falloff=DEFAULT_PATH_FALLOFF, indices=None):
+    """
+    Distance of every vertex (or of the vertices at the given indices) to
+    the path polyline. transform is the 4x4 placement of the model in the
+    world space of the path.
+    """
+    if cKDTree is None:
+        raise RuntimeError("Path sampling needs the scipy package (pip install scipy)")
+    path_points = np.asarray(path_points, dtype=np.float64).reshape(-1, 3)
+    if len(path_points) == 1:
+        path_points = np.vstack([path_points, path_points])
+    samples, sample_segments = _resample_path(path_points, falloff / PATH_SAMPLES_PER_FALLOFF)
+    tree = cKDTree(samples)
+    starts, directions = path_points[:-1], np.diff(path_points, axis=0)
+    lengths_squared = np.maximum((directions ** 2).sum(axis=1), np.finfo(np.float64).tiny)
+
+    count = len(vertices) if indices is None else len(indices)
+    distances = np.empty(count, dtype=np.float64)
+    for start in range(0, count, PATH_CHUNK_ROWS):
+        block = vertices[start:start + PATH_CHUNK_ROWS] if indices is None \
+            else vertices[indices[start:start + PATH_CHUNK_ROWS]]
+        positions = np.column_stack([block[axis].astype(np.float64) for axis in 'xyz'])
+        if transform is not None:
+            transform = np.asarray(transform, dtype=np.float64)
+            positions = positions @ transform[:3, :3].T + transform[:3, 3]
+
+        _, nearest = tree.query(positions, k=min(PATH_CANDIDATES, len(samples)), workers=-1)
+        segments = sample_segments[nearest.reshape(len(positions), -1)]
+        # Exact distance to the segments of the nearest path samples
+        offsets = positions[:, None, :] - starts[segments]
+        t = np.clip((offsets * directions[segments]).sum(axis=2) / lengths_squared[segments], 0.0, 1.0)
+        nearest_points = offsets - t[..., None] * directions[segments]
+        distances[start:start + len(block)] = np.sqrt((nearest_points ** 2).sum(axis=2).min(axis=1))
+    return distances
+
+
+def path_sample_keys(vertices, path_points, transform=None, falloff=DEFAULT_PATH_FALLOFF, indices=None,
+                     seed=PATH_SEED):
+    """
+    Sampling key of every vertex (or of the vertices at the given indices):
+    keeping the n smallest keys draws n vertices weighted by closeness to
+    the path.
+    """
+    distances = path_distances(vertices, path_points, transform, falloff, indices)
+    weights = 1.0 / (1.0 + (distances / falloff) ** 2)
+    return np.random.default_rng(seed).standard_exponential(len(weights)) / weights
+
+
+def select_smallest(keys, count):
+    """
+    Sorted positions of the count smallest keys.
+    """
+    if count >= len(keys):
+        return np.arange(len(keys), dtype=np.int64)
+    if count <= 0:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.argpartition(keys, count - 1)[:count])
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+PLY I/O
+Shared PLY header parser and reader for the tools. A header is compiled once
+into NumPy structured dtypes, one per element, and the element data is handed
+back as memory-mapped, zero-copy views. All PLY scalar types (both the PLY 1.0
+names and the sized aliases such as float32 or uint8), little- and big-endian
+data, list properties and trailing elements such as faces are supported.
+Parsed headers can be cached per file, keyed by path, size and mtime.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+# PLY scalar types and their NumPy equivalents
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1',
+    'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2',
+    'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4',
+    'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4',
+    'double': 'f8', 'float64': 'f8',
+}
+
+# PLY 1.0 type name for every NumPy scalar type, used when writing headers
+PLY_TYPE_NAMES = {
+    'i1': 'char', 'u1': 'uchar',
+    'i2': 'short', 'u2': 'ushort',
+    'i4': 'int', 'u4': 'uint',
+    'f4': 'float', 'f8': 'double',
+}
+
+# Byte order of each binary format
+PLY_FORMATS = {
+    'binary_little_endian': '<',
+    'binary_big_endian': '>',
+    'ascii': None,
+}
+
+
+class PLYElement:
+    """
+    One element of a PLY header (e.g. vertex or face) and its properties.
+    Each property is a (name, type, list_count_type) tuple, where
+    list_count_type is None for scalar properties.
+    """
+
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []
+
+    @property
+    def has_lists(self):
+        return any(count_type is not None for _, _, count_type in self.properties)
+
+    def dtype(self, byte_order='<', list_length=None):
+        """
+        Structured dtype of one record. Elements with list properties only
+        have a fixed layout if every list holds list_length items; the item
+        count of each list is then stored in a '<name>_count' field.
+        """
+        fields = []
+        for name, prop_type, count_type in self.properties:
+            if count_type is not None:
+                if list_length is None:
+                    raise ValueError(f"Element '{self.name}' has variable-length list properties")
+                fields.append((f"{name}_count", byte_order + _numpy_type(count_type)))
+                fields.append((name, byte_order + _numpy_type(prop_type), (list_length,)))
+            else:
+                fields.append((name, byte_order + _numpy_type(prop_type)))
+        return np.dtype(fields)
+
+
+class PLYHeader:
+    """
+    Parsed PLY header.
+    lines holds the original (stripped) header lines, header_size the number
+    of bytes up to and including end_header.
+    """
+
+    def __init__(self):
+        self.format = None
+        self.version = None
+        self.lines = []
+        self.elements = []
+        self.header_size = 0
+
+    @property
+    def byte_order(self):
+        return PLY_FORMATS.get(self.format)
+
+    @property
+    def is_binary(self):
+        return self.byte_order is not None
+
+    def element(self, name):
+        for element in self.elements:
+            if element.name == name:
+                return element
+        return None
+
+    @property
+    def vertex(self):
+        return self.element('vertex')
+
+    @property
+    def vertex_count(self):
+        vertex = self.vertex
+        return vertex.count if vertex else 0
+
+    def vertex_dtype(self):
+        vertex = self.vertex
+        if vertex is None:
+            raise ValueError("PLY file has no vertex element")
+        return vertex.dtype(self.byte_order or '<')
+
+
+def _numpy_type(ply_type):
+    if ply_type not in PLY_TYPES:
+        raise ValueError(f"Unsupported PLY property type: {ply_type}")
+    return PLY_TYPES[ply_type]
+
+
+def read_header(input_f):
+    """
+    Parse a PLY header from an open binary file, leaving the file position at
+    the start of the element data.
+    """
+    header = PLYHeader()
+
+    line = input_f.readline().decode('ascii').strip()
+    header.lines.append(line)
+
+    if line != 'ply':
+        raise ValueError("Not a valid PLY file")
+
+    while True:
+        raw = input_f.readline()
+        if not raw:
+            raise ValueError("PLY header is missing end_header")
+        line = raw.decode('ascii').strip()
+        header.lines.append(line)
+        parts = line.split()
+
+        if not parts:
+            continue
+        elif parts[0] == 'format':
+            header.format = parts[1]
+            header.version = parts[2] if len(parts) > 2 else None
+            if header.format not in PLY_FORMATS:
+                raise ValueError(f"Unknown PLY format: {header.format}")
+        elif parts[0] == 'element':
+            header.elements.append(PLYElement(parts[1], int(parts[2])))
+        elif parts[0] == 'property':
+            if not header.elements:
+                raise ValueError("PLY property declared before any element")
+            if parts[1] == 'list':
+                header.elements[-1].properties.append((parts[4], parts[3], parts[2]))
+            else:
+                header.elements[-1].properties.append((parts[2], parts[1], None))
+        elif parts[0] == 'end_header':
+            break
+
+    header.header_size = input_f.tell()
+    return header
+
+
+def read_ply_header(file_path):
+    """
+    Parse the header of the PLY file at file_path.
+    """
+    with open(file_path, 'rb') as f:
+        return read_header(f)
+
+
+class HeaderCache:
+    """
+    Thread-safe cache of parsed headers. Each entry is a dict with the
+    'header', the file 'size' and its 'mtime_ns'.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, file_path):
+        """
+        Entry for file_path, re-parsing the header only if the file's size or
+        mtime changed since it was cached.
+        """
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+
+        entry = {'header': read_ply_header(file_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        with self._lock:
+            self._entries[file_path] = entry
+        return entry
+
+    def peek(self, file_path):
+        """
+        Last cached entry for file_path without touching the disk, or None.
+        """
+        with self._lock:
+            return self._entries.get(file_path)
+
+
+def map_elements(file_path, header=None):
+    """
+    Memory-map every element of a binary PLY file.
+    Returns the header and a dict mapping element names to zero-copy
+    structured arrays. Records are truncated to those actually present in the
+    file. Elements with variable-length lists are returned as raw uint8 views
+    of their bytes.
+    """
+    if header is None:
+        header = read_ply_header(file_path)
+    if not header.is_binary:
+        raise ValueError(f"Only binary PLY files are supported: {file_path}")
+
+    file_size = os.path.getsize(file_path)
+    offset = header.header_size
+    views = {}
+
+    for element in header.elements:
+        view, size = _map_element(file_path, element, header.byte_order, offset, file_size)
+        views[element.name] = view
+        offset += size
+
+    return header, views
+
+
+def element_offset(file_path, header, name):
+    """
+    Byte offset of an element's data, skipping over any elements before it.
+    """
+    file_size = os.path.getsize(file_path)
+    offset = header.header_size
+    for element in header.elements:
+        if element.name == name:
+            return offset
+        _, size = _map_element(file_path, element, header.byte_order, offset, file_size)
+        offset += size
+    raise ValueError(f"PLY file has no '{name}' element")
+
+
+def map_vertices(file_path, header=None):
+    """
+    Memory-map the vertex element of a binary PLY file.
+    Returns the header, the vertex dtype, the byte offset of the vertex data
+    and the number of complete vertex records present.
+    """
+    if header is None:
+        header = read_ply_header(file_path)
+    if not header.is_binary:
+        raise ValueError(f"Only binary PLY files are supported: {file_path}")
+
+    dtype = header.vertex_dtype()
+    offset = element_offset(file_path, header, 'vertex')
+    available = min(header.vertex_count, max(0, os.path.getsize(file_path) - offset) // dtype.itemsize)
+    return header, dtype, offset, available
+
+
+def _map_element(file_path, element, byte_order, offset, file_size):
+    """
+    Map one element starting at offset. Returns the view and the element's
+    size in bytes.
+    """
+    if not element.has_lists:
+        return _map_fixed(file_path, element.dtype(byte_order), element.count, offset, file_size)
+
+    if element.count == 0:
+        return np.empty(0, dtype=np.uint8), 0
+
+    # Lists of a single length (e.g. triangle faces) still have a fixed record
+    # layout; take the length from the first record and verify it on all
+    data = np.memmap(file_path, dtype=np.uint8, mode='r', offset=offset, shape=(file_size - offset,))
+    list_length = _first_list_length(element, byte_order, data)
+    dtype = element.dtype(byte_order, list_length)
+    view, size = _map_fixed(file_path, dtype, element.count, offset, file_size)
+
+    if len(view) == element.count and all(
+            np.all(view[f"{name}_count"] == list_length)
+            for name, _, count_type in element.properties if count_type is not None):
+        return view, size
+
+    # Variable-length lists have to be walked record by record
+    size = _walk_element(element, byte_order, data)
+    return data[:size], size
+
+
+def _map_fixed(file_path, dtype, count, offset, file_size):
+    available = min(count, max(0, file_size - offset) // dtype.itemsize)
+    if available == 0:
+        return np.empty(0, dtype=dtype), count * dtype.itemsize
+    view = np.memmap(file_path, dtype=dtype, mode='r', offset=offset, shape=(available,))
+    return view, count * dtype.itemsize
+
+
+def _first_list_length(element, byte_order, data):
+    """
+    Item count of the first list property of the first record.
+    """
+    position = 0
+    for _, prop_type, count_type in element.properties:
+        if count_type is None:
+            position += np.dtype(_numpy_type(prop_type)).itemsize
+        else:
+            count_dtype = np.dtype(byte_order + _numpy_type(count_type))
+            return int(data[position:position + count_dtype.itemsize].view(count_dtype)[0])
+    return 0
+
+
+def _walk_element(element, byte_order, data):
+    """
+    Size in bytes of an element with variable-length lists.
+    """
+    position = 0
+    layout = []
+    for _, prop_type, count_type in element.properties:
+        item_size = np.dtype(_numpy_type(prop_type)).itemsize
+        if count_type is None:
+            layout.append((item_size, None))
+        else:
+            layout.append((item_size, np.dtype(byte_order + _numpy_type(count_type))))
+
+    raw = memoryview(data)
+    for _ in range(element.count):
+        for item_size, count_dtype in layout:
+            if count_dtype is None:
+                position += item_size
+            else:
+                count = int(np.frombuffer(raw[position:position + count_dtype.itemsize], dtype=count_dtype)[0])
+                position += count_dtype.itemsize + count * item_size
+    return position
+
+
+def format_header(header, element_counts, vertex_dtype=None, comments=()):
+    """
+    Header text for an output holding only the elements in element_counts,
+    with their counts replaced. Lines of all other elements are dropped.
+    If vertex_dtype is given the vertex property lines are regenerated from
+    it; extra comments are added after the format line.
+    """
+    lines = []
+    current = None
+
+    for line in header.lines:
+        parts = line.split()
+        keyword = parts[0] if parts else ''
+
+        if keyword == 'element':
+            current = parts[1]
+            if current in element_counts:
+                lines.append(f"element {current} {element_counts[current]}")
+                if current == 'vertex' and vertex_dtype is not None:
+                    lines.extend(_property_lines(vertex_dtype))
+            continue
+        if keyword == 'property':
+            if current in element_counts and not (current == 'vertex' and vertex_dtype is not None):
+                lines.append(line)
+            continue
+        if keyword == 'end_header':
+            current = None
+
+        lines.append(line)
+        if keyword == 'format':
+            lines.extend(f"comment {comment}" for comment in comments)
+
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def _property_lines(dtype):
+    lines = []
+    for name in dtype.names:
+        field_type = dtype.fields[name][0]
+        lines.append(f"property {PLY_TYPE_NAMES[field_type.base.str[1:]]} {name}")
+    return lines
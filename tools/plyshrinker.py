@@ -1,9 +1,33 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import numpy as np
 import os
-import struct
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from plyio import HeaderCache
+from shrink_engine import shrink_ply_file, stride_plan, DEFAULT_CHUNK_SIZE, SAMPLING_MODES
+from quantize import DEFAULT_POSITION_BITS
+from size_estimate import estimate_levels, interpolate_estimate, download_seconds
+from batch_compress import QUALITY_LEVELS, PROJECT_ROOT, file_shrink_options
+from scene_config import load_model_transforms, load_path_points, DEFAULT_MODELS_CONFIG, DEFAULT_PATH_CONFIG
+
+# Threads parsing headers in the background; header reads are I/O bound
+ANALYSIS_WORKERS = 8
+# Files shrunk at the same time in batch mode
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
+# Milliseconds between progress bar updates while processing
+PROGRESS_INTERVAL = 100
+# Failures listed individually in the batch summary
+MAX_LISTED_ERRORS = 20
+# Connection speed assumed for the expected download times, in Mbit/s
+DOWNLOAD_MBIT_PER_S = 20
+# Size estimates kept for files and option combinations seen recently
+ESTIMATE_CACHE_ENTRIES = 1024
+
+class ProcessingCancelled(Exception):
+    """
+    Raised from the progress callback to stop a file when the user cancels.
+    """
 
 class PLYShrinker:
     def __init__(self, root):
@@ -16,6 +40,23 @@ class PLYShrinker:
         self.ply_data = None
         self.processing = False
         
+        # Parsed headers, filled in by the analysis workers
+        self.header_cache = HeaderCache()
+        self.analysis_errors = {}
+        self.analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS)
+        self.refresh_scheduled = False
+        
+        # Output size estimates, computed on the same workers
+        self.estimate_cache = {}
+        self.estimates_pending = set()
+        
+        # Processing state shared with the worker threads
+        self.cancel_event = threading.Event()
+        self.progress_lock = threading.Lock()
+        self.progress_done = {}
+        self.progress_total = 0
+        self.progress_text = ""
+        
         self.setup_ui()
     
     def setup_ui(self):
@@ -125,6 +166,51 @@ class PLYShrinker:
         ttk.Button(preset_frame, text="High (100%)", 
                   command=lambda: self.set_resolution(1.0)).pack(side=tk.LEFT, padx=5)
         
+        # Streaming mode for inputs larger than available memory
+        streaming_frame = ttk.Frame(resolution_frame)
+        streaming_frame.grid(row=2, column=0, columnspan=3, sticky=tk.W)
+        
+        self.streaming_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(streaming_frame, text="Low-memory streaming", 
+                       variable=self.streaming_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(streaming_frame, text="Chunk size (MB):").pack(side=tk.LEFT, padx=(10, 5))
+        self.chunk_size_var = tk.IntVar(value=DEFAULT_CHUNK_SIZE // (1024*1024))
+        ttk.Spinbox(streaming_frame, from_=1, to=4096, width=6, 
+                   textvariable=self.chunk_size_var).pack(side=tk.LEFT)
+        
+        # Sampling strategy
+        sampling_frame = ttk.Frame(resolution_frame)
+        sampling_frame.grid(row=3, column=0, columnspan=3, sticky=tk.W, pady=(5, 0))
+        
+        ttk.Label(sampling_frame, text="Sampling:").pack(side=tk.LEFT, padx=5)
+        self.sampling_var = tk.StringVar(value="stride")
+        ttk.Combobox(sampling_frame, textvariable=self.sampling_var, values=SAMPLING_MODES, 
+                    state="readonly", width=8).pack(side=tk.LEFT)
+        ttk.Label(sampling_frame, text="Voxel size (blank = from resolution):").pack(side=tk.LEFT, padx=(10, 5))
+        self.voxel_size_var = tk.StringVar(value="")
+        ttk.Entry(sampling_frame, textvariable=self.voxel_size_var, width=8).pack(side=tk.LEFT)
+        self.voxel_centroid_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="Cell centroid", 
+                       variable=self.voxel_centroid_var).pack(side=tk.LEFT, padx=(10, 0))
+        self.morton_order_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="Morton order (smaller .gz)", 
+                       variable=self.morton_order_var).pack(side=tk.LEFT, padx=(10, 0))
+        self.quantize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(sampling_frame, text="16-bit positions", 
+                       variable=self.quantize_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Vertex properties to write
+        keep_frame = ttk.Frame(resolution_frame)
+        keep_frame.grid(row=4, column=0, columnspan=3, sticky=tk.W, pady=(5, 0))
+        
+        ttk.Label(keep_frame, text="Keep properties (blank = all):").pack(side=tk.LEFT, padx=5)
+        self.keep_var = tk.StringVar(value="")
+        ttk.Entry(keep_frame, textvariable=self.keep_var, width=40).pack(side=tk.LEFT)
+        
+        # The size estimates depend on these options
+        for var in (self.morton_order_var, self.quantize_var, self.keep_var):
+            var.trace_add('write', lambda *args: self.refresh_info())
+        
         # File info
         info_frame = ttk.LabelFrame(main_frame, text="File Information", padding="10")
         info_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=20)
@@ -137,10 +223,16 @@ class PLYShrinker:
         scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         self.info_text.configure(yscrollcommand=scrollbar.set)
         
-        # Process button
-        self.process_button = ttk.Button(main_frame, text="Process PLY File(s)", 
+        # Process and cancel buttons
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=5, column=0, columnspan=3, pady=20)
+        
+        self.process_button = ttk.Button(button_frame, text="Process PLY File(s)", 
                                         command=self.process_files, state="disabled")
-        self.process_button.grid(row=5, column=0, columnspan=3, pady=20)
+        self.process_button.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", 
+                                       command=self.cancel_processing, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
         
         # Progress frame
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
@@ -171,6 +263,7 @@ class PLYShrinker:
             self.single_frame.grid_remove()
             self.batch_frame.grid()
         self.check_ready()
+        self.load_ply_info()
     
     def add_input_files(self):
         files = filedialog.askopenfilenames(
@@ -185,12 +278,14 @@ class PLYShrinker:
         # Update the file count display
         self.update_file_count()
         self.check_ready()
+        self.load_ply_info()
     
     def clear_input_files(self):
         self.input_files.clear()
         self.file_listbox.delete(0, tk.END)
         self.update_file_count()
         self.check_ready()
+        self.refresh_info()
     
     def update_file_count(self):
         count = len(self.input_files)
@@ -232,6 +327,7 @@ class PLYShrinker:
                 del self.input_files[index]
             self.update_file_count()
             self.check_ready()
+            self.refresh_info()
     
     def show_file_info(self, event=None):
         selection = self.file_listbox.curselection()
@@ -294,9 +390,8 @@ class PLYShrinker:
         percentage = int(resolution * 100)
         self.resolution_label.config(text=f"{resolution:.2f} ({percentage}% of points)")
         
-        # Auto-update file information when resolution changes
-        if hasattr(self, 'input_file') and self.input_file:
-            self.load_ply_info()
+        # Only the estimates change with the resolution; the headers come from the cache
+        self.refresh_info()
     
     def set_resolution(self, value):
         self.resolution_var.set(value)
@@ -314,60 +409,176 @@ class PLYShrinker:
             self.process_button.config(state="disabled")
     
     def load_ply_info(self):
-        try:
-            if self.mode_var.get() == "single" and hasattr(self, 'input_file') and self.input_file:
+        # Parse the headers on the worker pool; files whose size and mtime are
+        # unchanged are answered from the cache without re-parsing
+        if self.mode_var.get() == "single":
+            file_paths = [self.input_file] if getattr(self, 'input_file', None) else []
+        else:
+            file_paths = list(self.input_files)
+        
+        for file_path in file_paths:
+            future = self.analysis_executor.submit(self.header_cache.get, file_path)
+            future.add_done_callback(lambda f, p=file_path: self.on_header_analyzed(p, f))
+        self.refresh_info()
+    
+    def on_header_analyzed(self, file_path, future):
+        # Runs on a worker thread; hand the result over to the Tk thread
+        error = future.exception()
+        self.root.after(0, lambda: self.header_analyzed(file_path, error))
+    
+    def header_analyzed(self, file_path, error):
+        if error is not None:
+            self.analysis_errors[file_path] = str(error)
+        else:
+            self.analysis_errors.pop(file_path, None)
+        
+        self.schedule_refresh()
+    
+    def schedule_refresh(self):
+        # Coalesce the refreshes of a large batch into one per idle period
+        if not self.refresh_scheduled:
+            self.refresh_scheduled = True
+            self.root.after_idle(self.refresh_info)
+    
+    def get_estimate_options(self):
+        # Only these options change the size of an output
+        return {
+            'morton_order': self.morton_order_var.get(),
+            'quantize_bits': DEFAULT_POSITION_BITS if self.quantize_var.get() else None,
+            'keep': self.get_keep_fields(),
+        }
+    
+    def get_estimates(self, file_path, levels):
+        """
+        Size estimates of a file's outputs at the given levels under the current
+        options, from the cache. Returns None while they are computed on the
+        analysis workers, and a dict with an 'error' entry if that failed.
+        Only the fixed quality levels are estimated from the file; the slider
+        resolution is interpolated from them, so dragging it reads nothing.
+        """
+        entry = self.header_cache.peek(file_path)
+        if entry is None:
+            return None
+        options = self.get_estimate_options()
+        key = (file_path, entry['size'], entry['mtime_ns'], tuple(levels.items()),
+               options['morton_order'], options['quantize_bits'], tuple(options['keep'] or ()))
+        if key in self.estimate_cache:
+            return self.estimate_cache[key]
+        
+        if key not in self.estimates_pending:
+            self.estimates_pending.add(key)
+            future = self.analysis_executor.submit(estimate_levels, file_path, levels, entry['header'], **options)
+            future.add_done_callback(lambda f: self.on_estimated(key, f))
+        return None
+    
+    def on_estimated(self, key, future):
+        # Runs on a worker thread; hand the result over to the Tk thread
+        error = future.exception()
+        result = {'error': str(error)} if error is not None else future.result()
+        self.root.after(0, lambda: self.estimated(key, result))
+    
+    def estimated(self, key, result):
+        self.estimates_pending.discard(key)
+        self.estimate_cache[key] = result
+        while len(self.estimate_cache) > ESTIMATE_CACHE_ENTRIES:
+            del self.estimate_cache[next(iter(self.estimate_cache))]
+        self.schedule_refresh()
+    
+    def format_output_size(self, estimate, input_size, fallback_size, error=None):
+        """
+        Expected reduction and output size lines, from a size estimate if one
+        is available and otherwise from the kept share of the input bytes.
+        """
+        if not estimate:
+            note = f"estimate failed: {error}" if error else "estimating compressed size..."
+            return [f"Expected File Reduction: {(1 - fallback_size / input_size) * 100 if input_size else 0:.1f}%",
+                    f"Expected Output Size: ~{fallback_size / (1024*1024):.2f} MB ({note})"]
+        seconds = download_seconds(estimate['gzip_bytes'], DOWNLOAD_MBIT_PER_S)
+        return [f"Expected File Reduction: {(1 - estimate['raw_bytes'] / input_size) * 100 if input_size else 0:.1f}%",
+                f"Expected Output Size: ~{estimate['raw_bytes'] / (1024*1024):.2f} MB, "
+                f"~{estimate['gzip_bytes'] / (1024*1024):.2f} MB gzipped ({seconds:.1f} s at {DOWNLOAD_MBIT_PER_S} Mbit/s)"]
+    
+    def format_estimates(self, estimates, files_estimated=None):
+        """
+        Table of output points, raw and gzip size and download time per level.
+        """
+        lines = [f"  {'Level':<12} {'Points':>13} {'Raw MB':>10} {'Gzip MB':>10} {'Download':>10}"]
+        for name, estimate in estimates.items():
+            seconds = download_seconds(estimate['gzip_bytes'], DOWNLOAD_MBIT_PER_S)
+            lines.append(f"  {name:<12} {estimate['output_points']:>13,} {estimate['raw_bytes'] / (1024*1024):>10.2f} "
+                         f"{estimate['gzip_bytes'] / (1024*1024):>10.2f} {seconds:>8.1f} s")
+        if files_estimated is not None:
+            lines.append(f"  (estimated for {files_estimated[0]} of {files_estimated[1]} files)")
+        return lines
+    
+    def refresh_info(self):
+        """
+        Redraw the file information from the cached headers, without touching the disk.
+        """
+        self.refresh_scheduled = False
+        if self.mode_var.get() == "single" and getattr(self, 'input_file', None):
+            if self.input_file in self.analysis_errors:
+                info = f"Failed to analyze PLY file: {self.analysis_errors[self.input_file]}"
+            elif self.header_cache.peek(self.input_file) is None:
+                info = f"Analyzing {os.path.basename(self.input_file)}..."
+            else:
                 info = self.analyze_ply_file(self.input_file)
-                self.info_text.delete(1.0, tk.END)
-                self.info_text.insert(tk.END, info)
-            elif self.mode_var.get() == "batch" and self.input_files:
-                info = self.analyze_batch_files()
-                self.info_text.delete(1.0, tk.END)
-                self.info_text.insert(tk.END, info)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to analyze PLY file: {str(e)}")
+        elif self.mode_var.get() == "batch" and self.input_files:
+            info = self.analyze_batch_files()
+        else:
+            info = ""
+        
+        self.info_text.delete(1.0, tk.END)
+        self.info_text.insert(tk.END, info)
     
     def analyze_batch_files(self):
+        resolution = self.resolution_var.get()
         total_size = 0
         total_points = 0
+        output_points = 0
         has_colors = False
         has_normals = False
+        analyzed_files = 0
+        # Estimated outputs summed over the files whose estimates are ready
+        current_total = {}
+        level_totals = {}
+        estimated_files = 0
         
         for file_path in self.input_files:
-            try:
-                with open(file_path, 'rb') as f:
-                    line = f.readline().decode('ascii').strip()
-                    if line != 'ply':
-                        continue
-                    
-                    vertex_count = 0
-                    file_has_color = False
-                    file_has_normal = False
-                    
-                    while True:
-                        line = f.readline().decode('ascii').strip()
-                        if line.startswith('element vertex'):
-                            vertex_count = int(line.split()[-1])
-                        elif line.startswith('property') and 'red' in line:
-                            file_has_color = True
-                        elif line.startswith('property') and 'nx' in line:
-                            file_has_normal = True
-                        elif line == 'end_header':
-                            break
-                    
-                    total_points += vertex_count
-                    total_size += os.path.getsize(file_path)
-                    has_colors = has_colors or file_has_color
-                    has_normals = has_normals or file_has_normal
-            except:
+            entry = self.header_cache.peek(file_path)
+            if entry is None or file_path in self.analysis_errors:
                 continue
-        
-        resolution = self.resolution_var.get()
+            header = entry['header']
+            vertex_names = [name for name, _, _ in header.vertex.properties] if header.vertex else []
+            
+            analyzed_files += 1
+            total_points += header.vertex_count
+            output_points += stride_plan(header.vertex_count, resolution)['count']
+            total_size += entry['size']
+            has_colors = has_colors or any('red' in name for name in vertex_names)
+            has_normals = has_normals or any('nx' in name for name in vertex_names)
+            
+            levels = self.get_estimates(file_path, QUALITY_LEVELS)
+            if levels and 'error' not in levels:
+                file_points = stride_plan(header.vertex_count, resolution)['count']
+                current = {'current': interpolate_estimate(levels, file_points)}
+                estimated_files += 1
+                for totals, estimates in ((current_total, current), (level_totals, levels)):
+                    for name, estimate in estimates.items():
+                        total = totals.setdefault(name, dict.fromkeys(estimate, 0))
+                        for key, value in estimate.items():
+                            total[key] += value
+        
+        failed_files = sum(1 for file_path in self.input_files if file_path in self.analysis_errors)
+        pending_files = len(self.input_files) - analyzed_files - failed_files
+        kept_fraction = output_points / total_points if total_points else 0.0
         
         info_lines = [
             "Batch PLY Files Analysis:",
             "=" * 60,
             "",
             f"Number of Files: {len(self.input_files)}",
+            f"Analyzed: {analyzed_files} ({pending_files} pending, {failed_files} failed)",
             f"Total Size: {total_size / (1024*1024):.2f} MB",
             f"Total Points: {total_points:,}",
             f"Has Colors: {'Yes ✓' if has_colors else 'No ✗'}",
@@ -377,66 +588,124 @@ class PLYShrinker:
             "=" * 60,
             "",
             f"Current Resolution: {resolution:.2f}",
-            f"Expected Output Points: {int(total_points * resolution):,}",
-            f"Expected File Reduction: {(1 - resolution) * 100:.1f}%",
-            f"Expected Output Size: ~{total_size * resolution / (1024*1024):.2f} MB"
+            f"Expected Output Points: {output_points:,}",
+            *self.format_output_size(current_total.get('current'), total_size, total_size * kept_fraction),
+            "",
+            f"Quality Levels (all files, download at {DOWNLOAD_MBIT_PER_S} Mbit/s):",
+            "=" * 60,
+            "",
+            *(self.format_estimates(level_totals, (estimated_files, analyzed_files)) if level_totals
+              else ["  Estimating..."])
         ]
         
         return "\n".join(info_lines)
     
     def analyze_ply_file(self, file_path):
-        with open(file_path, 'rb') as f:
-            # Read header
-            line = f.readline().decode('ascii').strip()
-            if line != 'ply':
-                raise ValueError("Not a valid PLY file")
-            
-            vertex_count = 0
-            has_color = False
-            has_normal = False
-            
-            while True:
-                line = f.readline().decode('ascii').strip()
-                if line.startswith('element vertex'):
-                    vertex_count = int(line.split()[-1])
-                elif line.startswith('property') and 'red' in line:
-                    has_color = True
-                elif line.startswith('property') and 'nx' in line:
-                    has_normal = True
-                elif line == 'end_header':
-                    break
-            
-            file_size = os.path.getsize(file_path)
-            resolution = self.resolution_var.get()
-            
-            # Build info string with proper formatting
-            info_lines = [
-                "Original PLY File Analysis:",
-                "=" * 60,
-                "",
-                f"File: {os.path.basename(file_path)}",
-                f"File Size: {file_size / (1024*1024):.2f} MB",
-                f"Total Points: {vertex_count:,}",
-                f"Has Colors: {'Yes ✓' if has_color else 'No ✗'}",
-                f"Has Normals: {'Yes ✓' if has_normal else 'No ✗'}",
-                "",
-                "Resolution Impact:",
-                "=" * 60,
-                "",
-                f"Current Resolution: {resolution:.2f}",
-                f"Expected Output Points: {int(vertex_count * resolution):,}",
-                f"Expected File Reduction: {(1 - resolution) * 100:.1f}%",
-                f"Expected Output Size: ~{file_size * resolution / (1024*1024):.2f} MB"
-            ]
-            
-            return "\n".join(info_lines)
+        entry = self.header_cache.peek(file_path) or self.header_cache.get(file_path)
+        header = entry['header']
+        vertex_names = [name for name, _, _ in header.vertex.properties] if header.vertex else []
+        
+        vertex_count = header.vertex_count
+        has_color = any('red' in name for name in vertex_names)
+        has_normal = any('nx' in name for name in vertex_names)
+        
+        file_size = entry['size']
+        resolution = self.resolution_var.get()
+        output_points = stride_plan(vertex_count, resolution)['count']
+        point_fraction = output_points / vertex_count if vertex_count else 0.0
+        
+        # Bytes each property adds per vertex and across the whole file
+        property_lines = []
+        record_size = 0
+        kept_size = 0
+        keep = self.get_keep_fields()
+        if header.vertex and header.is_binary and not header.vertex.has_lists:
+            dtype = header.vertex_dtype()
+            record_size = dtype.itemsize
+            for name in dtype.names:
+                size = dtype.fields[name][0].itemsize
+                kept = keep is None or name in keep
+                kept_size += size if kept else 0
+                property_lines.append(f"  {name:<12} {size:>2} B/vertex  {size * vertex_count / (1024*1024):8.2f} MB  "
+                                      f"{size / record_size * 100:5.1f}%{'' if kept else '  (dropped)'}")
+        
+        # Expected size scales with the kept fraction of each record
+        kept_fraction = kept_size / record_size if record_size else 1.0
+        
+        # Sampled size estimates, once the analysis workers have them
+        levels = self.get_estimates(file_path, QUALITY_LEVELS)
+        current = None
+        if levels is None:
+            level_lines = ["  Estimating..."]
+        elif 'error' in levels:
+            level_lines = [f"  Estimate failed: {levels['error']}"]
+        else:
+            current = interpolate_estimate(levels, output_points)
+            level_lines = self.format_estimates(levels)
+        
+        # Build info string with proper formatting
+        info_lines = [
+            "Original PLY File Analysis:",
+            "=" * 60,
+            "",
+            f"File: {os.path.basename(file_path)}",
+            f"File Size: {file_size / (1024*1024):.2f} MB",
+            f"Total Points: {vertex_count:,}",
+            f"Has Colors: {'Yes ✓' if has_color else 'No ✗'}",
+            f"Has Normals: {'Yes ✓' if has_normal else 'No ✗'}",
+            "",
+            f"Vertex Properties ({record_size} bytes per vertex):",
+            "=" * 60,
+            "",
+            *property_lines,
+            "",
+            "Resolution Impact:",
+            "=" * 60,
+            "",
+            f"Current Resolution: {resolution:.2f}",
+            f"Expected Output Points: {output_points:,}",
+            *self.format_output_size(current, file_size, file_size * point_fraction * kept_fraction,
+                                     levels and levels.get('error')),
+            "",
+            f"Quality Levels (download at {DOWNLOAD_MBIT_PER_S} Mbit/s):",
+            "=" * 60,
+            "",
+            *level_lines
+        ]
+        
+        return "\n".join(info_lines)
     
     def process_files(self):
         if self.processing:
             return
         
+        # Read the options here, on the Tk thread; the workers only see this snapshot.
+        # Invalid entries are reported before the GUI switches to the processing state
+        try:
+            job_options = self.get_shrink_options()
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("Invalid Options", str(e))
+            return
+        if job_options['sampling'] == 'path':
+            # Path sampling follows the walking route and model placements of the viewer configs
+            try:
+                job_options['path_points'] = load_path_points(PROJECT_ROOT / DEFAULT_PATH_CONFIG).tolist()
+                self.model_transforms = load_model_transforms(PROJECT_ROOT / DEFAULT_MODELS_CONFIG)
+            except (OSError, ValueError, KeyError) as e:
+                messagebox.showerror("Error", f"Cannot read the viewer configs for path sampling: {str(e)}")
+                return
+        self.job_options = job_options
+        
         self.processing = True
         self.process_button.config(state="disabled")
+        self.cancel_button.config(state="normal")
+        self.cancel_event.clear()
+        with self.progress_lock:
+            self.progress_done = {}
+            self.progress_total = 0
+            self.progress_text = "Starting..."
+        self.progress_bar.config(maximum=1000, value=0)
+        self.root.after(PROGRESS_INTERVAL, self.poll_progress)
         
         # Start processing in a separate thread
         thread = threading.Thread(target=self.process_files_thread)
@@ -454,142 +723,185 @@ class PLYShrinker:
         finally:
             self.root.after(0, self.finish_processing)
     
+    def cancel_processing(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled")
+        with self.progress_lock:
+            self.progress_text = "Cancelling..."
+    
+    def poll_progress(self):
+        # Runs on the Tk thread; the workers only update the shared counters
+        if not self.processing:
+            return
+        with self.progress_lock:
+            done = sum(self.progress_done.values())
+            total = self.progress_total
+            text = self.progress_text
+        fraction = min(1.0, done / total) if total else 0.0
+        self.progress_bar.config(value=int(fraction * 1000))
+        self.progress_percent.config(text=f"{int(fraction * 100)}%")
+        self.progress_label.config(text=text)
+        self.root.after(PROGRESS_INTERVAL, self.poll_progress)
+    
+    def process_to_file(self, input_path, output_path):
+        """
+        Shrink one file into output_path through a partial file, reporting byte
+        progress. The partial output is removed if the file fails or is cancelled.
+        """
+        if self.cancel_event.is_set():
+            raise ProcessingCancelled()
+        
+        input_size = os.path.getsize(input_path)
+        
+        def progress(bytes_done, bytes_total):
+            with self.progress_lock:
+                self.progress_done[input_path] = input_size * bytes_done / bytes_total if bytes_total else 0
+            if self.cancel_event.is_set():
+                raise ProcessingCancelled()
+        
+        partial_path = output_path + ".part"
+        try:
+            stats = self.shrink_ply_file(input_path, partial_path, progress)
+            os.replace(partial_path, output_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        
+        with self.progress_lock:
+            self.progress_done[input_path] = input_size
+        return stats
+    
     def process_single_file(self):
-        self.root.after(0, lambda: self.progress_label.config(text="Processing single file..."))
-        self.root.after(0, lambda: self.progress_bar.config(maximum=100, value=0))
+        with self.progress_lock:
+            self.progress_total = os.path.getsize(self.input_file)
+            self.progress_text = "Processing single file..."
         
         # Process the file
-        self.shrink_ply_file(self.input_file, self.output_file)
-        
-        self.root.after(0, lambda: self.progress_bar.config(value=100))
-        self.root.after(0, lambda: self.progress_percent.config(text="100%"))
+        try:
+            stats = self.process_to_file(self.input_file, self.output_file)
+        except ProcessingCancelled:
+            self.root.after(0, lambda: messagebox.showinfo("Cancelled", "Processing was cancelled."))
+            return
         
         # Show success message
         output_size = os.path.getsize(self.output_file)
         self.root.after(0, lambda: messagebox.showinfo("Success", 
                               f"PLY file processed successfully!\n"
                               f"Output size: {output_size / (1024*1024):.2f} MB\n"
+                              f"Throughput: {stats['mb_per_s']:.1f} MB/s\n"
                               f"Saved to: {os.path.basename(self.output_file)}"))
     
     def process_batch_files(self):
-        total_files = len(self.input_files)
+        input_files = list(self.input_files)
+        total_files = len(input_files)
         processed_files = 0
+        cancelled_files = 0
+        failures = []
         
-        self.root.after(0, lambda: self.progress_label.config(text=f"Processing batch files (0/{total_files})..."))
-        self.root.after(0, lambda: self.progress_bar.config(maximum=total_files, value=0))
-        
-        for i, input_file in enumerate(self.input_files):
+        total_size = 0
+        for input_file in input_files:
             try:
-                # Create output filename
+                total_size += os.path.getsize(input_file)
+            except OSError:
+                pass
+        with self.progress_lock:
+            self.progress_total = total_size
+            self.progress_text = f"Processing batch files (0/{total_files})..."
+        
+        # Fan the files out to a bounded pool; results are gathered as they finish
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            futures = {}
+            for input_file in input_files:
                 base_name = os.path.splitext(os.path.basename(input_file))[0]
                 output_file = os.path.join(self.output_directory, f"{base_name}.ply")
+                futures[executor.submit(self.process_to_file, input_file, output_file)] = input_file
+            
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    processed_files += 1
+                except ProcessingCancelled:
+                    cancelled_files += 1
+                except Exception as e:
+                    failures.append((futures[future], str(e)))
                 
-                # Update progress
-                self.root.after(0, lambda f=input_file, p=i+1: self.progress_label.config(
-                    text=f"Processing {os.path.basename(f)} ({p}/{total_files})..."))
-                self.root.after(0, lambda v=i+1: self.progress_bar.config(value=v))
-                self.root.after(0, lambda v=i+1: self.progress_percent.config(text=f"{int((v/total_files)*100)}%"))
-                
-                # Process the file
-                self.shrink_ply_file(input_file, output_file)
-                processed_files += 1
-                
-            except Exception as e:
-                self.root.after(0, lambda f=input_file, e=str(e): messagebox.showerror("Error", 
-                    f"Failed to process {os.path.basename(f)}: {e}"))
-        
-        # Show completion message
-        self.root.after(0, lambda: messagebox.showinfo("Batch Processing Complete", 
-                              f"Processed {processed_files}/{total_files} files successfully!\n"
-                              f"Output directory: {self.output_directory}"))
+                finished = processed_files + cancelled_files + len(failures)
+                with self.progress_lock:
+                    if not self.cancel_event.is_set():
+                        self.progress_text = f"Processing batch files ({finished}/{total_files})..."
+        
+        # One summary for the whole batch instead of a dialog per failure
+        lines = [f"Processed {processed_files}/{total_files} files successfully."]
+        if cancelled_files:
+            lines.append(f"Cancelled {cancelled_files} files; their partial outputs were removed.")
+        if failures:
+            lines.append("")
+            lines.append(f"{len(failures)} files failed:")
+            lines.extend(f"  {os.path.basename(f)}: {error}" for f, error in failures[:MAX_LISTED_ERRORS])
+            if len(failures) > MAX_LISTED_ERRORS:
+                lines.append(f"  ... and {len(failures) - MAX_LISTED_ERRORS} more")
+        lines.append("")
+        lines.append(f"Output directory: {self.output_directory}")
+        
+        title = "Batch Processing Cancelled" if cancelled_files else "Batch Processing Complete"
+        show = messagebox.showerror if failures else messagebox.showinfo
+        self.root.after(0, lambda: show(title, "\n".join(lines)))
     
     def finish_processing(self):
         self.processing = False
         self.process_button.config(state="normal")
+        self.cancel_button.config(state="disabled")
         self.progress_label.config(text="Ready to process")
         self.progress_bar.config(value=0)
         self.progress_percent.config(text="0%")
         self.load_ply_info()
     
-    def shrink_ply_file(self, input_path, output_path):
-        resolution = self.resolution_var.get()
-        
-        with open(input_path, 'rb') as input_f:
-            # Read and parse header
-            header_lines = []
-            
-            line = input_f.readline().decode('ascii').strip()
-            header_lines.append(line)
-            
-            if line != 'ply':
-                raise ValueError("Not a valid PLY file")
-            
-            vertex_count = 0
-            properties = []
-            is_binary = False
-            
-            while True:
-                line = input_f.readline().decode('ascii').strip()
-                header_lines.append(line)
-                
-                if line.startswith('format'):
-                    if 'binary' in line:
-                        is_binary = True
-                elif line.startswith('element vertex'):
-                    vertex_count = int(line.split()[-1])
-                    # Calculate new vertex count based on resolution
-                    sample_step = max(1, int(1 / resolution))
-                    new_vertex_count = vertex_count // sample_step
-                    # Update the header line with new count
-                    header_lines[-1] = f"element vertex {new_vertex_count}"
-                elif line.startswith('property'):
-                    properties.append(line)
-                elif line == 'end_header':
-                    break
-            
-            if not is_binary:
-                raise ValueError("Only binary PLY files are supported")
-            
-            # Calculate bytes per vertex based on properties
-            bytes_per_vertex = 0
-            for prop in properties:
-                parts = prop.split()
-                if parts[1] == 'float':
-                    bytes_per_vertex += 4
-                elif parts[1] == 'uchar':
-                    bytes_per_vertex += 1
-                elif parts[1] == 'int':
-                    bytes_per_vertex += 4
-                elif parts[1] == 'uint':
-                    bytes_per_vertex += 4
-            
-            # Calculate sample step and new vertex count
-            sample_step = max(1, int(1 / resolution))
-            sampled_count = vertex_count // sample_step
-            
-            # Write output file
-            with open(output_path, 'wb') as output_f:
-                # Write header
-                for line in header_lines:
-                    output_f.write((line + '\n').encode('ascii'))
-                
-                # Read all vertex data into memory
-                vertex_data = input_f.read()
-                
-                # Process vertex data with same logic as JavaScript
-                for i in range(sampled_count):
-                    source_index = i * sample_step
-                    start_pos = source_index * bytes_per_vertex
-                    end_pos = start_pos + bytes_per_vertex
-                    
-                    if start_pos < len(vertex_data) and end_pos <= len(vertex_data):
-                        # Write the sampled vertex data
-                        output_f.write(vertex_data[start_pos:end_pos])
+    def get_shrink_options(self):
+        """
+        Shrink options from the option widgets. Raises ValueError (or
+        TclError for a non-numeric chunk size) if an entry is invalid.
+        """
+        chunk_size = None
+        if self.streaming_var.get():
+            chunk_size = self.chunk_size_var.get()
+            if chunk_size <= 0:
+                raise ValueError(f"Chunk size must be a positive number of MB, not {chunk_size}")
+            chunk_size *= 1024 * 1024
+        voxel_size = self.voxel_size_var.get().strip()
+        if voxel_size:
+            try:
+                voxel_size = float(voxel_size)
+            except ValueError:
+                raise ValueError(f"Voxel size must be a number, not {voxel_size!r}")
+            if not voxel_size > 0:
+                raise ValueError(f"Voxel size must be positive, not {voxel_size:g}")
+        return {
+            'resolution': self.resolution_var.get(),
+            'chunk_size': chunk_size,
+            'sampling': self.sampling_var.get(),
+            'voxel_size': voxel_size or None,
+            'voxel_centroid': self.voxel_centroid_var.get(),
+            'morton_order': self.morton_order_var.get(),
+            'quantize_bits': DEFAULT_POSITION_BITS if self.quantize_var.get() else None,
+            'keep': self.get_keep_fields(),
+        }
+    
+    def shrink_ply_file(self, input_path, output_path, progress=None):
+        options = self.job_options
+        if options['sampling'] == 'path':
+            options = file_shrink_options(options, input_path, self.model_transforms)
+        return shrink_ply_file(input_path, output_path, progress=progress, **options)
+    
+    def get_keep_fields(self):
+        names = [name.strip() for name in self.keep_var.get().split(',') if name.strip()]
+        return names or None
 
 def main():
     root = tk.Tk()
     app = PLYShrinker(root)
     root.mainloop()
+    app.analysis_executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+PLY Octree Tiler
+Splits a scan into an octree of spatial tiles for view-dependent streaming.
+Every node holds an evenly spread subsample of the points in its cell, and the
+points it does not keep are passed down to its eight children, so a viewer can
+show the coarse root right away and refine only the tiles in view. The tiles
+are written as binary PLY files (optionally gzipped) next to a compact JSON
+hierarchy index with the bounds, point count and byte size of every node.
+
+The partition is vectorized: points are sorted once by Morton code, which
+makes every octree cell a contiguous run at every depth.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the current directory to Python path to import the shared tool modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from plyio import map_vertices, format_header
+from morton import MORTON_BITS, bounding_cube, morton_codes, cell_bounds
+from parallel_gzip import ParallelGzipWriter
+
+# Most points a node keeps before passing the rest to its children
+DEFAULT_MAX_POINTS = 100000
+# Deepest level; leaves at this depth keep all of their remaining points
+DEFAULT_MAX_DEPTH = 12
+
+INDEX_NAME = 'index.json'
+
+
+def build_octree(vertices, max_points=DEFAULT_MAX_POINTS, max_depth=DEFAULT_MAX_DEPTH):
+    """
+    Partition vertices into octree nodes.
+    Returns the bounding cube (origin, size) and a list of
+    (level, key, indices) nodes, where key is the node's Morton prefix and
+    indices are the vertex indices it holds, in Morton order.
+    """
+    max_depth = min(max_depth, MORTON_BITS)
+    origin, size = bounding_cube(vertices)
+    codes = morton_codes(vertices, origin, size)
+    order = np.argsort(codes)
+    codes = codes[order]
+
+    # Positions (into the Morton-sorted arrays) of points not yet assigned
+    remaining = np.arange(len(codes))
+    nodes = []
+
+    for level in range(max_depth + 1):
+        if len(remaining) == 0:
+            break
+
+        keys = codes[remaining] >> np.uint64(3 * (MORTON_BITS - level))
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        count = np.repeat(counts, counts)
+        rank = np.arange(len(keys)) - np.repeat(starts, counts)
+
+        if level == max_depth:
+            keep = np.ones(len(keys), dtype=bool)
+        else:
+            # Small cells become leaves; large ones keep max_points points
+            # evenly spaced along the Z-order curve
+            keep = (count <= max_points) | ((rank * max_points) // count != ((rank - 1) * max_points) // count)
+
+        kept = remaining[keep]
+        kept_keys = keys[keep]
+        node_starts = np.flatnonzero(np.r_[True, kept_keys[1:] != kept_keys[:-1]])
+        node_ends = np.r_[node_starts[1:], len(kept)]
+        for start, end in zip(node_starts, node_ends):
+            nodes.append((level, int(kept_keys[start]), order[kept[start:end]]))
+
+        remaining = remaining[~keep]
+
+    return (origin, size), nodes
+
+
+def node_name(level, key):
+    """
+    Node name in the usual octree convention: 'r' followed by the child
+    index taken at each level.
+    """
+    return 'r' + ''.join(str((key >> (3 * (level - 1 - i))) & 7) for i in range(level))
+
+
+def write_tiles(input_path, output_dir, max_points=DEFAULT_MAX_POINTS, max_depth=DEFAULT_MAX_DEPTH,
+                compress=False):
+    """
+    Tile a PLY file into output_dir and write the hierarchy index.
+    Returns the index as a dict.
+    """
+    header, dtype, data_offset, available = map_vertices(input_path)
+    if available == 0:
+        raise ValueError(f"PLY file has no vertices: {input_path}")
+    vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+
+    (origin, size), nodes = build_octree(vertices, max_points, max_depth)
+    os.makedirs(output_dir, exist_ok=True)
+    extension = '.ply.gz' if compress else '.ply'
+
+    index_nodes = {}
+    for level, key, indices in nodes:
+        name = node_name(level, key)
+        file_name = name + extension
+        # Sorted indices read the memory map front to back
+        points = vertices[np.sort(indices)]
+
+        output_path = os.path.join(output_dir, file_name)
+        output_f = ParallelGzipWriter(output_path) if compress else open(output_path, 'wb')
+        with output_f:
+            output_f.write(format_header(header, {'vertex': len(points)}))
+            output_f.write(points.view(np.uint8))
+
+        index_nodes[name] = {
+            'level': level,
+            'points': len(points),
+            'bytes': os.path.getsize(output_path),
+            'bounds': cell_bounds(level, key, origin, size),
+            'file': file_name,
+            'children': [],
+        }
+
+    for name in index_nodes:
+        if name != 'r':
+            index_nodes[name[:-1]]['children'].append(int(name[-1]))
+
+    index = {
+        'version': 1,
+        'source': os.path.basename(input_path),
+        'points': int(available),
+        'max_points': max_points,
+        'bounds': list(map(float, origin)) + [float(value) + size for value in origin],
+        'nodes': index_nodes,
+    }
+    with open(os.path.join(output_dir, INDEX_NAME), 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a PLY scan into an octree of spatial tiles.")
+    parser.add_argument('input', help="input binary PLY file")
+    parser.add_argument('output_dir', help="directory for the tiles and index.json")
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS,
+                        help=f"most points per tile (default: {DEFAULT_MAX_POINTS})")
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH,
+                        help=f"deepest octree level (default: {DEFAULT_MAX_DEPTH})")
+    parser.add_argument('--gzip', action='store_true', help="write gzipped tiles (.ply.gz)")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    index = write_tiles(args.input, args.output_dir, args.max_points, args.max_depth, args.gzip)
+    elapsed = time.perf_counter() - start_time
+
+    nodes = index['nodes'].values()
+    total_bytes = sum(node['bytes'] for node in nodes)
+    depth = max(node['level'] for node in nodes)
+    print(f"Tiled {index['points']:,} points into {len(nodes)} tiles (depth {depth}, "
+          f"{total_bytes / (1024*1024):.1f} MB) in {elapsed:.1f} s")
+    print(f"Root tile: {index['nodes']['r']['points']:,} points")
+
+
+if __name__ == '__main__':
+    main()
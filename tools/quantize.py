@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Vertex Quantization
+Compact vertex layout for shrunk outputs. Positions are stored as unsigned
+integers of a chosen bit depth inside the model's bounding box and float unit
+normals as signed bytes; colours and any other properties are kept as they
+are. The dequantization parameters travel in PLY header comments:
+
+    comment quantized position <bits> <offset x y z> <scale x y z>
+    comment quantized normal snorm8
+
+so a loader rebuilds each coordinate as value * scale + offset, and each
+normal component as value / 127, in a single pass over the typed array.
+"""
+
+import numpy as np
+
+# Default bit depth for quantized positions
+DEFAULT_POSITION_BITS = 16
+
+POSITION_FIELDS = ('x', 'y', 'z')
+NORMAL_FIELDS = ('nx', 'ny', 'nz')
+
+# Largest magnitude of a normal component stored as a signed byte
+NORMAL_SCALE = 127
+
+# Vertices scanned at a time while computing the bounding box
+BOUNDS_CHUNK_ROWS = 4 * 1024 * 1024
+
+
+def field_ranges(vertices, names, indices=None):
+    """
+    Minimum and maximum of each named vertex field, as two arrays, over all
+    vertices or only those at the given indices.
+    """
+    mins = np.full(len(names), np.inf)
+    maxs = np.full(len(names), -np.inf)
+    for start in range(0, len(vertices) if indices is None else len(indices), BOUNDS_CHUNK_ROWS):
+        block = vertices[start:start + BOUNDS_CHUNK_ROWS] if indices is None \
+            else vertices[indices[start:start + BOUNDS_CHUNK_ROWS]]
+        for i, name in enumerate(names):
+            mins[i] = min(mins[i], float(block[name].min()))
+            maxs[i] = max(maxs[i], float(block[name].max()))
+    return mins, maxs
+
+
+def _position_type(bits):
+    if not 1 <= bits <= 32:
+        raise ValueError(f"Position bit depth must be between 1 and 32, got {bits}")
+    return 'u1' if bits <= 8 else 'u2' if bits <= 16 else 'u4'
+
+
+def make_quantization(vertices, dtype, bits=DEFAULT_POSITION_BITS, indices=None):
+    """
+    Work out the compact layout for vertices of the given dtype, bounding
+    all vertices or only those at the given indices.
+    Returns a dict with the output 'dtype', the per-axis 'offset' and
+    'scale', and the header 'comments' describing them.
+    """
+    if not all(axis in dtype.names for axis in POSITION_FIELDS):
+        raise ValueError("Quantization needs x, y and z vertex properties")
+
+    byte_order = '>' if dtype.fields['x'][0].str[0] == '>' else '<'
+    narrow_normals = all(name in dtype.names and dtype.fields[name][0].kind == 'f' for name in NORMAL_FIELDS)
+
+    count = len(vertices) if indices is None else len(indices)
+    if count:
+        mins, maxs = field_ranges(vertices, POSITION_FIELDS + (NORMAL_FIELDS if narrow_normals else ()), indices)
+    else:
+        mins, maxs = np.zeros(3), np.zeros(3)
+    # Only unit normals fit the signed byte range
+    if narrow_normals:
+        narrow_normals = mins[3:].min() >= -1.0 and maxs[3:].max() <= 1.0
+        mins, maxs = mins[:3], maxs[:3]
+
+    fields = []
+    for name in dtype.names:
+        if name in POSITION_FIELDS:
+            fields.append((name, byte_order + _position_type(bits)))
+        elif name in NORMAL_FIELDS and narrow_normals:
+            fields.append((name, 'i1'))
+        else:
+            fields.append((name, dtype.fields[name][0]))
+
+    extent = maxs - mins
+    scale = np.where(extent > 0, extent / ((1 << bits) - 1), 1.0)
+
+    comments = ["quantized position {} {} {}".format(
+        bits, ' '.join(repr(float(value)) for value in mins), ' '.join(repr(float(value)) for value in scale))]
+    if narrow_normals:
+        comments.append("quantized normal snorm8")
+
+    return {
+        'dtype': np.dtype(fields),
+        'bits': bits,
+        'offset': mins,
+        'scale': scale,
+        'comments': comments,
+    }
+
+
+def quantize_vertices(vertices, quantization):
+    """
+    Convert vertices to the compact layout of a quantization.
+    """
+    out_dtype = quantization['dtype']
+    result = np.empty(len(vertices), dtype=out_dtype)
+    max_value = (1 << quantization['bits']) - 1
+
+    for name in out_dtype.names:
+        if name in POSITION_FIELDS:
+            i = POSITION_FIELDS.index(name)
+            values = (vertices[name] - quantization['offset'][i]) / quantization['scale'][i]
+            result[name] = np.clip(np.rint(values), 0, max_value)
+        elif out_dtype.fields[name][0] != vertices.dtype.fields[name][0] and name in NORMAL_FIELDS:
+            result[name] = np.clip(np.rint(vertices[name] * NORMAL_SCALE), -NORMAL_SCALE, NORMAL_SCALE)
+        else:
+            result[name] = vertices[name]
+
+    return result
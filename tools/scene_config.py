@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Viewer Scene Config
+Helpers for the JSON configs the viewer loads from public/configs: the model
+list, where every model carries a three.js position, rotation (Euler angles
+in XYZ order, radians) and scale, and the path data, whose activityRange
+holds the visitor walking route as a polyline of world-space points.
+"""
+
+import json
+import os
+import re
+
+import numpy as np
+
+# Configs shipped with the viewer
+DEFAULT_MODELS_CONFIG = os.path.join('public', 'configs', 'ply-models-2025-08-24.json')
+DEFAULT_PATH_CONFIG = os.path.join('public', 'configs', 'path-data-2025-08-24.json')
+
+# Quality suffix of the output URLs in a model config, as in the viewer's ModelManager
+QUALITY_SUFFIX = re.compile(r'_(ultra_low|low|medium|high)\.(ply\.gz|ply|drc)$')
+
+
+def transform_matrix(position, rotation, scale):
+    """
+    4x4 matrix of a three.js object transform: scale, then rotation about
+    X, Y and Z in the object's frame (Euler order XYZ), then translation.
+    """
+    (cx, cy, cz), (sx, sy, sz) = np.cos(rotation), np.sin(rotation)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+
+    matrix = np.eye(4)
+    matrix[:3, :3] = rx @ ry @ rz @ np.diag(scale)
+    matrix[:3, 3] = position
+    return matrix
+
+
+def source_stem(model):
+    """
+    Name of the source PLY of a config model, e.g. "scan" for a url of
+    /models/compressed/scan_ultra_low.ply.gz.
+    """
+    name = model['url'].rsplit('/', 1)[-1]
+    stem = QUALITY_SUFFIX.sub('', name)
+    return re.sub(r'\.ply(\.gz)?$', '', stem)
+
+
+def load_model_transforms(config_path):
+    """
+    Transform matrix of every model of a model config, keyed by the stem of
+    its source PLY.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    return {source_stem(model): transform_matrix(model['position'], model['rotation'], model['scale'])
+            for model in config['models']}
+
+
+def load_path_points(config_path):
+    """
+    World-space points of the walking path of a path config, as an (n, 3) array.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    points = np.array(config['activityRange']['pathPoints'], dtype=np.float64).reshape(-1, 3)
+    if len(points) == 0:
+        raise ValueError(f"Path config has no path points: {config_path}")
+    return points
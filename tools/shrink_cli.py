@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+PLYShrinker Command Line
+Headless front end to the shrink engine. Shrinks every PLY file matching the
+given glob patterns (or inside the given directories) into an output
+directory at one or more resolutions, written as .ply.gz or plain .ply, on a
+pool of worker processes. Each file is read once for all of its resolutions.
+Outputs can also be given a size budget, in which case their resolution is
+fitted to each file from quick size estimates.
+
+With --watch the tool keeps running as a drop-folder daemon: it polls the
+patterns for new or changed files, waits until a file has stopped changing
+before building it, and rebuilds it whenever it changes again. Outputs are
+written to .part files and renamed into place, so nothing reading the output
+directory ever sees a partial file, and the build manifest in the output
+directory skips outputs that are already current for their source content
+and options, across restarts too.
+"""
+
+import os
+import sys
+import glob
+import signal
+import argparse
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the current directory to Python path to import the shared tool modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from shrink_engine import ENGINE_VERSION
+from build_cache import BuildManifest, MANIFEST_NAME
+from cleaning import outlier_removal_available
+from path_sampling import path_sampling_available
+from batch_compress import (QUALITY_LEVELS, add_shrink_arguments, get_shrink_options, get_model_transforms,
+                            file_shrink_options, get_output_params, get_file_size_mb, process_quality_levels,
+                            parse_budgets, fit_budgets, print_budget_fits)
+
+OUTPUT_FORMATS = ('ply.gz', 'ply')
+
+# Seconds between scans of the watched patterns
+DEFAULT_INTERVAL = 2.0
+# Seconds a file must go unmodified before it is built
+DEFAULT_SETTLE = 5.0
+
+
+def parse_resolutions(text):
+    """
+    Parse a resolution list such as "low=0.25,high=1" or "0.1,0.5" into a
+    dict of output names and resolutions. Unnamed resolutions are named by
+    their percentage, e.g. 0.5 writes <name>_50.ply.gz.
+    """
+    levels = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.rpartition('=')
+        try:
+            resolution = float(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid resolution: {item}")
+        if not 0 < resolution <= 1:
+            raise argparse.ArgumentTypeError(f"resolution must be in (0, 1]: {item}")
+        levels[name.strip() or f"{resolution * 100:g}"] = resolution
+    if not levels:
+        raise argparse.ArgumentTypeError("no resolutions given")
+    return levels
+
+
+def find_inputs(patterns, exclude_dir=None):
+    """
+    PLY files matching the glob patterns, in sorted order. A directory
+    stands for the .ply files directly inside it. Files inside exclude_dir
+    are left out, so an output directory inside a watched folder is not
+    picked up as input.
+    """
+    excluded = Path(exclude_dir).resolve() if exclude_dir else None
+    found = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.ply')
+        for name in glob.glob(pattern, recursive=True):
+            path = Path(name)
+            if path.suffix.lower() != '.ply' or not path.is_file():
+                continue
+            if excluded and excluded in path.resolve().parents:
+                continue
+            found.add(path)
+    return sorted(found)
+
+
+def _init_worker():
+    # Interrupts are handled by the main process, which lets running files
+    # finish so that no worker dies halfway through an output
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+class ShrinkRunner:
+    """
+    Submits PLY files to a worker pool and records the finished outputs in
+    the build manifest of the output directory.
+    """
+
+    def __init__(self, output_dir, levels, compress, shrink_options, jobs, force=False, budgets=None,
+                 transforms=None):
+        self.output_dir = output_dir
+        self.levels = levels
+        self.budgets = budgets or {}
+        self.compress = compress
+        self.extension = '.ply.gz' if compress else '.ply'
+        self.shrink_options = shrink_options
+        # Model placements for path sampling, and the options each submitted file was built with
+        self.transforms = transforms or {}
+        self.file_options = {}
+        self.force = force
+        cpu_count = os.cpu_count() or 1
+        self.jobs = jobs or cpu_count
+        self.gzip_threads = max(1, cpu_count // self.jobs)
+        self.manifest = BuildManifest(output_dir / MANIFEST_NAME)
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker)
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def output_path(self, ply_file, quality):
+        return self.output_dir / f"{ply_file.stem}_{quality}{self.extension}"
+
+    def submit(self, ply_file):
+        """
+        Start building every output of a file that is not already current.
+        Returns a future for the process_quality_levels result, together
+        with the source fingerprint the outputs will be recorded against and
+        the resolution of every output.
+        """
+        fingerprint = self.manifest.fingerprint(ply_file)
+        options = self.file_options[ply_file] = file_shrink_options(self.shrink_options, ply_file, self.transforms)
+        levels = self.levels
+        if self.budgets:
+            print(f"Fitting {ply_file.name} to the size budgets:")
+            fits = fit_budgets(ply_file, self.budgets, options, self.compress)
+            print_budget_fits(self.budgets, fits, self.compress)
+            levels = {**levels, **{quality: resolution for quality, (resolution, _) in fits.items()}}
+        up_to_date = set()
+        if not self.force:
+            up_to_date = {quality for quality, resolution in levels.items()
+                          if self.manifest.is_current(self.output_path(ply_file, quality), fingerprint,
+                                                      get_output_params(resolution, options), ENGINE_VERSION)}
+        future = self.executor.submit(process_quality_levels, ply_file, levels, self.output_dir,
+                                      options, self.gzip_threads, up_to_date, self.compress)
+        return future, fingerprint, levels
+
+    def finish(self, ply_file, future, fingerprint, levels):
+        """
+        Report the results of a finished file and record its new outputs.
+        """
+        try:
+            results, _ = future.result()
+        except Exception as e:
+            results = [('error', f"  {quality}... ERROR: {str(e)}") for quality in levels]
+
+        print(f"\n{ply_file.name}:")
+        for (quality, resolution), (status, message) in zip(levels.items(), results):
+            print(message)
+            if status == 'processed':
+                self.processed += 1
+                self.manifest.record(self.output_path(ply_file, quality), ply_file, fingerprint,
+                                     get_output_params(resolution, self.file_options[ply_file]), ENGINE_VERSION)
+            elif status == 'skipped':
+                self.skipped += 1
+            else:
+                self.errors += 1
+        self.manifest.save()
+
+    def shutdown(self):
+        """
+        Wait for the running files and drop the ones that have not started.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def run_once(runner, patterns):
+    """
+    Build every matching file once, largest first so big scans don't end up
+    as stragglers. Returns the process exit status.
+    """
+    ply_files = find_inputs(patterns, runner.output_dir)
+    if not ply_files:
+        print("No PLY files match the given patterns.")
+        return 1
+
+    print(f"Found {len(ply_files)} PLY files to process:")
+    for ply_file in ply_files:
+        print(f"  - {ply_file} ({get_file_size_mb(ply_file):.1f} MB)")
+
+    ply_files.sort(key=lambda ply_file: ply_file.stat().st_size, reverse=True)
+    running = [(ply_file, *runner.submit(ply_file)) for ply_file in ply_files]
+    for ply_file, future, fingerprint, levels in running:
+        runner.finish(ply_file, future, fingerprint, levels)
+
+    print(f"\nDone: {runner.processed} outputs written, {runner.skipped} up to date, {runner.errors} failed.")
+    return 1 if runner.errors else 0
+
+
+def watch(runner, patterns, interval=DEFAULT_INTERVAL, settle=DEFAULT_SETTLE):
+    """
+    Poll the patterns for new or changed PLY files and build each one once it
+    has settled: its size and mtime are the same as on the previous scan and
+    it has not been modified for settle seconds. Runs until interrupted,
+    then lets the files being built finish and records them.
+    """
+    # (size, mtime_ns) of every file as last scanned, and as last submitted
+    scanned = {}
+    submitted = {}
+    # Futures of the files being built, with the file, its fingerprint and levels
+    running = {}
+
+    print(f"Watching {', '.join(patterns)} every {interval:g} s; press Ctrl-C to stop.")
+    try:
+        while True:
+            _poll(runner, patterns, settle, scanned, submitted, running)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nStopping; waiting for the files being built to finish...")
+        for future, (ply_file, fingerprint, levels) in running.items():
+            if not future.cancel():
+                runner.finish(ply_file, future, fingerprint, levels)
+    return 0
+
+
+def _poll(runner, patterns, settle, scanned, submitted, running):
+    """
+    One scan of the watch loop: report finished files and submit settled ones.
+    """
+    for future in [future for future in running if future.done()]:
+        ply_file, fingerprint, levels = running.pop(future)
+        runner.finish(ply_file, future, fingerprint, levels)
+
+    busy = {ply_file for ply_file, _, _ in running.values()}
+    current = {}
+    for ply_file in find_inputs(patterns, runner.output_dir):
+        try:
+            stat = ply_file.stat()
+        except FileNotFoundError:
+            continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        current[ply_file] = signature
+
+        # Still being written, unchanged since its last build, or already building
+        if scanned.get(ply_file) != signature or time.time() - stat.st_mtime < settle:
+            continue
+        if submitted.get(ply_file) == signature or ply_file in busy:
+            continue
+
+        try:
+            future, fingerprint, levels = runner.submit(ply_file)
+        except OSError as e:
+            # The file was moved or truncated between the scan and the hash
+            print(f"\n{ply_file.name}: {e}")
+            continue
+        submitted[ply_file] = signature
+        running[future] = (ply_file, fingerprint, levels)
+
+    # Forget removed files so that they are built again if they come back
+    scanned.clear()
+    scanned.update(current)
+    for ply_file in [ply_file for ply_file in submitted if ply_file not in current]:
+        del submitted[ply_file]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Shrink PLY files from the command line or a watched drop folder.")
+    parser.add_argument('inputs', nargs='+', metavar='PATTERN',
+                        help="PLY files, glob patterns (quote them; ** matches subdirectories) or "
+                             "directories whose .ply files are processed")
+    parser.add_argument('--output-dir', '-o', required=True, metavar='DIR',
+                        help="directory the outputs are written to; created if missing")
+    parser.add_argument('--resolutions', '-r', type=parse_resolutions, metavar='LIST',
+                        default=dict(QUALITY_LEVELS),
+                        help="comma-separated resolutions, optionally named, e.g. low=0.25,high=1 or "
+                             "0.1,0.5 (default: ultra_low=0.1,low=0.25,medium=0.5,high=1)")
+    parser.add_argument('--budget', type=parse_budgets, metavar='LIST',
+                        help="target sizes in MB for named outputs, e.g. ultra_low=2; each one's resolution "
+                             "is fitted per file from quick size estimates (compressed size with the "
+                             "ply.gz format), replacing or adding to --resolutions")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ply.gz',
+                        help="output format (default: ply.gz)")
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+                        help="process up to N files in parallel; 0 uses every CPU core (default: 1)")
+    add_shrink_arguments(parser)
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every output even if the build manifest says it is up to date")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep running and build new or changed files as they appear")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, metavar='SECONDS',
+                        help=f"with --watch, seconds between scans (default: {DEFAULT_INTERVAL:g})")
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE, metavar='SECONDS',
+                        help="with --watch, seconds a file must go unmodified before it is built, so "
+                             f"files still being copied are left alone (default: {DEFAULT_SETTLE:g})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.remove_outliers is not None and not outlier_removal_available():
+        sys.exit("--remove-outliers needs the scipy package (pip install scipy)")
+    if args.sampling == 'path' and not path_sampling_available():
+        sys.exit("--sampling path needs the scipy package (pip install scipy)")
+    try:
+        shrink_options = get_shrink_options(args)
+        transforms = get_model_transforms(args)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Cannot read the viewer configs for path sampling: {e}")
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    runner = ShrinkRunner(output_dir, args.resolutions, args.format == 'ply.gz', shrink_options,
+                          args.jobs, args.force, args.budget, transforms)
+    if args.watch:
+        # Stop a daemon run the same way as an interactive one
+        signal.signal(signal.SIGTERM, _raise_interrupt)
+
+    try:
+        if args.watch:
+            return watch(runner, args.inputs, args.interval, args.settle)
+        return run_once(runner, args.inputs)
+    except KeyboardInterrupt:
+        print("\nStopping; waiting for the files being built to finish...")
+        return 130
+    finally:
+        runner.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
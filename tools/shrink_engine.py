@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+PLY Shrink Engine
+Shared vertex sampling core used by the PLYShrinker GUI and batch_compress.
+The vertex block is memory-mapped through plyio as a NumPy structured array,
+sampled with a single strided slice and written out in one bulk write. In
+streaming mode the block is instead read in fixed-size chunks, each one
+sampled and written before the next is read, so peak memory stays bounded by
+the chunk size regardless of the input size. Several resolutions can be
+produced from a single read of the source. Stride sampling keeps evenly
+spaced vertices in file order at any fraction, not only at reciprocals of
+integers. Besides index-stride sampling, a voxel-grid mode keeps one
+representative per occupied cell so the output covers the scanned space
+evenly. Kept vertices can optionally be written in Morton (Z-order) order,
+which places spatial neighbours next to each other in the file and so
+compresses better and uploads as a cache-friendly vertex buffer. Unused
+vertex properties can be dropped by projecting the records onto a subset of
+their fields. Positions can also be quantized to small integers inside the
+bounding box, with normals narrowed to bytes, to cut the bytes per vertex,
+and the written records can be byte-shuffled in blocks so they deflate
+better. Duplicate points and statistical outliers can be removed before
+sampling, so every output keeps its share of the remaining points. A path
+mode weights the points by their distance to the visitor walking path, so the
+point budget goes where the camera goes. A progressive writer reorders all
+vertices so that every prefix of the file is itself a well-distributed
+subsample.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+from plyio import map_vertices, format_header
+from morton import MORTON_BITS, morton_codes
+from quantize import make_quantization, quantize_vertices
+from byte_filter import make_filter, ShuffleWriter
+from cleaning import clean_vertices, DEFAULT_OUTLIER_NEIGHBORS
+from path_sampling import path_sample_keys, select_smallest, DEFAULT_PATH_FALLOFF
+from instrument import StageTimer
+
+# Bump when a change alters the bytes written for the same input and options,
+# so build caches know to regenerate their outputs. History:
+#   1 - first versioned engine
+#   2 - headers carry only the vertex element and face data is no longer
+#       copied; fractional resolutions keep exactly int(n * resolution) vertices
+ENGINE_VERSION = 2
+
+# Default chunk size for streaming mode
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Vertex selection strategies supported by shrink_ply_file_multi
+SAMPLING_MODES = ('stride', 'voxel', 'path')
+
+# Voxel keys pack three cell coordinates of this many bits into one int64
+VOXEL_AXIS_BITS = 21
+# Vertices processed at a time while computing voxel keys and centroids
+VOXEL_CHUNK_ROWS = 4 * 1024 * 1024
+# Passes and relative tolerance of the voxel size search for a target count
+VOXEL_SEARCH_ITERATIONS = 8
+VOXEL_SEARCH_TOLERANCE = 0.02
+
+# Relative tolerance for treating 1 / resolution as a whole-number stride
+STEP_TOLERANCE = 1e-9
+
+# Vertices gathered at a time while writing a reordered file
+REORDER_CHUNK_ROWS = 1024 * 1024
+
+# Stages of shrink_ply_file_multi shared by all outputs of a run
+SHARED_STAGES = ('header', 'clean', 'plan', 'read')
+
+
+def get_sample_step(resolution):
+    """
+    Keep every k-th vertex, matching the JavaScript loader.
+    """
+    return max(1, int(1 / resolution))
+
+
+def stride_plan(vertex_count, resolution):
+    """
+    Plan an evenly spaced selection of vertices in file order: `kept` out of
+    every `every` vertices, the k-th kept vertex being k * every // kept.
+    Resolutions that are reciprocals of integers keep every k-th vertex,
+    matching the JavaScript loader; any other fraction keeps
+    int(vertex_count * resolution) vertices spread over the whole file.
+    """
+    step = 1 / resolution
+    if resolution >= 1 or abs(step - round(step)) < STEP_TOLERANCE * step:
+        kept, every = 1, max(1, round(step))
+        count = vertex_count // every
+    else:
+        count = int(vertex_count * resolution)
+        kept, every = (count, vertex_count) if count else (0, 1)
+    return {'ratio': (kept, every), 'count': count, 'limit': count * every // kept if count else 0}
+
+
+def stride_indices(plan, first, last):
+    """
+    Input indices of the kept vertices first to last - 1 of a stride plan.
+    """
+    kept, every = plan['ratio']
+    return np.arange(first, last, dtype=np.int64) * every // max(kept, 1)
+
+
+def iter_vertex_chunks(input_f, dtype, vertex_count, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (first_index, vertices) chunks of the vertex block.
+    Every chunk is read into the same reused buffer, so a chunk is only
+    valid until the next one is requested.
+    """
+    chunk_rows = max(1, chunk_size // dtype.itemsize)
+    buffer = np.empty(min(chunk_rows, max(vertex_count, 1)), dtype=dtype)
+    raw = buffer.view(np.uint8)
+
+    start = 0
+    while start < vertex_count:
+        rows = min(len(buffer), vertex_count - start)
+        nbytes = input_f.readinto(raw[:rows * dtype.itemsize])
+        complete_rows = nbytes // dtype.itemsize
+        if complete_rows > 0:
+            yield start, buffer[:complete_rows]
+        if complete_rows < rows:
+            # Truncated file: stop at the last complete record
+            break
+        start += rows
+
+
+def voxel_sample(vertices, voxel_size=None, target_points=None, centroid=False):
+    """
+    Keep one vertex per occupied voxel of a regular grid over the bounding box.
+    Either voxel_size or target_points must be given; for a target the cell
+    size is searched so the number of occupied voxels lands near the target.
+    Returns the kept vertex indices in file order and a dict of replacement
+    field values for them (the cell centroid and average colour when
+    centroid is set, empty otherwise).
+    """
+    origin = np.array([vertices[axis].min() for axis in 'xyz'], dtype=np.float64)
+    extent = max(float(vertices[axis].max()) - origin[i] for i, axis in enumerate('xyz'))
+
+    if voxel_size is None:
+        voxel_size = _search_voxel_size(vertices, origin, extent, target_points)
+    keys = _voxel_keys(vertices, origin, extent, voxel_size)
+
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    del keys
+    order = np.argsort(first)
+    indices = first[order]
+
+    overrides = {}
+    if centroid:
+        fields = [name for name in ('x', 'y', 'z', 'red', 'green', 'blue', 'alpha') if name in vertices.dtype.names]
+        counts = np.bincount(inverse, minlength=len(first))
+        sums = {name: np.zeros(len(first)) for name in fields}
+        for start in range(0, len(vertices), VOXEL_CHUNK_ROWS):
+            block = vertices[start:start + VOXEL_CHUNK_ROWS]
+            block_cells = inverse[start:start + VOXEL_CHUNK_ROWS]
+            for name in fields:
+                sums[name] += np.bincount(block_cells, weights=block[name], minlength=len(first))
+        for name in fields:
+            mean = (sums[name] / counts)[order]
+            field_type = vertices.dtype.fields[name][0]
+            if field_type.kind in 'iu':
+                mean = np.rint(mean)
+            overrides[name] = mean.astype(field_type)
+
+    return indices, overrides
+
+
+def _voxel_keys(vertices, origin, extent, voxel_size):
+    """
+    Pack the integer cell coordinates of every vertex into one int64 key.
+    """
+    if voxel_size <= 0 or extent / voxel_size >= 1 << VOXEL_AXIS_BITS:
+        raise ValueError(f"Voxel size {voxel_size} is too small for a model extent of {extent}")
+
+    keys = np.empty(len(vertices), dtype=np.int64)
+    for start in range(0, len(vertices), VOXEL_CHUNK_ROWS):
+        block = vertices[start:start + VOXEL_CHUNK_ROWS]
+        block_keys = keys[start:start + VOXEL_CHUNK_ROWS]
+        block_keys[:] = 0
+        for i, axis in enumerate('xyz'):
+            # Offsets from the minimum are non-negative, so truncation is floor
+            cells = ((block[axis] - origin[i]) * (1 / voxel_size)).astype(np.int64)
+            block_keys |= cells << (VOXEL_AXIS_BITS * (2 - i))
+    return keys
+
+
+def _search_voxel_size(vertices, origin, extent, target_points):
+    """
+    Find a voxel size whose occupied cell count is close to target_points.
+    The count falls off as a power of the cell size, so a secant search in
+    log-log space converges in a handful of passes.
+    """
+    if target_points >= len(vertices):
+        # Finest grid the keys can represent
+        return extent / ((1 << VOXEL_AXIS_BITS) - 1) if extent > 0 else 1.0
+    if extent == 0 or target_points <= 1:
+        return max(extent, 1.0) * 2
+
+    min_log_size = np.log(extent / ((1 << VOXEL_AXIS_BITS) - 1))
+    # Scanned surfaces are roughly two-dimensional: count ~ size ** -2
+    slope = -2.0
+    log_size = max(min_log_size, np.log(extent / np.sqrt(target_points)))
+    log_target = np.log(target_points)
+    best = None
+    previous = None
+
+    for _ in range(VOXEL_SEARCH_ITERATIONS):
+        keys = np.sort(_voxel_keys(vertices, origin, extent, np.exp(log_size)))
+        count = int(np.count_nonzero(np.diff(keys))) + 1
+        del keys
+
+        if best is None or abs(count - target_points) < abs(best[1] - target_points):
+            best = (log_size, count)
+        if abs(count - target_points) <= VOXEL_SEARCH_TOLERANCE * target_points:
+            break
+
+        log_count = np.log(count)
+        if previous is not None and previous[0] != log_size and previous[1] != log_count:
+            slope = float(np.clip((log_count - previous[1]) / (log_size - previous[0]), -3.0, -0.5))
+        previous = (log_size, log_count)
+        log_size = max(min_log_size, log_size + (log_target - log_count) / slope)
+
+    return float(np.exp(best[0]))
+
+
+def shrink_ply_file(input_path, output_path, resolution, chunk_size=None, **options):
+    """
+    Shrink a PLY file to the given resolution.
+    Passing chunk_size (in bytes) enables the constant-memory streaming mode.
+    See shrink_ply_file_multi for the sampling options.
+    Returns a dict of statistics including the MB/s throughput.
+    """
+    return shrink_ply_file_multi(input_path, {output_path: resolution}, chunk_size, **options)[output_path]
+
+
+def shrink_ply_file_multi(input_path, outputs, chunk_size=None, sampling='stride', voxel_size=None,
+                          voxel_centroid=False, morton_order=False, quantize_bits=None, keep=None,
+                          byte_filter=None, remove_duplicates=None, remove_outliers=None,
+                          outlier_neighbors=DEFAULT_OUTLIER_NEIGHBORS, path_points=None, path_transform=None,
+                          path_falloff=DEFAULT_PATH_FALLOFF, progress=None):
+    """
+    Shrink a PLY file to several resolutions in a single pass.
+    outputs maps each output (a path or a writable binary file object, such
+    as a gzip writer) to its resolution. The header is parsed once and the
+    vertex block is read (or mapped) once for all outputs.
+
+    sampling selects how vertices are kept:
+      'stride' - every k-th vertex in file order, matching the JavaScript loader
+      'voxel'  - one vertex per occupied voxel; the cell size is voxel_size if
+                 given, otherwise searched to keep resolution * vertex count
+                 points. voxel_centroid replaces each kept vertex's position
+                 and colour by the cell average.
+      'path'   - resolution * vertex count points drawn with a probability
+                 that falls off with the distance to the path_points polyline
+                 (world space; path_transform is the model's 4x4 placement)
+                 beyond about path_falloff; see path_sampling.py. Smaller
+                 outputs are subsets of larger ones.
+
+    With morton_order the kept vertices are written sorted by Morton code
+    instead of in file order. This gathers them through a memory map, so
+    chunk_size is ignored.
+
+    With quantize_bits the positions are written as unsigned integers of that
+    many bits inside the bounding box of the whole input (the same box for
+    every output), and float normals as signed bytes; see quantize.py.
+
+    keep is an optional sequence of vertex property names; only those
+    properties are written, in that order.
+
+    byte_filter, 'shuffle' or 'delta', stores the vertex block as byte planes
+    of fixed-size blocks of records, with 'delta' also delta-encoding the
+    positions, so that gzip compresses it better; see byte_filter.py.
+
+    remove_duplicates and remove_outliers clean the input before any output
+    is sampled: remove_duplicates is the grid size within which points count
+    as duplicates (0 for exact duplicates only), and remove_outliers the
+    number of standard deviations above the mean distance to the
+    outlier_neighbors nearest neighbours beyond which a point is dropped; see
+    cleaning.py. Resolutions then apply to the points that remain.
+
+    progress, if given, is called as progress(bytes_done, bytes_total) as the
+    vertex data is processed; the memory-mapped mode then works through the
+    block in DEFAULT_CHUNK_SIZE pieces so that it reports regularly. An
+    exception raised by progress aborts the run, which is how callers cancel.
+
+    Returns a dict of statistics per output. Its 'stages' entry breaks the
+    run down into header, clean, plan, read, sample and write stages (wall
+    and CPU time, bytes in and out); SHARED_STAGES are shared by all outputs.
+    Its 'removed' entry counts the points removed by each cleaning filter.
+    """
+    start_time = time.perf_counter()
+
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    if sampling == 'path' and path_points is None:
+        raise ValueError("Path sampling needs path points")
+
+    timer = StageTimer()
+    output_timers = {output_path: StageTimer() for output_path in outputs}
+
+    with timer.stage('header'):
+        header, dtype, data_offset, available = map_vertices(input_path)
+    vertex_count = header.vertex_count
+
+    # Indices of the vertices left after cleaning, or None to use them all
+    with timer.stage('clean'):
+        survivors = None
+        removed = {}
+        if (remove_duplicates is not None or remove_outliers is not None) and available > 0:
+            vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+            survivors, removed = clean_vertices(vertices, remove_duplicates, remove_outliers, outlier_neighbors)
+            del vertices
+    source_count = vertex_count if survivors is None else len(survivors)
+
+    # Work out which vertices every output keeps: an even stride over the
+    # first `limit` vertices, or an explicit sorted list of indices
+    with timer.stage('plan'):
+        plans = {}
+        path_keys = None
+        for output_path, resolution in outputs.items():
+            if sampling == 'voxel' and (voxel_size is not None or resolution < 1) and available > 0:
+                vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+                if survivors is not None:
+                    vertices = vertices[survivors]
+                indices, overrides = voxel_sample(vertices, voxel_size, int(source_count * resolution),
+                                                  voxel_centroid)
+                del vertices
+                if survivors is not None:
+                    indices = survivors[indices]
+                plans[output_path] = _indices_plan(indices, overrides)
+            elif sampling == 'path' and resolution < 1 and available > 0:
+                if path_keys is None:
+                    # One key per vertex for all outputs, so the outputs nest
+                    vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+                    path_keys = path_sample_keys(vertices, path_points, path_transform, path_falloff, survivors)
+                    del vertices
+                indices = select_smallest(path_keys, int(len(path_keys) * resolution))
+                plans[output_path] = _indices_plan(indices if survivors is None else survivors[indices])
+            elif survivors is not None:
+                plan = stride_plan(source_count, resolution)
+                plans[output_path] = _indices_plan(survivors[stride_indices(plan, 0, plan['count'])])
+            else:
+                plans[output_path] = stride_plan(vertex_count, resolution)
+
+        # Layout of the written records after projection and quantization
+        output_dtype = project_dtype(dtype, keep) if keep else dtype
+        quantization = None
+        if quantize_bits:
+            vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,)) \
+                if available > 0 else np.empty(0, dtype=dtype)
+            quantization = make_quantization(vertices, output_dtype, quantize_bits, survivors)
+            output_dtype = quantization['dtype']
+            del vertices
+        filters = make_filter(output_dtype, byte_filter) if byte_filter else None
+        comments = (quantization['comments'] if quantization else []) + (filters['comments'] if filters else [])
+
+    # Only the vertices up to the last one kept by any output are needed
+    limit = min(available, max(plan['limit'] for plan in plans.values()))
+    if morton_order:
+        bytes_total = sum(min(plan['count'], available) for plan in plans.values()) * dtype.itemsize
+    else:
+        bytes_total = limit * dtype.itemsize
+    bytes_done = 0
+    output_points = dict.fromkeys(outputs, 0)
+    bytes_written = dict.fromkeys(outputs, 0)
+
+    with contextlib.ExitStack() as stack:
+        output_files = {}
+        for output_path, plan in plans.items():
+            if isinstance(output_path, (str, os.PathLike)):
+                output_f = stack.enter_context(open(output_path, 'wb'))
+            else:
+                output_f = output_path
+            # Only the vertex element is carried over to the output
+            if output_dtype != dtype:
+                header_bytes = format_header(header, {'vertex': plan['count']}, output_dtype, comments)
+            else:
+                header_bytes = format_header(header, {'vertex': plan['count']}, comments=comments)
+            with output_timers[output_path].stage('write', bytes_out=len(header_bytes)):
+                output_f.write(header_bytes)
+            if filters:
+                # Entered after the file, so the last block is written before the file closes
+                output_f = stack.enter_context(ShuffleWriter(output_f, output_dtype, filters))
+            output_files[output_path] = output_f
+            bytes_written[output_path] += len(header_bytes)
+
+        if morton_order:
+            for output_path, plan in plans.items():
+                output_timer = output_timers[output_path]
+                blocks = _iter_morton_ordered(input_path, dtype, data_offset, available, plan)
+                for sampled in output_timer.iterate('read', blocks):
+                    output_timer.add('read', bytes_in=sampled.nbytes)
+                    bytes_done += sampled.nbytes
+                    with output_timer.stage('sample'):
+                        sampled = convert_vertices(sampled, keep, quantization)
+                    _write_sampled(output_files[output_path], sampled, output_timer)
+                    output_points[output_path] += len(sampled)
+                    bytes_written[output_path] += sampled.nbytes
+                    if progress:
+                        progress(bytes_done, bytes_total)
+            chunks = []
+        elif chunk_size:
+            input_f = stack.enter_context(open(input_path, 'rb'))
+            input_f.seek(data_offset)
+            chunks = iter_vertex_chunks(input_f, dtype, limit, chunk_size)
+        elif limit > 0:
+            mapped = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(limit,))
+            rows = max(1, DEFAULT_CHUNK_SIZE // dtype.itemsize) if progress else limit
+            chunks = [(start, mapped[start:start + rows]) for start in range(0, limit, rows)]
+        else:
+            chunks = []
+
+        # With a memory map the reads happen as page faults in the sample stage
+        for start, chunk in timer.iterate('read', chunks):
+            timer.add('read', bytes_in=chunk.nbytes)
+            for output_path, plan in plans.items():
+                with output_timers[output_path].stage('sample', bytes_in=chunk.nbytes):
+                    sampled = convert_vertices(_sample_chunk(plan, start, chunk), keep, quantization)
+                _write_sampled(output_files[output_path], sampled, output_timers[output_path])
+                output_points[output_path] += len(sampled)
+                bytes_written[output_path] += sampled.nbytes
+            bytes_done += chunk.nbytes
+            if progress:
+                progress(bytes_done, bytes_total)
+
+    elapsed = time.perf_counter() - start_time
+    bytes_read = limit * dtype.itemsize
+
+    return {
+        output_path: {
+            'input_points': vertex_count,
+            'output_points': output_points[output_path],
+            'bytes_read': bytes_read,
+            'bytes_written': bytes_written[output_path],
+            'seconds': elapsed,
+            'mb_per_s': bytes_read / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+            'stages': {**timer.stages, **output_timers[output_path].stages},
+            'removed': removed,
+        }
+        for output_path in outputs
+    }
+
+
+def _write_sampled(output_f, sampled, timer):
+    with timer.stage('write', bytes_in=sampled.nbytes, bytes_out=sampled.nbytes):
+        output_f.write(sampled.view(np.uint8))
+
+
+def _sample_chunk(plan, start, chunk):
+    """
+    Select the vertices of one chunk that an output plan keeps.
+    """
+    if 'indices' not in plan:
+        kept, every = plan['ratio']
+        if kept > 1:
+            return chunk[_plan_indices(plan, start, start + len(chunk)) - start]
+        # Keep the global stride across chunk boundaries
+        return np.ascontiguousarray(chunk[(-start) % every:max(0, plan['limit'] - start):every])
+
+    lo, hi = np.searchsorted(plan['indices'], [start, start + len(chunk)])
+    sampled = chunk[plan['indices'][lo:hi] - start]
+    for name, values in plan['overrides'].items():
+        sampled[name] = values[lo:hi]
+    return sampled
+
+
+def _indices_plan(indices, overrides=None):
+    """
+    Output plan keeping an explicit sorted list of input vertices.
+    """
+    return {'indices': indices, 'overrides': overrides or {}, 'count': len(indices),
+            'limit': int(indices[-1]) + 1 if len(indices) else 0}
+
+
+def _plan_indices(plan, start, stop):
+    """
+    Input indices in [start, stop) of the vertices a stride plan keeps.
+    """
+    kept, every = plan['ratio']
+    stop = min(stop, plan['limit'])
+    first = -(-start * kept // every)
+    return stride_indices(plan, first, max(first, -(-stop * kept // every)))
+
+
+def project_dtype(dtype, keep):
+    """
+    Packed dtype holding only the properties named in keep, in that order.
+    """
+    missing = [name for name in keep if name not in dtype.names]
+    if missing:
+        raise ValueError(f"Unknown vertex properties: {', '.join(missing)}")
+    return np.dtype([(name, dtype.fields[name][0]) for name in keep])
+
+
+def convert_vertices(vertices, keep, quantization):
+    """
+    Apply the projection and quantization of an output to sampled vertices.
+    """
+    if keep:
+        # Multi-field indexing is a strided view; repacking copies it column by column
+        vertices = repack_fields(vertices[list(keep)])
+    if quantization:
+        vertices = quantize_vertices(vertices, quantization)
+    return vertices
+
+
+def _iter_morton_ordered(input_path, dtype, data_offset, available, plan):
+    """
+    Yield the vertices kept by an output plan in Morton order, in blocks.
+    """
+    if 'indices' in plan:
+        indices = plan['indices']
+    else:
+        indices = _plan_indices(plan, 0, available)
+    if len(indices) == 0:
+        return
+
+    vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,))
+    order = np.argsort(morton_codes(vertices[indices]), kind='stable')
+
+    for start in range(0, len(order), REORDER_CHUNK_ROWS):
+        rows = order[start:start + REORDER_CHUNK_ROWS]
+        sampled = vertices[indices[rows]]
+        for name, values in plan.get('overrides', {}).items():
+            sampled[name] = values[rows]
+        yield sampled
+
+
+def progressive_order(vertices, seed=0):
+    """
+    Permutation of the vertices such that every prefix is a well-distributed
+    subsample. Each vertex gets a random priority and is assigned to the
+    coarsest octree level at which it has the lowest priority in its cell;
+    sorting by (level, priority) then puts exactly one vertex per occupied
+    level-L cell before any vertex of level L + 1, and shuffles the vertices
+    within a level. Runs in O(n log n).
+    """
+    codes = morton_codes(vertices)
+    order = np.argsort(codes)
+    codes = codes[order]
+    priority = np.random.default_rng(seed).permutation(len(order))[order]
+
+    levels = np.full(len(order), MORTON_BITS + 1, dtype=np.int8)
+    for level in range(MORTON_BITS + 1):
+        keys = codes >> np.uint64(3 * (MORTON_BITS - level))
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        counts = np.diff(np.r_[starts, len(keys)])
+        cell_min = np.minimum.reduceat(priority, starts)
+        first = (priority == np.repeat(cell_min, counts)) & (levels > level)
+        levels[first] = level
+        if len(starts) == len(keys):
+            break
+
+    return order[np.lexsort((priority, levels))]
+
+
+def write_progressive_ply(input_path, output_path, levels, index_path=None, seed=0):
+    """
+    Write all vertices of a PLY file in progressive order, together with a
+    sidecar index (default: the output path with '.lod.json' in place of its
+    extension). levels maps quality names to resolutions; the index gives
+    each level's vertex count and the byte offset where its prefix ends, so
+    one file serves every level through HTTP range requests.
+    Returns the index as a dict.
+    """
+    header, dtype, data_offset, available = map_vertices(input_path)
+    vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,)) \
+        if available > 0 else np.empty(0, dtype=dtype)
+
+    permutation = progressive_order(vertices, seed) if available > 0 else np.empty(0, dtype=np.int64)
+    header_bytes = format_header(header, {'vertex': available})
+
+    with open(output_path, 'wb') as output_f:
+        output_f.write(header_bytes)
+        for start in range(0, available, REORDER_CHUNK_ROWS):
+            output_f.write(vertices[permutation[start:start + REORDER_CHUNK_ROWS]].view(np.uint8))
+
+    index = {
+        'version': 1,
+        'vertex_count': int(available),
+        'header_bytes': len(header_bytes),
+        'vertex_bytes': dtype.itemsize,
+        'levels': {},
+    }
+    for quality, resolution in levels.items():
+        count = min(available, int(available * resolution))
+        index['levels'][quality] = {
+            'vertex_count': count,
+            'byte_offset': len(header_bytes) + count * dtype.itemsize,
+        }
+
+    if index_path is None:
+        index_path = os.path.splitext(output_path)[0] + '.lod.json'
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+
+    return index
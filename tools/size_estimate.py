@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Output Size Estimation
+Predicts how large a shrunk output will be, raw and gzip-compressed, without
+building it. A few evenly spaced blocks of the vertices the output would keep
+are gathered through the memory map, converted exactly as the engine writes
+them (projection, quantization, Morton order and byte filter within each
+block) and deflated with the settings of the gzip writer. The compression
+ratio of the sample is then applied to the full output, so the cost depends
+on the sample size rather than on the input size: a few milliseconds per
+output, even for multi-GB scans.
+
+Voxel and path sampling are estimated as stride sampling of the same number
+of points, Morton order as a Z-order sort of each sampled block and a byte
+filter as one filter block holding the whole sample, so these estimates are
+approximate; plain stride estimates are usually within a few percent.
+fit_resolution() searches for the resolution whose estimated output fits a
+byte budget, and interpolate_estimate() derives the size at any other point
+count from a few estimated levels without touching the file.
+"""
+
+import math
+import zlib
+
+import numpy as np
+
+from plyio import map_vertices, format_header
+from morton import morton_codes
+from quantize import make_quantization
+from byte_filter import make_filter, shuffle_block
+from shrink_engine import stride_plan, stride_indices, project_dtype, convert_vertices
+
+# Evenly spaced blocks of consecutive output vertices compressed per estimate;
+# many small blocks follow changes along the scan better than a few large ones
+ESTIMATE_BLOCKS = 16
+ESTIMATE_BLOCK_POINTS = 512
+
+# Compression level of the shipped .ply.gz outputs (the ParallelGzipWriter default)
+GZIP_LEVEL = 9
+# Bytes of gzip header and trailer around the deflate stream
+GZIP_OVERHEAD = 18
+
+# Halvings of the log-resolution interval searched by fit_resolution
+FIT_ITERATIONS = 16
+
+
+def estimate_output_size(input_path, resolution, header=None, **options):
+    """
+    Estimate the output of shrink_ply_file_multi for one resolution. Takes
+    the options of estimate_levels. Returns a dict with 'output_points',
+    'raw_bytes' and 'gzip_bytes'.
+    """
+    return estimate_levels(input_path, {'output': resolution}, header, **options)['output']
+
+
+def estimate_levels(input_path, levels, header=None, chunk_size=None, sampling='stride', voxel_size=None,
+                    voxel_centroid=False, morton_order=False, quantize_bits=None, keep=None, byte_filter=None,
+                    remove_duplicates=None, remove_outliers=None, outlier_neighbors=None, path_points=None,
+                    path_transform=None, path_falloff=None, blocks=ESTIMATE_BLOCKS, block_points=ESTIMATE_BLOCK_POINTS):
+    """
+    Estimate the outputs of shrink_ply_file_multi for several resolutions.
+    levels maps output names to resolutions; the other options are those of
+    shrink_ply_file_multi (chunk_size and the voxel and path settings do not
+    change the estimate, and cleaning is not estimated, so with cleaning options
+    the estimates are upper bounds), and header is an optional already
+    parsed header.
+    Returns a dict per output name with 'output_points', 'raw_bytes' and
+    'gzip_bytes'.
+    """
+    header, dtype, data_offset, available = map_vertices(input_path, header)
+    vertices = np.memmap(input_path, dtype=dtype, mode='r', offset=data_offset, shape=(available,)) \
+        if available > 0 else np.empty(0, dtype=dtype)
+    projected_dtype = project_dtype(dtype, keep) if keep else dtype
+
+    estimates = {}
+    for name, resolution in levels.items():
+        plan = stride_plan(header.vertex_count, resolution)
+        kept, every = plan['ratio']
+        # A truncated file only provides the kept vertices that are present
+        count = min(plan['count'], -(-available * kept // every))
+        samples = [vertices[stride_indices(plan, first, last)]
+                   for first, last in _sample_ranges(count, blocks, block_points)]
+
+        # The bounding box of the sample stands in for that of the whole input
+        output_dtype = projected_dtype
+        quantization = None
+        if quantize_bits:
+            quantization = make_quantization(np.concatenate(samples) if samples else np.empty(0, dtype=dtype),
+                                             output_dtype, quantize_bits)
+            output_dtype = quantization['dtype']
+        filters = make_filter(output_dtype, byte_filter) if byte_filter else None
+        comments = (quantization['comments'] if quantization else []) + (filters['comments'] if filters else [])
+
+        if output_dtype != dtype:
+            header_bytes = len(format_header(header, {'vertex': count}, output_dtype, comments))
+        else:
+            header_bytes = len(format_header(header, {'vertex': count}, comments=comments))
+
+        converted = []
+        for sample in samples:
+            if morton_order:
+                sample = sample[np.argsort(morton_codes(sample), kind='stable')]
+            converted.append(convert_vertices(sample, keep, quantization))
+        if filters and converted:
+            # Byte planes as short as one sampled block compress far worse than
+            # those of a full filter block, so the sample is filtered as one block
+            chunks = [shuffle_block(np.concatenate(converted), filters['delta_fields'])]
+        else:
+            chunks = [sample.tobytes() for sample in converted]
+
+        raw_sample = 0
+        gzip_sample = 0
+        for data in chunks:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            raw_sample += len(data)
+            gzip_sample += len(compressor.compress(data) + compressor.flush())
+
+        vertex_bytes = count * output_dtype.itemsize
+        ratio = gzip_sample / raw_sample if raw_sample else 1.0
+        estimates[name] = {
+            'output_points': count,
+            'raw_bytes': header_bytes + vertex_bytes,
+            'gzip_bytes': GZIP_OVERHEAD + header_bytes + int(round(vertex_bytes * ratio)),
+        }
+    return estimates
+
+
+def interpolate_estimate(estimates, output_points):
+    """
+    Estimate an output of output_points points from the estimates of other
+    outputs of the same file and options, without reading the file. Raw and
+    gzip bytes per point are interpolated in log(points) between the two
+    nearest estimates, and held at the nearest one outside their range.
+    """
+    known = sorted((estimate for estimate in estimates.values() if estimate['output_points'] > 0),
+                   key=lambda estimate: estimate['output_points'])
+    result = {'output_points': output_points, 'raw_bytes': 0, 'gzip_bytes': 0}
+    if not known or output_points <= 0:
+        return result
+    log_points = np.log([estimate['output_points'] for estimate in known])
+    for key in ('raw_bytes', 'gzip_bytes'):
+        per_point = np.interp(np.log(output_points), log_points,
+                              [estimate[key] / estimate['output_points'] for estimate in known])
+        result[key] = int(round(per_point * output_points))
+    return result
+
+
+def download_seconds(size_bytes, mbit_per_s):
+    """
+    Time to download size_bytes over a connection of the given speed.
+    """
+    return size_bytes * 8 / (mbit_per_s * 1000 * 1000)
+
+
+def _sample_ranges(count, blocks, block_points):
+    """
+    Ranges of output vertices to sample: all of them if they fit in the
+    sample, otherwise evenly spaced blocks of consecutive vertices.
+    """
+    if count <= blocks * block_points:
+        return [(0, count)] if count else []
+    starts = np.linspace(0, count - block_points, blocks).astype(np.int64)
+    return [(int(start), int(start) + block_points) for start in starts]
+
+
+def fit_resolution(input_path, target_bytes, compressed=True, iterations=FIT_ITERATIONS, header=None,
+                   **options):
+    """
+    Find the largest resolution whose estimated output is no larger than
+    target_bytes, measured as gzip bytes or, with compressed=False, raw
+    bytes. options are the shrink options passed to estimate_output_size.
+    The search bisects log(resolution), since budgets of different levels
+    span orders of magnitude. Returns the resolution and its estimate.
+    """
+    size_key = 'gzip_bytes' if compressed else 'raw_bytes'
+    if header is None:
+        header = map_vertices(input_path)[0]
+
+    estimate = estimate_output_size(input_path, 1.0, header=header, **options)
+    if estimate[size_key] <= target_bytes or header.vertex_count <= 1:
+        return 1.0, estimate
+
+    # The smallest useful resolution keeps a single vertex
+    low = 1 / header.vertex_count
+    low_estimate = estimate_output_size(input_path, low, header=header, **options)
+    if low_estimate[size_key] > target_bytes:
+        return low, low_estimate
+
+    high = 1.0
+    for _ in range(iterations):
+        middle = math.sqrt(low * high)
+        estimate = estimate_output_size(input_path, middle, header=header, **options)
+        if estimate[size_key] <= target_bytes:
+            low, low_estimate = middle, estimate
+        else:
+            high = middle
+    return low, low_estimate
@@ -0,0 +1,74 @@
+"""
+The tiled outlier search must find the same neighbours as one tree over the
+whole cloud, and no tile's halo may grow past OUTLIER_HALO_ROWS however its
+tile sits in the octree.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cleaning
+
+pytest.importorskip('scipy')
+
+POSITION_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+
+
+def scan_cloud(count, seed=0):
+    """
+    Points on the walls, floor and ceiling of a 10 x 8 x 3 room, a dense
+    scan of one corner, and a few points floating in the room.
+    """
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 1, (count, 3)) * (10, 8, 3)
+    # Flatten most points onto one of the six faces of the room
+    faces = rng.integers(0, 7, count)
+    for axis, extent in enumerate((10, 8, 3)):
+        points[faces == 2 * axis, axis] = 0
+        points[faces == 2 * axis + 1, axis] = extent
+    corner = rng.integers(0, count, count // 5)
+    points[corner] = rng.normal(0, 0.05, (len(corner), 3)) + (0.5, 0.5, 0.5)
+    vertices = np.empty(count, dtype=POSITION_DTYPE)
+    for axis, name in enumerate('xyz'):
+        vertices[name] = points[:, axis]
+    return vertices
+
+
+def reference_distances(vertices, neighbors):
+    positions = np.column_stack([vertices[axis].astype(np.float64) for axis in 'xyz'])
+    distances, _ = cleaning.cKDTree(positions).query(positions, k=neighbors + 1)
+    return distances[:, 1:].mean(axis=1)
+
+
+@pytest.mark.parametrize('tile_rows', [20000, 3000, 500])
+def test_tiled_search_is_exact_with_bounded_halos(monkeypatch, tile_rows):
+    vertices = scan_cloud(40000)
+    monkeypatch.setattr(cleaning, 'OUTLIER_TILE_ROWS', tile_rows)
+    monkeypatch.setattr(cleaning, 'OUTLIER_HALO_ROWS', 2 * tile_rows)
+    monkeypatch.setattr(cleaning, 'OUTLIER_SAMPLE_ROWS', 256)
+
+    tree_sizes = []
+    build_tree = cleaning._tree
+
+    def recording_tree(points):
+        tree_sizes.append(len(points))
+        return build_tree(points)
+
+    monkeypatch.setattr(cleaning, '_tree', recording_tree)
+    positions = np.column_stack([vertices[axis].astype(np.float64) for axis in 'xyz'])
+    origin, size = cleaning.bounding_cube(vertices)
+    codes = cleaning.morton_codes(vertices, origin, size)
+    order = np.argsort(codes)
+    distances = np.empty(len(vertices))
+    distances[order] = cleaning._mean_neighbor_distances(positions[order], codes[order], origin, size,
+                                                         cleaning.DEFAULT_OUTLIER_NEIGHBORS)
+
+    assert max(tree_sizes) <= 2 * tile_rows
+    np.testing.assert_allclose(distances, reference_distances(vertices, cleaning.DEFAULT_OUTLIER_NEIGHBORS))
+    expected = distances > distances.mean() + cleaning.DEFAULT_OUTLIER_STD_RATIO * distances.std()
+    np.testing.assert_array_equal(cleaning.outlier_mask(vertices), expected)
@@ -0,0 +1,50 @@
+"""
+PointCloudCollector must keep the same vertices whether the shrink engine
+streams the source in chunks through a reused buffer or maps it whole.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from draco_encode import PointCloudCollector
+from shrink_engine import shrink_ply_file_multi
+
+VERTEX_DTYPE = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+                         ('red', 'u1'), ('green', 'u1'), ('blue', 'u1')])
+
+
+def write_ply(path, vertices):
+    properties = ''.join(f"property {'float' if vertices.dtype[name].kind == 'f' else 'uchar'} {name}\n"
+                         for name in vertices.dtype.names)
+    header = f"ply\nformat binary_little_endian 1.0\nelement vertex {len(vertices)}\n{properties}end_header\n"
+    with open(path, 'wb') as f:
+        f.write(header.encode('ascii'))
+        f.write(vertices.tobytes())
+
+
+def collect(path, resolution, chunk_size):
+    collector = PointCloudCollector(VERTEX_DTYPE)
+    shrink_ply_file_multi(str(path), {collector: resolution}, chunk_size)
+    return collector.vertices()
+
+
+@pytest.mark.parametrize('resolution', [1.0, 0.5, 0.3])
+def test_chunked_collection_matches_memory_map(tmp_path, resolution):
+    rng = np.random.default_rng(0)
+    vertices = np.empty(50000, dtype=VERTEX_DTYPE)
+    for name in VERTEX_DTYPE.names:
+        vertices[name] = rng.integers(0, 250, len(vertices))
+    path = tmp_path / 'scan.ply'
+    write_ply(path, vertices)
+
+    mapped = collect(path, resolution, None)
+    chunked = collect(path, resolution, 64 * 1024)
+    assert len(mapped) == int(len(vertices) * resolution)
+    assert np.array_equal(chunked, mapped)
+    if resolution == 1.0:
+        assert np.array_equal(mapped, vertices)